@@ -0,0 +1,50 @@
+"""
+DataParallel 分块传输吞吐测试: items/s vs chunk_size
+
+python benchmark/bench_chunk.py --num 200000 --work_num 2
+"""
+
+import argparse
+import time
+
+from flowdata import DataParallel
+
+
+def process_fn(item, *args, **kwargs):
+    item["r"] = item["id"] + 1
+    return item
+
+
+def bench(num: int, work_num: int, chunk_size: int, dummy: bool) -> float:
+    item_iter_fn = lambda: ({"id": i} for i in range(num))
+    start = time.time()
+    with DataParallel(
+        item_iter_fn=item_iter_fn,
+        work_num=work_num,
+        process_fn=process_fn,
+        dummy=dummy,
+        chunk_size=chunk_size,
+    ) as data_iter:
+        count = sum(1 for _ in data_iter)
+    assert count == num
+    return num / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num", type=int, default=100000)
+    parser.add_argument("--work_num", type=int, default=2)
+    parser.add_argument("--dummy", action="store_true")
+    parser.add_argument(
+        "--chunk_sizes", type=int, nargs="+", default=[1, 4, 16, 64, 256, 1024]
+    )
+    args = parser.parse_args()
+
+    print(f"{'chunk_size':>10} {'items/s':>12}")
+    for chunk_size in args.chunk_sizes:
+        tps = bench(args.num, args.work_num, chunk_size, args.dummy)
+        print(f"{chunk_size:>10} {tps:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+jsonl读写吞吐测试: 原实现(逐行json.loads/json.dumps) vs JsonlTool各codec, MB/s
+
+python benchmark/bench_jsonl.py --num 200000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from flowdata import JsonlTool
+from flowdata.codec import CODEC_NAMES, get_codec
+
+
+def make_item(i: int) -> dict:
+    return {
+        "id": i,
+        "title": f"标题{i}",
+        "text": "流式数据处理 stream processing " * 8,
+        "score": i * 0.5,
+        "tags": ["a", "b", "c"],
+        "meta": {"source": "bench", "valid": i % 2 == 0},
+    }
+
+
+def legacy_read(file_path):
+    with open(file_path, "r", encoding="utf8") as in_f:
+        for line in in_f:
+            try:
+                item = json.loads(line)
+            except:
+                item = line.strip()
+            yield item
+
+
+def legacy_write(item_iter, file_path):
+    with open(file_path, "w", encoding="utf8", buffering=4096) as out_f:
+        for item in item_iter:
+            out_f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+def timeit(fn) -> float:
+    start = time.time()
+    fn()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num", type=int, default=200000)
+    args = parser.parse_args()
+
+    items = [make_item(i) for i in range(args.num)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "bench.jsonl")
+        legacy_write(items, file_path)
+        mb = os.path.getsize(file_path) / (1 << 20)
+        print(f"{args.num} items, {mb:.1f} MB")
+        print(f"{'impl':>10} {'read MB/s':>12} {'write MB/s':>12}")
+
+        read = timeit(lambda: sum(1 for _ in legacy_read(file_path)))
+        write = timeit(lambda: legacy_write(items, file_path))
+        print(f"{'legacy':>10} {mb / read:>12.1f} {mb / write:>12.1f}")
+
+        for codec_name in CODEC_NAMES:
+            try:
+                get_codec(codec_name)
+            except ImportError:
+                print(f"{codec_name:>10} {'未安装':>12}")
+                continue
+            JsonlTool.codec_name = codec_name
+            write = timeit(lambda: JsonlTool.write(items, file_path))
+            read = timeit(lambda: sum(1 for _ in JsonlTool.read_iter(file_path)))
+            mb = os.path.getsize(file_path) / (1 << 20)  # 各codec的输出格式略有差异
+            print(f"{codec_name:>10} {mb / read:>12.1f} {mb / write:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
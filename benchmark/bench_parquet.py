@@ -0,0 +1,92 @@
+"""
+parquet vs jsonl 读写测试: 相同数据的文件大小、全量读取、列裁剪读取、写入耗时及读取峰值内存
+
+python benchmark/bench_parquet.py --num 200000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from flowdata import JsonlTool, ParquetTool
+
+
+def make_item(i: int) -> dict:
+    return {
+        "id": i,
+        "title": f"标题{i}",
+        "text": "流式数据处理 stream processing " * 8,
+        "score": i * 0.5,
+        "label": i % 10,
+    }
+
+
+def timeit(fn) -> float:
+    start = time.time()
+    fn()
+    return time.time() - start
+
+
+def peak_memory(fn) -> float:
+    """python堆峰值内存(MB)，tracemalloc会拖慢执行，与耗时分开测量"""
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] / (1 << 20)
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num", type=int, default=200000)
+    parser.add_argument("--row_group_size", type=int, default=65536)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jsonl_path = os.path.join(tmp_dir, "bench.jsonl")
+        parquet_path = os.path.join(tmp_dir, "bench.parquet")
+        cases = {
+            "jsonl": (
+                lambda: JsonlTool.write(
+                    (make_item(i) for i in range(args.num)), jsonl_path
+                ),
+                lambda: sum(1 for _ in JsonlTool.read_iter(jsonl_path)),
+                lambda: sum(item["label"] for item in JsonlTool.read_iter(jsonl_path)),
+                jsonl_path,
+            ),
+            "parquet": (
+                lambda: ParquetTool.write(
+                    (make_item(i) for i in range(args.num)),
+                    parquet_path,
+                    row_group_size=args.row_group_size,
+                ),
+                lambda: sum(1 for _ in ParquetTool.read_iter(parquet_path)),
+                lambda: sum(
+                    item["label"]
+                    for item in ParquetTool.read_iter(parquet_path, columns=["label"])
+                ),
+                parquet_path,
+            ),
+        }
+
+        print(f"{args.num} items")
+        print(
+            f"{'format':>8} {'size MB':>8} {'write s':>8} {'read s':>8} "
+            f"{'read MB':>8} {'1 col s':>8}"
+        )
+        for name, (write, read, read_column, file_path) in cases.items():
+            write_seconds = timeit(write)
+            read_seconds = timeit(read)
+            column_seconds = timeit(read_column)
+            read_peak = peak_memory(read)
+            size = os.path.getsize(file_path) / (1 << 20)
+            print(
+                f"{name:>8} {size:>8.1f} {write_seconds:>8.2f} {read_seconds:>8.2f} "
+                f"{read_peak:>8.1f} {column_seconds:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+常驻进程池测试: 多次调用main()处理小批量数据时，冷启动与预热后的单次耗时对比
+
+python benchmark/bench_pool.py --runs 20 --num 50
+"""
+
+import argparse
+import time
+
+from flowdata import FlowBase, add_task
+
+
+class PoolFlow(FlowBase):
+    def __init__(self, num: int):
+        super().__init__(verbose=False)
+        self.num = num
+
+    @add_task(work_num=2)
+    def stage_1(self, item: dict, *args, **kwargs) -> dict:
+        item["r"] = item["id"] + 1
+        return item
+
+    @add_task(work_num=2)
+    def stage_2(self, item: dict, *args, **kwargs) -> dict:
+        item["r"] += 1
+        return item
+
+    def get_data(self):
+        for i in range(self.num):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        for _ in item_iter:
+            pass
+
+
+def bench(flow: FlowBase, runs: int) -> float:
+    start = time.time()
+    for _ in range(runs):
+        flow.main()
+    return (time.time() - start) / runs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--num", type=int, default=50)
+    args = parser.parse_args()
+
+    cold = bench(PoolFlow(args.num), args.runs)
+
+    flow = PoolFlow(args.num)
+    start = time.time()
+    flow.warm()
+    warm_up = time.time() - start
+    warm = bench(flow, args.runs)
+    flow.close()
+
+    print(f"{'cold main()':>16}: {cold * 1000:.2f} ms/run")
+    print(f"{'warm()':>16}: {warm_up * 1000:.2f} ms (一次性)")
+    print(f"{'warm main()':>16}: {warm * 1000:.2f} ms/run")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+大payload传输吞吐测试: pickle直接经queue传输 vs 共享内存传输, MB/s
+
+python benchmark/bench_shm.py --total_mb 256
+"""
+
+import argparse
+import time
+
+from flowdata import DataParallel
+
+SIZES = [1 << 10, 16 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20, 64 << 20]
+
+
+def process_fn(item, *args, **kwargs):
+    item["size"] = len(item["payload"])
+    return item
+
+
+def bench(size: int, num: int, shm_threshold: int) -> float:
+    payload = b"x" * size
+    item_iter_fn = lambda: ({"id": i, "payload": payload} for i in range(num))
+    start = time.time()
+    with DataParallel(
+        item_iter_fn=item_iter_fn,
+        work_num=2,
+        process_fn=process_fn,
+        shm_threshold=shm_threshold,
+    ) as data_iter:
+        count = sum(1 for _ in data_iter)
+    assert count == num
+    return size * num / (1 << 20) / (time.time() - start)
+
+
+def format_size(size: int) -> str:
+    return f"{size >> 20}MB" if size >= 1 << 20 else f"{size >> 10}KB"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--total_mb", type=int, default=256, help="每个payload大小传输的总数据量"
+    )
+    parser.add_argument("--shm_threshold", type=int, default=1 << 20)
+    args = parser.parse_args()
+
+    print(f"{'payload':>8} {'pickle MB/s':>12} {'shm MB/s':>12}")
+    for size in SIZES:
+        num = max(4, (args.total_mb << 20) // size)
+        pickle_mbs = bench(size, num, None)
+        shm_mbs = bench(size, num, args.shm_threshold)
+        print(f"{format_size(size):>8} {pickle_mbs:>12.1f} {shm_mbs:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
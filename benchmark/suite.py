@@ -0,0 +1,273 @@
+"""
+执行引擎基准测试: FlowBase(DataParallel)在进程/线程模式下的吞吐、单item延迟、峰值内存及启动耗时
+测试矩阵: 模式 x work_num x stage数量 x payload大小 x 任务类型(cpu/sleep) x keep_order
+work_num为1的task在主进程中直接执行，不经过DataParallel，不在测试矩阵中
+每个case在独立的子进程中运行，结果写入json，并与已保存的基线对比
+
+python benchmark/suite.py --out result.json --baseline benchmark/baseline.json
+python benchmark/suite.py --modes process --work_nums 4 --kinds cpu  # 只跑部分case
+python benchmark/suite.py --out benchmark/baseline.json --note "1核沙箱"  # 更新基线
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+CPU_LOOPS = 2000  # cpu任务每个item的循环次数，约0.1毫秒
+SLEEP_SECONDS = 0.001  # sleep任务每个item的等待时间
+# 影响吞吐的运行参数，与基线中同名case的参数一致时才能对比
+RUN_KEYS = (
+    "mode",
+    "work_num",
+    "stages",
+    "payload",
+    "kind",
+    "keep_order",
+    "num",
+    "cpu_loops",
+    "sleep_seconds",
+)
+
+
+def case_name(case: dict) -> str:
+    order = "order" if case["keep_order"] else "unordered"
+    return (
+        f"{case['mode']}-w{case['work_num']}-s{case['stages']}"
+        f"-p{case['payload']}-{case['kind']}-{order}"
+    )
+
+
+def make_stage(i: int, case: dict):
+    kind, cpu_loops, sleep_seconds = (
+        case["kind"],
+        case["cpu_loops"],
+        case["sleep_seconds"],
+    )
+
+    def stage(self, item: dict, *args, **kwargs) -> dict:
+        if kind == "cpu":
+            total = 0
+            for j in range(cpu_loops):
+                total += j * j
+            item[f"r{i}"] = total
+        else:
+            time.sleep(sleep_seconds)
+            item[f"r{i}"] = i
+        return item
+
+    stage.__name__ = f"bench_stage_{i}"
+    stage.__qualname__ = f"BenchFlow.{stage.__name__}"
+    return stage
+
+
+def make_flow(case: dict):
+    """按case动态生成FlowBase子类，每个stage一个不融合的task"""
+    from flowdata import FlowBase, add_task
+
+    dummy = case["mode"] == "thread"
+
+    def get_data(self):
+        payload = "x" * case["payload"]
+        for i in range(case["num"]):
+            yield {"id": i, "payload": payload, "t0": time.perf_counter()}
+
+    def save_data(self, item_iter):
+        for item in item_iter:
+            now = time.perf_counter()
+            if self.first_time is None:
+                self.first_time = now
+            self.latencies.append(now - item["t0"])
+
+    attrs = {"get_data": get_data, "save_data": save_data}
+    for i in range(case["stages"]):
+        stage = make_stage(i, case)
+        attrs[stage.__name__] = add_task(
+            work_num=case["work_num"], dummy=dummy, fuse=False
+        )(stage)
+    return type("BenchFlow", (FlowBase,), attrs)
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_case(case: dict) -> dict:
+    """在当前进程中运行单个case"""
+    flow = make_flow(case)(verbose=False, keep_order=case["keep_order"])
+    flow.latencies, flow.first_time = [], None
+
+    start = time.perf_counter()
+    flow.main()
+    seconds = time.perf_counter() - start
+
+    assert len(flow.latencies) == case["num"], len(flow.latencies)
+    # ru_maxrss单位为KB(linux)
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return {
+        "items_per_s": case["num"] / seconds,
+        "p50_ms": percentile(flow.latencies, 0.5) * 1000,
+        "p99_ms": percentile(flow.latencies, 0.99) * 1000,
+        "startup_s": flow.first_time - start,
+        "seconds": seconds,
+        "peak_rss_mb": self_rss,
+        "child_peak_rss_mb": child_rss,
+    }
+
+
+def spawn_case(case: dict, timeout: float) -> dict:
+    """在独立子进程中运行，避免task列表及内存统计互相影响"""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)],
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{case_name(case)} 执行失败:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def mismatches(results: dict, baseline: dict) -> list:
+    """同名case中运行参数与基线不一致的 (case, 参数, 本次, 基线)"""
+    return [
+        (name, key, result[key], baseline[name].get(key))
+        for name, result in results.items()
+        if name in baseline
+        for key in RUN_KEYS
+        if baseline[name].get(key) != result[key]
+    ]
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """与基线对比，返回吞吐下降或p99延迟上升超过threshold的case"""
+    regressions = []
+    print(f"\n{'case':<44} {'items/s':>10} {'base':>10} {'ratio':>7} {'p99 ratio':>9}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = result["items_per_s"] / base["items_per_s"]
+        p99_ratio = result["p99_ms"] / max(base["p99_ms"], 1e-6)
+        flag = ""
+        # 延迟较小时波动比例大，p99同时上升超过1毫秒才算下降
+        slower = p99_ratio > 1 + threshold and result["p99_ms"] - base["p99_ms"] > 1
+        if ratio < 1 - threshold or slower:
+            flag = " !"
+            regressions.append(name)
+        print(
+            f"{name:<44} {result['items_per_s']:>10.1f} {base['items_per_s']:>10.1f} "
+            f"{ratio:>7.2f} {p99_ratio:>9.2f}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--case", help="内部使用: 在当前进程中运行单个case")
+    parser.add_argument("--num", type=int, default=2000)
+    parser.add_argument("--modes", nargs="+", default=["process", "thread"])
+    parser.add_argument("--work_nums", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--stages", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--payloads", type=int, nargs="+", default=[64, 65536])
+    parser.add_argument("--kinds", nargs="+", default=["cpu", "sleep"])
+    parser.add_argument("--keep_order", nargs="+", default=["off", "on"])
+    parser.add_argument("--out", default="benchmark_result.json")
+    parser.add_argument("--baseline", help="基线json路径，与之对比")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="允许的性能下降比例"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=600, help="单个case的超时时间(秒)"
+    )
+    parser.add_argument("--note", default="", help="记录到结果中的运行环境说明")
+    args = parser.parse_args()
+    if min(args.work_nums) < 2:
+        parser.error(
+            "work_num为1时task在主进程中执行，不经过DataParallel，work_nums需不小于2"
+        )
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    cases = [
+        {
+            "mode": mode,
+            "work_num": work_num,
+            "stages": stages,
+            "payload": payload,
+            "kind": kind,
+            "keep_order": keep_order == "on",
+            "num": args.num,
+            "cpu_loops": CPU_LOOPS,
+            "sleep_seconds": SLEEP_SECONDS,
+        }
+        for mode, work_num, stages, payload, kind, keep_order in itertools.product(
+            args.modes,
+            args.work_nums,
+            args.stages,
+            args.payloads,
+            args.kinds,
+            args.keep_order,
+        )
+    ]
+
+    print(
+        f"{'case':<44} {'items/s':>10} {'p50 ms':>8} {'p99 ms':>8} "
+        f"{'startup s':>9} {'rss MB':>7} {'child MB':>8}"
+    )
+    results = {}
+    for case in cases:
+        name = case_name(case)
+        result = {**case, **spawn_case(case, args.timeout)}
+        results[name] = result
+        print(
+            f"{name:<44} {result['items_per_s']:>10.1f} {result['p50_ms']:>8.2f} "
+            f"{result['p99_ms']:>8.2f} {result['startup_s']:>9.3f} "
+            f"{result['peak_rss_mb']:>7.1f} {result['child_peak_rss_mb']:>8.1f}"
+        )
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "num": args.num,
+            "note": args.note,
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        # 参数不同(如--num不同)时吞吐不可比，不输出对比结果
+        diffs = mismatches(results, baseline)
+        if diffs:
+            print(f"\n运行参数与基线 {args.baseline} 不一致，不能对比:")
+            for name, key, value, base_value in diffs:
+                print(f"{name:<44} {key}: {value} != 基线 {base_value}")
+            sys.exit(2)
+        if not set(results) & set(baseline):
+            print(f"\n基线 {args.baseline} 中没有本次运行的case")
+            sys.exit(2)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 个case性能下降超过 {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
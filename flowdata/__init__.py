@@ -1,4 +1,14 @@
-from ._io import ExcelTool, FileTool, JsonlTool, JsonTool
+from ._io import (
+    ExcelTool,
+    FileTool,
+    JsonlTool,
+    JsonTool,
+    ParquetTool,
+    ShardedReader,
+)
+from .broker import Broker
+from .cache import TaskCache
 from .data_flow import FlowBase
 from .data_parallel import DataParallel
+from .retry import RetryPolicy
 from .task import add_task, clear_task
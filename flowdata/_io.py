@@ -1,9 +1,145 @@
 import json
-from typing import List, Union
+import os
+from array import array
+from itertools import chain, islice
+from typing import List, NamedTuple, Union
 
-import pandas as pd
+import numpy as np
 
 from ._logger import logger
+from .codec import get_codec
+from .compress import BackgroundWriter, get_compression, open_file, read_blocks
+
+
+class LineIndex:
+    """稀疏行偏移索引，每step行记录一次行首字节偏移，可直接定位到第N行
+    索引缓存在 {file_path}.idx 中，文件大小或修改时间变化时重建
+    压缩文件无法定位，索引只用于记录行数
+    """
+
+    STEP = 1024
+    BLOCK_SIZE = 1 << 24
+
+    def __init__(self, offsets: array, line_num: int, step: int = STEP):
+        self.offsets = offsets  # 第 i*step 行的行首偏移
+        self.line_num = line_num
+        self.step = step
+
+    @staticmethod
+    def _stat(file_path) -> dict:
+        stat = os.stat(file_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    @classmethod
+    def build(cls, file_path, step: int = STEP) -> "LineIndex":
+        """扫描文件中的换行符建立索引"""
+        offsets, line_num, pos, last = array("Q", [0]), 0, 0, b"\n"
+        background = get_compression(file_path) is not None
+        with open_file(file_path, "rb") as f:
+            for block in read_blocks(f, cls.BLOCK_SIZE, background):
+                newlines = np.flatnonzero(np.frombuffer(block, np.uint8) == 10)
+                # 第k个换行符之后是第 line_num+k+1 行，记录行号为step整数倍的行首
+                first = -(line_num + 1) % step
+                offsets.extend((newlines[first::step] + pos + 1).tolist())
+                line_num += len(newlines)
+                pos += len(block)
+                last = block[-1:]
+        if last != b"\n":  # 最后一行没有换行符
+            line_num += 1
+        return cls(offsets, line_num, step)
+
+    @classmethod
+    def load(cls, file_path, step: int = STEP) -> "LineIndex":
+        """读取缓存的索引，不存在或已失效时重建"""
+        index_path = f"{file_path}.idx"
+        stat = cls._stat(file_path)
+        try:
+            with open(index_path, "rb") as f:
+                header = json.loads(f.readline())
+                key = {k: header.get(k) for k in ("size", "mtime_ns", "step")}
+                if key == {**stat, "step": step}:
+                    offsets = array("Q")
+                    offsets.frombytes(f.read())
+                    return cls(offsets, header["line_num"], step)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = cls.build(file_path, step)
+        header = {**stat, "step": step, "line_num": index.line_num}
+        try:
+            with open(f"{index_path}.tmp", "wb") as f:
+                f.write(json.dumps(header).encode("utf8") + b"\n")
+                f.write(index.offsets.tobytes())
+            os.replace(f"{index_path}.tmp", index_path)
+        except OSError as err:
+            logger.warning("行偏移索引写入失败 %s: %s", index_path, err)
+        return index
+
+    def seek(self, f, line_no: int):
+        """二进制文件对象定位到第line_no行行首"""
+        i = line_no // self.step
+        if i >= len(self.offsets):
+            f.seek(0, 2)
+            return
+        f.seek(self.offsets[i])
+        for _ in range(line_no - i * self.step):
+            f.readline()
+
+
+class Shard(NamedTuple):
+    """文件分片: file_path的第start行开始的line_num行，第start行对应全局行号global_start"""
+
+    file_path: str
+    start: int
+    line_num: int
+    global_start: int
+
+
+class ShardedReader:
+    """分片读取: 多个文件按全局行号拼接后切分为若干分片，每个分片可在独立进程中解析
+    分片边界通过行偏移索引定位，对齐到行首；分片内的item附带稳定的序号(全局行号 - offset)
+    解析时跳过的行(on_error为skip、dead_letter)返回空item，序号保持连续，保序时不会等待缺失的序号
+    """
+
+    def __init__(self, tool, shards: List[Shard], offset: int = 0, **kwargs):
+        """[summary]
+
+        Args:
+            tool ([FileTool]): [解析分片的读取类，如JsonlTool]
+            shards ([List[Shard]]): [分片列表]
+            offset ([int]): [起始全局行号，序号从0开始]
+            kwargs: [传给tool的读取参数，如on_error]
+        """
+        self.tool = tool
+        self.shards = shards
+        self.offset = offset
+        self.kwargs = kwargs
+
+    def __len__(self):
+        return len(self.shards)
+
+    def iter_shard(self, i: int):
+        """读取第i个分片，返回 (序号, item)，序号由item所在的行号得到，跳过的行item为None"""
+        shard = self.shards[i]
+        base = shard.global_start - shard.start - self.offset  # 文件内行号转为序号
+        items = self.tool._numbered(
+            shard.file_path, shard.start, shard.line_num, **self.kwargs
+        )
+        expected = shard.start
+        for line_no, item in items:
+            for skipped in range(expected, line_no):
+                yield base + skipped, None
+            expected = line_no + 1
+            yield base + line_no, item
+        for skipped in range(expected, shard.start + shard.line_num):
+            yield base + skipped, None
+
+    def __iter__(self):
+        """单进程按顺序读取全部分片"""
+        for i in range(len(self.shards)):
+            for _, item in self.iter_shard(i):
+                if item is not None:
+                    yield item
 
 
 class JsonTool:
@@ -29,53 +165,233 @@ class JsonTool:
 class FileTool:
     """基础File，如txt读写操作"""
 
+    BLOCK_SIZE = 1 << 20  # 按块读取的大小，压缩文件为解压后的大小
+    WRITE_BATCH = 1000  # 每次writelines写入的行数
+
     @classmethod
-    def _open(cls, file_path):
-        with open(file_path, "r", encoding="utf8") as in_f:
-            for line in in_f:
-                item = line.strip()  # 纯文本
-                yield item
+    def _read_lines(cls, f, background: bool = False):
+        """按块读取并批量切分行，返回不含换行符的bytes
+
+        Args:
+            f ([file]): [二进制文件对象]
+            background ([bool]): [是否在后台线程中读取，用于压缩文件]
+        """
+        rest = b""
+        for block in read_blocks(f, cls.BLOCK_SIZE, background):
+            lines = (rest + block).split(b"\n")
+            rest = lines.pop()
+            yield from lines
+        if rest:
+            yield rest
+
+    @classmethod
+    def _lines(cls, file_path, offset: int = 0, head_num: int = None):
+        """按行读取，offset大于0时通过行偏移索引直接定位，不解析跳过的行
+        .gz/.bz2/.zst 压缩文件在后台线程中流式解压，offset通过逐行跳过实现
+
+        Args:
+            file_path ([str]): [文件路径]
+            offset (int): [起始行号]
+            head_num (int): [读取行数，None读取全部]
+        """
+        if get_compression(file_path) is not None:
+            end = None if head_num is None else offset + head_num
+            with open_file(file_path, "rb") as f:
+                yield from islice(cls._read_lines(f, True), offset, end)
+            return
+
+        with open(file_path, "rb") as f:
+            if offset:
+                LineIndex.load(file_path).seek(f, offset)
+            yield from islice(cls._read_lines(f), head_num)
+
+    @classmethod
+    def _open(cls, file_path, offset: int = 0, head_num: int = None, **kwargs):
+        for line in cls._lines(file_path, offset, head_num):
+            item = line.decode("utf8").strip()  # 纯文本
+            yield item
+
+    @classmethod
+    def _numbered(cls, file_path, offset: int = 0, head_num: int = None, **kwargs):
+        """返回 (行号, item)，解析时跳过的行没有输出"""
+        yield from enumerate(cls._open(file_path, offset, head_num, **kwargs), offset)
 
     @classmethod
-    def read_iter(cls, file_path):
-        yield from cls._open(file_path)
+    def read_iter(cls, file_path, offset: int = 0, head_num: int = None, **kwargs):
+        """[summary]
+
+        Args:
+            file_path ([str]): [文件路径]
+            offset (int): [起始行号，通过行偏移索引直接定位]
+            head_num (int): [读取行数，None读取全部]
+        """
+        yield from cls._open(file_path, offset, head_num, **kwargs)
 
     @classmethod
-    def read_list(cls, file_path):
+    def read_list(cls, file_path, offset: int = 0, head_num: int = None, **kwargs):
         item_list = []
-        for item in cls._open(file_path):
+        for item in cls._open(file_path, offset, head_num, **kwargs):
             item_list.append(item)
 
         return item_list
 
     @classmethod
-    def write(cls, item_iter, file_path):
+    def _write_lines(
+        cls,
+        lines,
+        file_path,
+        mode: str = "w",
+        buffering: int = -1,
+        compresslevel: int = None,
+    ):
+        """bytes行按WRITE_BATCH分批writelines写入，压缩文件在后台线程中压缩"""
+        mode = mode.replace("b", "") + "b"
+        if get_compression(file_path) is not None:
+            with BackgroundWriter(open_file(file_path, mode, compresslevel)) as writer:
+                batch = []
+                for line in lines:
+                    batch.append(line)
+                    if len(batch) >= cls.WRITE_BATCH:
+                        writer.write(b"".join(batch))
+                        batch = []
+                writer.write(b"".join(batch))
+            return
+
+        with open(file_path, mode, buffering=buffering) as f:
+            batch = []
+            for line in lines:
+                batch.append(line)
+                if len(batch) >= cls.WRITE_BATCH:
+                    f.writelines(batch)
+                    batch = []
+            f.writelines(batch)
+
+    @classmethod
+    def line_num(cls, file_path) -> int:
+        """文件行数，使用行偏移索引"""
+        return LineIndex.load(file_path).line_num
+
+    @classmethod
+    def read_shards(
+        cls,
+        file_paths: Union[str, List[str]],
+        shard_num: int = None,
+        offset: int = 0,
+        head_num: int = None,
+        **kwargs,
+    ) -> ShardedReader:
+        """分片读取，配合FlowBase使用时每个分片在独立进程中解析
+
+        Args:
+            file_paths ([str, List[str]]): [文件路径或文件路径列表，按顺序拼接]
+            shard_num (int): [分片数量，默认为cpu核数]
+            offset (int): [起始全局行号]
+            head_num (int): [读取行数，None读取全部]
+            kwargs: [读取参数，同read_iter]
+        """
+        if isinstance(file_paths, str):
+            file_paths = [file_paths]
+        line_nums = [cls.line_num(file_path) for file_path in file_paths]
+        end = sum(line_nums)
+        if head_num is not None:
+            end = min(end, offset + head_num)
+        size = -(-max(end - offset, 0) // (shard_num or os.cpu_count() or 1))
+
+        shards, file_start = [], 0
+        for file_path, line_num in zip(file_paths, line_nums):
+            # 当前文件在 [offset, end) 范围内的部分按size切分，分片不跨文件
+            start = max(offset, file_start)
+            file_end = min(end, file_start + line_num)
+            while start < file_end:
+                num = min(size, file_end - start)
+                if get_compression(file_path) is not None:
+                    num = file_end - start  # 压缩文件无法定位，整个文件作为一个分片
+                shards.append(Shard(file_path, start - file_start, num, start))
+                start += num
+            file_start += line_num
+        return ShardedReader(cls, shards, offset, **kwargs)
+
+    @classmethod
+    def write(cls, item_iter, file_path, compresslevel: int = None):
         """写入
 
         Args:
             item_iter ([list or iter]): [description]
             file_path ([str]): [description]
+            compresslevel ([int]): [.gz/.bz2/.zst 文件的压缩等级，None使用默认值]
         """
-        with open(file_path, "w", encoding="utf8") as out_f:
-            for item in item_iter:
-                out_f.write(item + "\n")
+        lines = ((item + "\n").encode("utf8") for item in item_iter)
+        cls._write_lines(lines, file_path, compresslevel=compresslevel)
 
 
 class JsonlTool(FileTool):
-    """jsonl读写操作"""
+    """jsonl读写操作，已安装orjson或msgspec时使用其编解码"""
+
+    codec_name = None  # orjson/msgspec/json，None时自动选择
+    ON_ERRORS = ("text", "skip", "raise", "dead_letter")
 
     @classmethod
-    def _open(cls, file_path):
-        with open(file_path, "r", encoding="utf8") as in_f:
-            for line in in_f:
-                try:
-                    item = json.loads(line)
-                except:
-                    item = line.strip()  # 纯文本
-                yield item
+    def _open(cls, file_path, offset: int = 0, head_num: int = None, **kwargs):
+        for _, item in cls._numbered(file_path, offset, head_num, **kwargs):
+            yield item
+
+    @classmethod
+    def _numbered(
+        cls,
+        file_path,
+        offset: int = 0,
+        head_num: int = None,
+        on_error: str = "text",
+        dead_letter_path: str = None,
+    ):
+        """返回 (行号, item)，跳过的行没有输出
+
+        Args:
+            on_error (str): [无法解析的行的处理方式
+                text: 作为纯文本返回; skip: 跳过; raise: 抛出异常; dead_letter: 跳过并写入dead_letter_path]
+            dead_letter_path (str): [无法解析的行追加写入该文件，每行记录文件路径、行号及原始内容]
+        """
+        if on_error not in cls.ON_ERRORS:
+            raise ValueError(f"on_error必须为{cls.ON_ERRORS}之一: {on_error}")
+        if on_error == "dead_letter" and not dead_letter_path:
+            raise ValueError("on_error='dead_letter' 需要设置 dead_letter_path")
+
+        codec = get_codec(cls.codec_name)
+        loads, errors = codec.loads, codec.errors
+        error_num, dead_letters = 0, []
+        for line_no, line in enumerate(cls._lines(file_path, offset, head_num), offset):
+            try:
+                item = loads(line)
+            except errors as err:
+                error_num += 1
+                if on_error == "raise":
+                    raise ValueError(f"{file_path} 第{line_no}行解析失败: {err}")
+                if on_error == "dead_letter":
+                    text = line.decode("utf8", errors="replace")
+                    dead_letters.append(
+                        {"file_path": file_path, "line_no": line_no, "line": text}
+                    )
+                if on_error != "text":
+                    continue
+                item = line.decode("utf8").strip()  # 纯文本
+            yield line_no, item
+
+        if dead_letters:
+            cls.write(dead_letters, dead_letter_path, mode="a")
+        if error_num:
+            logger.warning(
+                "%s 解析失败 %s 行，处理方式: %s", file_path, error_num, on_error
+            )
 
     @classmethod
-    def write(cls, item_iter, file_path, mode: str = "w", buffering: int = 4096):
+    def write(
+        cls,
+        item_iter,
+        file_path,
+        mode: str = "w",
+        buffering: int = 4096,
+        compresslevel: int = None,
+    ):
         """jsonl写入
 
         Args:
@@ -83,47 +399,78 @@ class JsonlTool(FileTool):
             file_path ([str]): [description]
             mode([str]): 写入模式   a: 追加模式
             buffering([int]): 设置较小值可及时写入。 如果 buffering=0 或者 buffering=False，意味着关闭缓冲区（也就是关闭缓冲，直接写入磁盘）。
+                buffering不大于1时逐行写入，否则每WRITE_BATCH行批量写入。
+            compresslevel([int]): .gz/.bz2/.zst 文件按扩展名压缩，压缩等级None使用默认值
         """
-        with open(file_path, mode, encoding="utf8", buffering=buffering) as out_f:
-            for item in item_iter:
-                out_f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        dumps = get_codec(cls.codec_name).dumps
+        lines = (dumps(item) + b"\n" for item in item_iter)
+        if buffering <= 1 and get_compression(file_path) is None:
+            with open(file_path, mode + "b", buffering=0) as out_f:
+                for line in lines:
+                    out_f.write(line)
+            return
+        cls._write_lines(lines, file_path, mode, buffering, compresslevel)
 
 
 class ExcelTool:
-    """excel读写操作 不支持流式操作"""
+    """excel读写操作，流式读取及写入，内存占用不随行数增长"""
+
+    HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+
+    @staticmethod
+    def _columns(header: tuple) -> list:
+        """表头处理，与pandas.read_excel一致: 空表头为 Unnamed: i，重复表头添加 .n 后缀"""
+        columns, counter = [], {}
+        for i, name in enumerate(header):
+            name = f"Unnamed: {i}" if name is None else name
+            if name in counter:
+                counter[name] += 1
+                name = f"{name}.{counter[name]}"
+            else:
+                counter[name] = 0
+            columns.append(name)
+        return columns
 
     @classmethod
-    def read_list(
+    def read_iter(
         cls, file_path, sheet_name="Sheet1", todict=True, fillna: bool = True
     ):
-        df = pd.read_excel(file_path, sheet_name=sheet_name)
-        if fillna:
-            df = df.fillna("")
-        columns = list(df.columns)
-        logger.info(columns)
-
-        lines = []
-        for index, line in df.iterrows():
-            if todict:
-                line = cls().to_dict(line)
-            lines.append(line)
-        return lines
+        """流式读取，基于openpyxl只读模式逐行读取
 
-    def to_dict(self, item):
-        return {k: item[k] for k in item.keys()}
+        Args:
+            file_path ([str]): [文件路径]
+            sheet_name (str): [sheet名称]
+            todict (bool): [True返回dict，False返回值列表]
+            fillna (bool): [空单元格填充为""，否则为nan]
+        """
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook[sheet_name].iter_rows(values_only=True)
+            columns = cls._columns(next(rows, ()))
+            logger.info(columns)
+
+            empty = "" if fillna else float("nan")
+            for row in rows:
+                if all(value is None for value in row):  # 跳过空行
+                    continue
+                line = [empty if value is None else value for value in row]
+                line += [empty] * (len(columns) - len(line))
+                if todict:
+                    line = dict(zip(columns, line))
+                yield line
+        finally:
+            workbook.close()
 
     @classmethod
-    def _write(
-        cls, data: List[list], file_path, columns: list, sheet_name="Sheet1", width=10
+    def read_list(
+        cls, file_path, sheet_name="Sheet1", todict=True, fillna: bool = True
     ):
-        df = pd.DataFrame(data, columns=columns)
+        return list(cls.read_iter(file_path, sheet_name, todict, fillna))
 
-        # 设置列宽
-        with pd.ExcelWriter(file_path) as writer:
-            # with pd.ExcelWriter(file_path, engine='xlsxwriter', options={'strings_to_urls': False}) as writer: # 解决行数过多时url转化问题
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-            worksheet = writer.sheets[sheet_name]
-            [worksheet.set_column(i, i, width) for i, c in enumerate(columns)]
+    def to_dict(self, item):
+        return {k: item[k] for k in item.keys()}
 
     @classmethod
     def write(
@@ -133,27 +480,238 @@ class ExcelTool:
         columns=None,
         key_map: dict = None,
         width=10,
+        sheet_name="Sheet1",
     ):
-        """_summary_
+        """流式写入，基于xlsxwriter constant_memory模式逐行写入
 
         Args:
-            item_list (List[dict]): 输入数据流
+            item_list (List[dict]): 输入数据流，可以是迭代器
             file_path (_type_): 输出文件路径
-            columns (_type_, optional): 字段名. Defaults to None.
+            columns (_type_, optional): 字段名. Defaults to None，使用第一个item的key.
             key_map (dict, optional): 字段名映射. Defaults to None.
+            width (int, optional): 列宽. Defaults to 10.
+            sheet_name (str, optional): sheet名称. Defaults to "Sheet1".
         """
-        D = []
-        for item in item_list:
+        import xlsxwriter
 
-            if not columns:
-                columns = item.keys()
+        item_iter = iter(item_list)
+        first = next(item_iter, None)
+        if not columns:
+            if first is None:
+                return
+            columns = list(first.keys())
+        columns = list(columns)
+
+        options = {
+            "constant_memory": True,
+            "strings_to_urls": False,
+            "default_date_format": "yyyy-mm-dd hh:mm:ss",
+        }
+        with xlsxwriter.Workbook(file_path, options) as workbook:
+            worksheet = workbook.add_worksheet(sheet_name)
+            header_format = workbook.add_format(cls.HEADER_FORMAT)
+            for i, column in enumerate(columns):
+                worksheet.set_column(i, i, width)  # 设置列宽
+                name = key_map.get(column, column) if key_map else column
+                worksheet.write(0, i, name, header_format)
+
+            if first is None:
+                return
+            for row_i, item in enumerate(chain([first], item_iter), 1):
+                for i, column in enumerate(columns):
+                    cls._write_cell(worksheet, row_i, i, item.get(column))
+
+    @staticmethod
+    def _write_cell(worksheet, row_i: int, col_i: int, value):
+        if value is None or value != value:  # None、nan写为空单元格
+            return
+        try:
+            worksheet.write(row_i, col_i, value)
+        except TypeError:  # list、dict等类型写为字符串
+            worksheet.write_string(row_i, col_i, str(value))
 
-            D.append([item[k] for k in columns])
 
-        if key_map:
-            columns = [key_map.get(k, k) for k in columns]
+class ParquetTool:
+    """parquet读写操作，按record batch流式读取，按row group分批写入，需要安装pyarrow"""
 
-        if not columns:
-            return
+    OPS = ("==", "!=", "<", "<=", ">", ">=", "in")
+
+    @staticmethod
+    def _pyarrow():
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("读写parquet文件需要安装pyarrow: pip install pyarrow")
+        return pyarrow
+
+    @classmethod
+    def _may_match(cls, statistics, op: str, value) -> bool:
+        """根据row group的统计信息判断是否可能有满足条件的行"""
+        if statistics is None or not statistics.has_min_max:
+            return True
+        low, high = statistics.min, statistics.max
+        try:
+            if op == "==":
+                return low <= value <= high
+            if op == "in":
+                return any(low <= v <= high for v in value)
+            if op == "<":
+                return low < value
+            if op == "<=":
+                return low <= value
+            if op == ">":
+                return high > value
+            if op == ">=":
+                return high >= value
+        except TypeError:  # 类型无法比较时不跳过
+            return True
+        return True
+
+    @classmethod
+    def _mask(cls, pa, batch, filters: list):
+        import pyarrow.compute as pc
+
+        funcs = {
+            "==": pc.equal,
+            "!=": pc.not_equal,
+            "<": pc.less,
+            "<=": pc.less_equal,
+            ">": pc.greater,
+            ">=": pc.greater_equal,
+        }
+        mask = None
+        for column, op, value in filters:
+            array = batch.column(column)
+            if op == "in":
+                _mask = pc.is_in(array, value_set=pa.array(value))
+            else:
+                _mask = funcs[op](array, value)
+            mask = _mask if mask is None else pc.and_(mask, _mask)
+        return pc.fill_null(mask, False)
+
+    @classmethod
+    def read_iter(
+        cls,
+        file_path,
+        columns: List[str] = None,
+        filters: List[tuple] = None,
+        offset: int = 0,
+        head_num: int = None,
+        batch_size: int = 8192,
+    ):
+        """流式读取，每次只加载一个record batch
+
+        Args:
+            file_path ([str]): [文件路径]
+            columns ([List[str]]): [读取的列，None读取全部]
+            filters ([List[tuple]]): [过滤条件 [(列名, 操作符, 值)]，操作符为 ==、!=、<、<=、>、>=、in，
+                多个条件同时满足，根据row group的统计信息跳过不满足条件的row group]
+            offset (int): [起始行号(过滤前)，根据row group的行数直接跳过]
+            head_num (int): [读取行数(过滤前)，None读取全部]
+            batch_size (int): [每个record batch的行数]
+        """
+        pa = cls._pyarrow()
+        filters = filters or []
+        for _, op, _ in filters:
+            if op not in cls.OPS:
+                raise ValueError(f"操作符必须为{cls.OPS}之一: {op}")
+
+        parquet_file = pa.parquet.ParquetFile(file_path)
+        metadata = parquet_file.metadata
+        schema = parquet_file.schema_arrow
+        names = columns or schema.names
+        # 读取时需要包含过滤条件用到的列
+        read_columns = names + [c for c, _, _ in filters if c not in names]
+        end = metadata.num_rows if head_num is None else offset + head_num
+
+        start = 0
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            group_start, start = start, start + row_group.num_rows
+            if start <= offset:
+                continue
+            if group_start >= end:
+                break
+            if not all(
+                cls._may_match(
+                    row_group.column(schema.get_field_index(column)).statistics,
+                    op,
+                    value,
+                )
+                for column, op, value in filters
+            ):
+                continue  # 跳过不满足条件的row group
+
+            batches = parquet_file.iter_batches(
+                batch_size=batch_size, row_groups=[i], columns=read_columns
+            )
+            row = group_start
+            for batch in batches:
+                # 按offset、head_num截取
+                batch_start, row = row, row + batch.num_rows
+                lo, hi = max(offset - batch_start, 0), min(
+                    end - batch_start, batch.num_rows
+                )
+                if lo >= hi:
+                    continue
+                batch = batch.slice(lo, hi - lo)
+                if filters:
+                    batch = batch.filter(cls._mask(pa, batch, filters))
+                if len(read_columns) > len(names):
+                    batch = batch.select(names)
+                yield from batch.to_pylist()
 
-        cls._write(D, file_path, columns, width=width)
+    @classmethod
+    def read_list(cls, file_path, **kwargs):
+        return list(cls.read_iter(file_path, **kwargs))
+
+    @classmethod
+    def num_rows(cls, file_path) -> int:
+        """文件行数，读取元数据"""
+        pa = cls._pyarrow()
+        return pa.parquet.ParquetFile(file_path).metadata.num_rows
+
+    @classmethod
+    def write(
+        cls,
+        item_iter,
+        file_path,
+        row_group_size: int = 65536,
+        schema=None,
+        compression: str = "snappy",
+    ):
+        """按row group分批写入，内存中最多缓存row_group_size个item
+
+        Args:
+            item_iter ([list or iter]): [输入数据流]
+            file_path ([str]): [输出文件路径]
+            row_group_size (int): [每个row group的行数]
+            schema ([pyarrow.Schema]): [None时根据第一个row group推断，之后的数据按该schema转换]
+            compression (str): [压缩方式 snappy/zstd/gzip/none]
+        """
+        pa = cls._pyarrow()
+        writer, buffer = None, []
+
+        def flush():
+            nonlocal writer
+            table = pa.Table.from_pylist(
+                buffer, schema=writer.schema if writer else schema
+            )
+            if writer is None:
+                writer = pa.parquet.ParquetWriter(
+                    file_path, table.schema, compression=compression
+                )
+            writer.write_table(table, row_group_size=row_group_size)
+            buffer.clear()
+
+        try:
+            for item in item_iter:
+                buffer.append(item)
+                if len(buffer) >= row_group_size:
+                    flush()
+            if buffer or (writer is None and schema is not None):
+                flush()
+        finally:
+            if writer is not None:
+                writer.close()
@@ -0,0 +1,134 @@
+"""
+共享内存传输: 大块buffer(bytes、numpy数组等)写入共享内存，queue中只传递句柄
+生产端写入时复制一次；消费端numpy数组等可写buffer直接引用共享内存映射，不再复制，bytes需复制一次
+共享内存保持在resource_tracker中注册，进程异常退出时由主进程回收；每个queue的共享内存名称带有独立前缀，
+stage结束时删除未被消费的部分(提前退出、worker被杀死等)
+"""
+
+import itertools
+import os
+import pickle
+import secrets
+from multiprocessing import resource_tracker, shared_memory
+
+SHM_DIR = (
+    "/dev/shm"  # 可列出共享内存的系统，其他系统由resource_tracker在主进程退出时回收
+)
+_counter = itertools.count()
+
+
+def _wrap_bytes(obj, threshold: int, depth: int = 3):
+    """bytes默认只能带内序列化，大块bytes转为PickleBuffer以支持带外传输
+    只处理list、dict中的bytes，容器浅拷贝，不修改原数据
+    """
+    if type(obj) is bytes:
+        return pickle.PickleBuffer(obj) if len(obj) >= threshold else obj
+    if depth <= 0:
+        return obj
+    if type(obj) is list:
+        return [_wrap_bytes(v, threshold, depth - 1) for v in obj]
+    if type(obj) is dict:
+        return {k: _wrap_bytes(v, threshold, depth - 1) for k, v in obj.items()}
+    return obj
+
+
+class ShmPayload:
+    """queue中传递的数据: 带内序列化结果 + 共享内存句柄"""
+
+    __slots__ = ("data", "handles")
+
+    def __init__(self, data: bytes, handles: list):
+        self.data = data
+        self.handles = handles  # [(name, size, readonly)]
+
+    def __getstate__(self):
+        return self.data, self.handles
+
+    def __setstate__(self, state):
+        self.data, self.handles = state
+
+
+def dumps(obj, threshold: int, prefix: str = "fd_") -> ShmPayload:
+    """序列化，不小于threshold字节的buffer写入共享内存，名称为 prefix + 进程号 + 序号"""
+    buffers = []
+
+    def buffer_callback(buffer: pickle.PickleBuffer):
+        if buffer.raw().nbytes < threshold:
+            return True  # 带内序列化
+        buffers.append(buffer)
+        return False
+
+    data = pickle.dumps(
+        _wrap_bytes(obj, threshold), protocol=5, buffer_callback=buffer_callback
+    )
+
+    handles = []
+    for buffer in buffers:
+        raw = buffer.raw()
+        name = f"{prefix}{os.getpid()}_{next(_counter)}"
+        shm = shared_memory.SharedMemory(name, create=True, size=max(raw.nbytes, 1))
+        shm.buf[: raw.nbytes] = raw
+        handles.append((shm.name, raw.nbytes, raw.readonly))
+        shm.close()
+    return ShmPayload(data, handles)
+
+
+def loads(payload: ShmPayload):
+    """反序列化，读取时立即删除共享内存名称，映射在不再被引用时释放"""
+    buffers = []
+    for name, size, readonly in payload.handles:
+        shm = shared_memory.SharedMemory(name=name)
+        shm.unlink()
+        if readonly:  # bytes无法引用外部内存，复制
+            buffers.append(bytes(shm.buf[:size]))
+            shm.close()
+            continue
+        # 可写buffer(如numpy数组)直接引用映射，由返回的对象持有
+        mm, shm._mmap = shm._mmap, None
+        shm.close()
+        buffers.append(memoryview(mm)[:size])
+    return pickle.loads(payload.data, buffers=buffers)
+
+
+def unlink_prefix(prefix: str):
+    """删除名称以prefix开头、尚未被消费的共享内存"""
+    if not os.path.isdir(SHM_DIR):
+        return
+    for name in os.listdir(SHM_DIR):
+        if not name.startswith(prefix):
+            continue
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+
+
+class ShmQueue:
+    """共享内存传输的queue封装，接口与multiprocessing.Queue一致"""
+
+    def __init__(self, queue, threshold: int):
+        """[summary]
+
+        Args:
+            queue ([Queue]): [multiprocessing.Queue]
+            threshold ([int]): [不小于该字节数的buffer经共享内存传输]
+        """
+        resource_tracker.ensure_running()  # 子进程共用同一个resource_tracker
+        self.queue = queue
+        self.threshold = threshold
+        self.prefix = f"fd{secrets.token_hex(4)}_"
+
+    def put(self, obj, block=True, timeout=None):
+        self.queue.put(dumps(obj, self.threshold, self.prefix), block, timeout)
+
+    def get(self, block=True, timeout=None):
+        return loads(self.queue.get(block, timeout))
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def cleanup(self):
+        """stage结束后删除本queue中未被消费的共享内存"""
+        unlink_prefix(self.prefix)
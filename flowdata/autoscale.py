@@ -0,0 +1,134 @@
+"""
+根据队列积压及worker利用率，运行时自动调整并行数量
+"""
+
+import multiprocessing
+import threading
+import time
+
+from ._logger import logger
+
+
+class CpuBudget:
+    """全局扩容预算，跨stage、跨进程共享，限制所有stage扩容的worker总数"""
+
+    def __init__(self, total: int):
+        self.value = multiprocessing.Value("i", max(0, total))
+
+    def acquire(self) -> bool:
+        with self.value.get_lock():
+            if self.value.value <= 0:
+                return False
+            self.value.value -= 1
+            return True
+
+    def release(self, num: int = 1):
+        with self.value.get_lock():
+            self.value.value += num
+
+
+def qsize(q) -> int:
+    """队列长度，不支持时(macOS上multiprocessing.Queue.qsize未实现)返回None"""
+    try:
+        return q.qsize()
+    except NotImplementedError:
+        return None
+
+
+class AutoScaler(threading.Thread):
+    """扩缩容线程，每隔interval秒根据以下指标决策一次:
+    queue_in有积压、worker利用率高且queue_out未满时扩容；queue_in为空且利用率低时缩容
+    无法获取队列长度时只根据利用率决策
+    """
+
+    def __init__(
+        self,
+        dp,
+        min_work_num: int,
+        max_work_num: int,
+        budget: CpuBudget = None,
+        interval: float = 1,
+        name: str = "",
+    ):
+        """[summary]
+
+        Args:
+            dp ([DataParallel]): [被调整的DataParallel]
+            min_work_num ([int]): [最小并行数量]
+            max_work_num ([int]): [最大并行数量]
+            budget ([CpuBudget]): [全局扩容预算，None时不限制]
+            interval ([float]): [决策间隔(秒)]
+            name ([str]): [日志中的stage名称]
+        """
+        super().__init__(daemon=True)
+        self.dp = dp
+        self.min_work_num = min_work_num
+        self.max_work_num = max_work_num
+        self.budget = budget
+        self.interval = interval
+        self.name = name
+        self.stop_event = threading.Event()
+        self.target = dp.live_num()  # 期望的worker数量
+        self.extra = 0  # 已占用的扩容预算
+        self.warned = False  # 已提示无法获取队列长度
+
+    def run(self):
+        busy, last = self.dp.metrics.total("busy"), time.time()
+        while not self.stop_event.wait(self.interval):
+            _busy, now = self.dp.metrics.total("busy"), time.time()
+            live_num = self.dp.live_num()
+            if live_num == self.target:  # 上一次调整已生效
+                util = (_busy - busy) / ((now - last) * max(live_num, 1))
+                self.step(live_num, util)
+            busy, last = _busy, now
+
+    def step(self, live_num: int, util: float):
+        qsize_in, qsize_out = qsize(self.dp.queue_in), qsize(self.dp.queue_out)
+        if qsize_in is None and not self.warned:
+            self.warned = True
+            logger.warning(
+                "[autoscale] %s 无法获取队列长度，只根据利用率扩缩容", self.name
+            )
+
+        action = None
+        if (
+            util > 0.8
+            and (qsize_in is None or qsize_in > 0)
+            and (qsize_out is None or qsize_out < self.dp.queue_size)
+            and live_num < self.max_work_num
+        ):
+            if self.budget is None or self.budget.acquire():
+                self.dp.add_worker()
+                self.extra += 1
+                action = "扩容"
+        elif (
+            util < 0.3
+            and (qsize_in is None or qsize_in == 0)
+            and live_num > self.min_work_num
+        ):
+            self.dp.remove_worker()
+            if self.extra > 0:
+                self.extra -= 1
+                if self.budget is not None:
+                    self.budget.release()
+            action = "缩容"
+
+        if action:
+            self.target = live_num + (1 if action == "扩容" else -1)
+            logger.info(
+                "[autoscale] %s %s: %s -> %s, 利用率: %.2f, queue_in: %s, queue_out: %s",
+                self.name,
+                action,
+                live_num,
+                self.target,
+                util,
+                qsize_in,
+                qsize_out,
+            )
+
+    def stop(self):
+        """停止调整，归还扩容预算"""
+        self.stop_event.set()
+        if self.budget is not None and self.extra > 0:
+            self.budget.release(self.extra)
+        self.extra = 0
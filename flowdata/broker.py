@@ -0,0 +1,417 @@
+"""
+多机执行: driver主机运行get_data、save_data及broker，worker主机连接broker执行同一FlowBase子类的task
+基于multiprocessing.connection的TCP连接，不依赖外部服务
+流控基于credit: 每个worker连接时声明credit，broker向其发送的未返回item数量不超过credit
+没有更多数据可发送时，broker通知worker结束本轮(drain)，worker输出各stage中未攒满的chunk
+worker断开时，其未返回的item重新分配给其他worker，__origin_id不变，keep_order仍然有效
+flat_map派生的子item在输入item的子item全部返回后才输出，worker断开时丢弃已返回的部分，重新分配后不会重复
+连接上传输pickle，反序列化可执行任意代码，authkey须保密，默认只监听本机
+"""
+
+import itertools
+import queue
+import secrets
+import socket
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Client, Listener
+from typing import Dict
+
+from ._logger import logger
+from .reorder import WEIGHT_KEY, Completion
+
+SOURCE_END = object()  # 输入数据结束标志
+POLL_INTERVAL = 0.01  # 等待输入数据时的轮询间隔(秒)
+HEARTBEAT_INTERVAL = 1  # worker发送心跳的间隔(秒)
+
+
+class RemoteWorker:
+    """broker侧记录的worker连接状态"""
+
+    def __init__(self, worker_id: int, conn, credit: int, name: str):
+        self.worker_id = worker_id
+        self.conn = conn
+        self.credit = max(1, credit)
+        self.name = name
+        self.inflight = {}  # 已发送未返回的item __origin_id: item
+        self.unknown = 0  # 返回结果中无 __origin_id 的数量
+        self.completion = (
+            Completion()
+        )  # flat_map派生的结果，子item全部返回后输入item完成
+        self.children = {}  # 未完成的派生结果  输入item __origin_id: 子item列表
+        self.round_open = False  # 本轮已发送数据，尚未通知drain
+
+    @property
+    def spare(self) -> int:
+        """剩余credit"""
+        return self.credit - (len(self.inflight) - self.unknown)
+
+    @property
+    def drained(self) -> bool:
+        return len(self.inflight) <= self.unknown
+
+
+class Broker:
+    """driver主机上的broker，FlowBase.main(broker=Broker(...))时由task执行阶段使用"""
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 6000),
+        authkey: bytes = None,
+        chunk_size: int = 16,
+        buffer_size: int = 1000,
+        heartbeat_timeout: float = 10,
+    ):
+        """[summary]
+
+        Args:
+            address ([tuple]): [监听地址 (host, port)，port为0时随机分配，通过address属性获取；
+                默认只监听本机，多机执行时指定网卡地址，只在可信网络中开放]
+            authkey ([bytes]): [连接认证密钥，worker需一致；None时随机生成并打印到日志，通过authkey属性获取]
+            chunk_size ([int]): [每次发送给worker的最大item数量]
+            buffer_size ([int]): [get_data预读的item数量]
+            heartbeat_timeout ([float]): [超过该时间(秒)未收到worker的消息时视为断开]
+        """
+        if authkey is None:
+            authkey = secrets.token_hex(16).encode()
+            logger.warning("broker未指定authkey，随机生成: %s", authkey.decode())
+        self.authkey = check_authkey(authkey)
+        self.listener = Listener(address, authkey=authkey, backlog=64)
+        self.chunk_size = max(1, chunk_size)
+        self.buffer_size = buffer_size
+        self.heartbeat_timeout = heartbeat_timeout
+        self.flow_name = None
+        self.events = queue.Queue()
+        self.workers: Dict[int, RemoteWorker] = {}
+        self.worker_ids = itertools.count()
+        self.closed = threading.Event()
+        self.accept_thread = None
+        self.source_done = False
+
+    @property
+    def address(self) -> tuple:
+        return self.listener.address
+
+    def accept_loop(self):
+        """接收worker连接，每个连接一个接收线程"""
+        while not self.closed.is_set():
+            try:
+                conn = self.listener.accept()
+            except OSError:  # listener关闭
+                return
+            except Exception as err:  # 认证失败等
+                if self.closed.is_set():  # close()发起的唤醒连接
+                    return
+                logger.warning("worker连接失败: %s", err)
+                continue
+            if self.closed.is_set():
+                conn.close()
+                return
+            threading.Thread(target=self.recv_loop, args=(conn,), daemon=True).start()
+
+    def recv_loop(self, conn):
+        """接收单个worker的消息，转为事件交给run()处理"""
+        try:
+            _, flow_name, credit, name = conn.recv()
+        except (EOFError, OSError, ValueError) as err:
+            logger.warning("worker握手失败: %s", err)
+            conn.close()
+            return
+        if flow_name != self.flow_name:
+            conn.send(("error", f"flow不一致: {flow_name} != {self.flow_name}"))
+            conn.close()
+            return
+
+        worker = RemoteWorker(next(self.worker_ids), conn, credit, name)
+        self.events.put(("join", worker, None))
+        try:
+            while conn.poll(self.heartbeat_timeout):
+                kind, results = conn.recv()
+                if kind == "results":
+                    self.events.put(("results", worker, results))
+            logger.warning("worker[%s] %s 心跳超时", worker.worker_id, worker.name)
+            conn.close()
+        except (EOFError, OSError):
+            pass
+        self.events.put(("leave", worker, None))
+
+    def feed(self, item_iter, source: queue.Queue):
+        """预读输入数据，get_data在独立线程中执行，不阻塞结果接收"""
+        try:
+            for item in item_iter:
+                source.put(item)
+            source.put(SOURCE_END)
+        except Exception as err:
+            source.put(err)
+
+    def take(self, pending: deque, source: queue.Queue):
+        """取下一个待发送的item，优先重新分配的item，暂无数据时返回SOURCE_END或None"""
+        if pending:
+            return pending.popleft()
+        if self.source_done:
+            return SOURCE_END
+        try:
+            item = source.get_nowait()
+        except queue.Empty:
+            return None
+        if item is SOURCE_END:
+            self.source_done = True
+        elif isinstance(item, Exception):
+            raise item
+        return item
+
+    def dispatch(self, pending: deque, source: queue.Queue):
+        """按各worker剩余credit发送数据"""
+        for worker in list(self.workers.values()):
+            chunk = []
+            while worker.spare > len(chunk) and len(chunk) < self.chunk_size:
+                item = self.take(pending, source)
+                if item is None or item is SOURCE_END:
+                    break
+                chunk.append(item)
+            if chunk:
+                worker.inflight.update((item["__origin_id"], item) for item in chunk)
+                worker.round_open = True
+                self.send(worker, ("items", chunk))
+            elif self.source_done and not pending and worker.round_open:
+                worker.round_open = False
+                self.send(worker, ("drain", None))
+
+        if not self.workers and not pending:  # 没有worker时检查输入是否为空
+            item = self.take(pending, source)
+            if item is not None and item is not SOURCE_END:
+                pending.append(item)
+
+    def send(self, worker: RemoteWorker, msg: tuple):
+        try:
+            worker.conn.send(msg)
+        except OSError:
+            pass  # 由接收线程发出leave事件后重新分配
+
+    def handle(self, event: tuple, pending: deque) -> list:
+        """处理单个事件，返回收到的结果"""
+        kind, worker, data = event
+        if kind == "join":
+            self.workers[worker.worker_id] = worker
+            logger.info(
+                "worker[%s] %s 已连接，credit %s",
+                worker.worker_id,
+                worker.name,
+                worker.credit,
+            )
+            return []
+
+        if kind == "leave":
+            self.workers.pop(worker.worker_id, None)
+            items = sorted(
+                worker.inflight.values(), key=lambda item: item["__origin_id"]
+            )
+            pending.extendleft(reversed(items))  # 优先重新分配
+            worker.inflight.clear()
+            worker.children.clear()  # 部分返回的子item随输入item重新执行
+            logger.warning(
+                "worker[%s] %s 已断开，%s 个未完成item重新分配",
+                worker.worker_id,
+                worker.name,
+                len(items),
+            )
+            if not self.workers:
+                logger.warning("当前没有可用的worker，等待worker连接")
+            return []
+
+        results = []
+        for item in data:
+            origin_id = item.get("__origin_id") if isinstance(item, dict) else None
+            if origin_id is None:
+                worker.unknown += 1  # 无法对应到输入，只计数
+            elif type(origin_id) is not int:
+                if origin_id[0] not in worker.inflight:
+                    continue  # 重复返回
+                worker.children.setdefault(origin_id[0], []).append(item)
+                root = worker.completion.add(origin_id, item[WEIGHT_KEY])
+                if root is not None:
+                    worker.inflight.pop(root)
+                    results.extend(worker.children.pop(root))
+                continue
+            elif worker.inflight.pop(origin_id, None) is None:
+                continue  # 重复返回
+            results.append(item)
+        return results
+
+    def run(self, item_iter, flow_name: str):
+        """将数据分发给各worker执行，返回执行结果(不保序)
+
+        Args:
+            item_iter ([iter]): [输入数据迭代器，item包含 __origin_id]
+            flow_name ([str]): [FlowBase子类名称，worker需一致]
+        """
+        self.flow_name = flow_name
+        self.source_done = False
+        self.accept_thread = threading.Thread(target=self.accept_loop, daemon=True)
+        self.accept_thread.start()
+        source = queue.Queue(self.buffer_size)
+        threading.Thread(
+            target=self.feed, args=(item_iter, source), daemon=True
+        ).start()
+
+        pending = deque()  # 等待重新分配的item
+        try:
+            while True:
+                self.dispatch(pending, source)
+                if (
+                    self.source_done
+                    and not pending
+                    and all(worker.drained for worker in self.workers.values())
+                ):
+                    break
+
+                # 有空闲credit但输入数据未就绪时轮询，否则等待结果
+                waiting = not self.source_done and any(
+                    worker.spare > 0 for worker in self.workers.values()
+                )
+                try:
+                    event = self.events.get(timeout=POLL_INTERVAL if waiting else 1)
+                except queue.Empty:
+                    continue
+                while True:
+                    yield from self.handle(event, pending)
+                    try:
+                        event = self.events.get_nowait()
+                    except queue.Empty:
+                        break
+        finally:
+            self.close()
+
+    def close(self):
+        """通知所有worker结束并关闭连接"""
+        self.closed.set()
+        if self.accept_thread is not None:
+            # 关闭listener不会唤醒阻塞在accept的线程，其fd被之后新建的listener复用时会误接收连接
+            # 先连接自身唤醒并等待其退出
+            host, port = self.address[:2]
+            if host in ("", "0.0.0.0"):
+                host = "127.0.0.1"
+            try:
+                socket.create_connection((host, port), timeout=1).close()
+            except OSError:
+                pass
+            self.accept_thread.join(timeout=self.heartbeat_timeout)
+        self.listener.close()
+        while True:  # 处理尚未加入的连接
+            try:
+                kind, worker, _ = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "join":
+                self.workers[worker.worker_id] = worker
+        for worker in self.workers.values():
+            try:
+                worker.conn.send(("end", None))
+                worker.conn.close()
+            except OSError:
+                pass
+        self.workers.clear()
+
+
+def check_authkey(authkey: bytes) -> bytes:
+    """authkey必须为非空bytes，不提供默认值"""
+    if not isinstance(authkey, bytes) or not authkey:
+        raise ValueError("authkey must be non-empty bytes")
+    return authkey
+
+
+def connect(address, authkey: bytes, timeout: float = 60):
+    """连接broker，driver尚未启动时重试直到超时"""
+    check_authkey(authkey)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return Client(tuple(address), authkey=authkey)
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+def run_worker(
+    flow,
+    address,
+    authkey: bytes,
+    credit: int = 64,
+    timeout: float = 60,
+    name: str = None,
+):
+    """worker主机: 从broker接收数据，执行flow的全部task后返回结果，直到broker结束
+
+    Args:
+        flow ([FlowBase]): [与driver相同的FlowBase子类实例]
+        address ([tuple]): [broker地址 (host, port)]
+        authkey ([bytes]): [连接认证密钥，与Broker一致]
+        credit ([int]): [最多同时处理的item数量，应不小于本机各stage的并行度]
+        timeout ([float]): [连接broker的超时时间(秒)]
+        name ([str]): [worker名称，用于日志]
+    """
+    check_authkey(authkey)
+    name = name or socket.gethostname()
+    # 各并行stage输入端最多攒 chunk_size-1 个item，credit需大于其总和，否则无法推进
+    min_credit = 1 + sum(
+        stage.task.chunk_size - 1 for stage in flow.get_stages() if stage.task.parallel
+    )
+    if credit < min_credit:
+        logger.warning(
+            "credit %s 小于各stage的chunk_size之和，调整为 %s", credit, min_credit
+        )
+        credit = min_credit
+    send_lock = threading.Lock()
+    stop_event = threading.Event()
+
+    def send(msg):
+        with send_lock:
+            conn.send(msg)
+
+    def heartbeat():
+        """执行耗时较长时，broker据此判断worker存活"""
+        while not stop_event.wait(HEARTBEAT_INTERVAL):
+            try:
+                send(("heartbeat", None))
+            except OSError:
+                return
+
+    state = {"end": False}
+
+    def recv_items():
+        """一轮数据，收到drain时结束本轮，收到end或连接断开时结束全部"""
+        while True:
+            try:
+                kind, data = conn.recv()
+            except (EOFError, OSError):
+                logger.warning("broker连接已断开")
+                kind = "end"
+            if kind == "drain":
+                return
+            if kind == "end":
+                state["end"] = True
+                return
+            if kind == "error":
+                raise ValueError(data)
+            yield from data
+
+    num = 0
+    # 先启动常驻进程池再连接，子进程不持有连接，本进程退出时broker立即感知
+    with flow:
+        conn = connect(address, authkey, timeout)
+        threading.Thread(target=heartbeat, daemon=True).start()
+        try:
+            send(("hello", flow.__class__.__name__, credit, name))
+            while not state["end"]:
+                for item in flow.exec_tasks(recv_items()):
+                    send(("results", [item]))
+                    num += 1
+        except (BrokenPipeError, ConnectionResetError):
+            logger.warning("broker连接已断开")
+        finally:
+            stop_event.set()
+            conn.close()
+    logger.info("worker %s 结束，共处理 %s 条数据", name, num)
+    return num
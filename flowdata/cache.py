@@ -0,0 +1,227 @@
+"""
+task结果缓存: 基于sqlite的本地磁盘存储，按item内容的稳定hash查找，支持按总大小LRU淘汰及过期时间
+每个进程(线程)使用独立的连接，WAL模式下多进程可同时读写
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from ._logger import logger
+
+MISS = object()  # 未命中标志
+EVICT_INTERVAL = 100  # 每写入多少次检查一次淘汰
+ID_KEYS = ("__origin_id", "__weight")  # 不参与hash、不缓存的key
+
+
+def _digest(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _canonical(obj):
+    """json无法表示的值转为稳定的表示: 数组、bytes按类型及内容hash，其他类型抛出TypeError"""
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject:  # 对象数组的内存中是指针
+            return {"__ndarray__": [obj.dtype.str, obj.shape, obj.tolist()]}
+        data = _digest(np.ascontiguousarray(obj).tobytes())
+        return {"__ndarray__": [obj.dtype.str, obj.shape, data]}
+    if isinstance(obj, np.generic):
+        return {"__numpy__": [obj.dtype.str, obj.item()]}
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return {"__bytes__": _digest(obj)}
+    if isinstance(obj, (set, frozenset)):
+        return {"__set__": sorted(_dumps_key(v) for v in obj)}
+    raise TypeError(f"{type(obj).__name__} 没有稳定的序列化")
+
+
+def _dumps_key(obj) -> str:
+    """item的稳定序列化，与dict的key顺序无关，无法稳定序列化时抛出TypeError"""
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, default=_canonical)
+
+
+class TaskCache:
+    """task结果缓存，通过 add_task(cache=TaskCache(...)) 开启"""
+
+    def __init__(
+        self,
+        path: str,
+        keys: list = None,
+        version: str = "",
+        max_bytes: int = None,
+        ttl: float = None,
+        timeout: float = 30,
+    ):
+        """[summary]
+
+        Args:
+            path ([str]): [sqlite文件路径，多个task可共用]
+            keys ([list]): [参与hash的item字段，None时使用整个item]
+            version ([str]): [task版本，task逻辑变化时修改，旧结果不再命中]
+            max_bytes ([int]): [缓存结果的总字节数上限，超出时淘汰最久未使用的结果，None不限制]
+            ttl ([float]): [结果过期时间(秒)，None不过期]
+            timeout ([float]): [等待其他进程写锁的超时时间(秒)]
+        """
+        self.path = path
+        self.keys = keys
+        self.version = str(version)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.timeout = timeout
+        self._local = threading.local()
+        self._warned = False
+
+    def __repr__(self):
+        return (
+            f"TaskCache(path={self.path!r}, keys={self.keys!r}, version={self.version!r}, "
+            f"max_bytes={self.max_bytes!r}, ttl={self.ttl!r})"
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_local")
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """当前进程、线程的连接，fork后重新连接"""
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            dir_name = os.path.dirname(self.path)
+            if dir_name:
+                os.makedirs(dir_name, exist_ok=True)
+            conn = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            self._setup(conn)
+            local.pid, local.conn, local.put_num = os.getpid(), conn, 0
+        return local.conn
+
+    def _setup(self, conn: sqlite3.Connection):
+        """建表并切换为WAL模式，多个进程同时初始化时，切换journal_mode不等待锁，失败后重试"""
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+                    conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, "
+                    "value BLOB, size INTEGER, created REAL, accessed REAL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)"
+                )
+                return
+            except sqlite3.OperationalError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.01)
+
+    def key(self, name: str, item) -> str:
+        """item的缓存key，item中有无法稳定序列化的值(如自定义对象)时返回None，不使用缓存
+
+        Args:
+            name ([str]): [task名称]
+            item ([dict]): [task输入]
+        """
+        if isinstance(item, dict):
+            if self.keys is not None:
+                item = {key: item.get(key) for key in self.keys}
+            else:
+                item = {k: v for k, v in item.items() if k not in ID_KEYS}
+        try:
+            dumped = _dumps_key(item)
+        except (TypeError, ValueError) as err:
+            if not self._warned:
+                self._warned = True
+                logger.warning("%s 的输入无法稳定序列化，不使用缓存: %s", name, err)
+            return None
+        payload = f"{name}\0{self.version}\0{dumped}"
+        return _digest(payload.encode("utf8"))
+
+    def get(self, key: str):
+        """查找结果，未命中、已过期或key为None时返回MISS"""
+        if key is None:
+            return MISS
+        now = time.time()
+        try:
+            row = self.conn.execute(
+                "SELECT value, created FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return MISS
+            if self.ttl is not None and row[1] < now - self.ttl:
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return MISS
+            self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            return pickle.loads(row[0])
+        except (sqlite3.Error, pickle.UnpicklingError) as err:
+            logger.warning("读取缓存失败 %s: %s", self.path, err)
+            return MISS
+
+    def put(self, key: str, value):
+        """写入结果，dict结果不保存 __origin_id，key为None时不写入"""
+        if key is None:
+            return
+        if isinstance(value, dict) and "__origin_id" in value:
+            value = {k: v for k, v in value.items() if k not in ID_KEYS}
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as err:
+            logger.warning("结果无法序列化，不缓存: %s", err)
+            return
+
+        now = time.time()
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self._local.put_num += 1
+            if self._local.put_num % EVICT_INTERVAL == 1:
+                self.evict()
+        except sqlite3.Error as err:
+            logger.warning("写入缓存失败 %s: %s", self.path, err)
+
+    def evict(self):
+        """删除过期的结果，总大小超出max_bytes时按最近访问时间淘汰"""
+        if self.ttl is None and self.max_bytes is None:
+            return
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.ttl is not None:
+                conn.execute(
+                    "DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,)
+                )
+            if self.max_bytes is not None:
+                total = conn.execute("SELECT SUM(size) FROM cache").fetchone()[0] or 0
+                excess, keys = total - self.max_bytes, []
+                if excess > 0:
+                    rows = conn.execute("SELECT key, size FROM cache ORDER BY accessed")
+                    for key, size in rows:
+                        if excess <= 0:
+                            break
+                        keys.append((key,))
+                        excess -= size
+                    conn.executemany("DELETE FROM cache WHERE key = ?", keys)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        self.conn.execute("DELETE FROM cache")
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
@@ -0,0 +1,169 @@
+"""
+断点续跑: 记录已完成的 __origin_id，重启后跳过已完成的item
+已完成id记录为水位线 + 水位线之后的稀疏集合，与CheckpointSink的文件长度一起原子提交
+"""
+
+import json
+import os
+import time
+from fractions import Fraction
+from typing import Dict
+
+from ._logger import logger
+from .reorder import Completion
+
+
+def _atomic_write(path: str, text: str):
+    """写入临时文件并落盘后替换，保证checkpoint文件完整"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """已完成item的记录
+    watermark之前的id全部完成，done为watermark之后已完成的稀疏id集合
+    """
+
+    def __init__(self, path: str, interval: float = 5):
+        """[summary]
+
+        Args:
+            path ([str]): [checkpoint文件路径]
+            interval ([float]): [提交间隔(秒)]
+        """
+        self.path = path
+        self.interval = interval
+        self.watermark = 0
+        self.done = set()
+        self.offset = 0  # main()的offset参数，续跑时需一致
+        self.sink_offsets: Dict[str, int] = {}  # 上次提交时各输出文件的长度
+        self.sinks: Dict[str, "CheckpointSink"] = {}
+        self.resumed = (0, frozenset())  # 续跑前已完成的 (watermark, done)
+        self.last_commit = time.time()
+        self.completion = Completion()  # 未全部完成的派生item
+
+    def load(self, offset: int = 0):
+        """读取上次提交的记录，用于续跑"""
+        if not os.path.exists(self.path):
+            logger.warning("checkpoint文件不存在，从头开始: %s", self.path)
+            self.offset = offset
+            return self
+
+        with open(self.path, "r", encoding="utf8") as f:
+            state = json.load(f)
+        if state["offset"] != offset:
+            raise ValueError(
+                f"续跑的offset与checkpoint不一致: {offset} != {state['offset']}"
+            )
+        self.offset = offset
+        self.watermark = state["watermark"]
+        self.done = set(state["done"])
+        self.sink_offsets = state["sinks"]
+        self.resumed = (self.watermark, frozenset(self.done))
+        logger.info(
+            "从checkpoint续跑，水位线: %s，水位线之后已完成: %s",
+            self.watermark,
+            len(self.done),
+        )
+        return self
+
+    def reset(self, offset: int = 0):
+        """从头开始，清空上次的记录"""
+        self.offset = offset
+        self.commit()
+        return self
+
+    @property
+    def resumed_num(self) -> int:
+        """续跑前已完成的item数量"""
+        watermark, done = self.resumed
+        return watermark + len(done)
+
+    def is_resumed(self, origin_id: int) -> bool:
+        """续跑前是否已完成"""
+        watermark, done = self.resumed
+        return origin_id < watermark or origin_id in done
+
+    def mark(self, origin_id: int, weight: Fraction = None):
+        """标记完成，连续完成的id并入水位线
+        flat_map派生的item(origin_id为tuple)在同一根item的子item全部完成后标记根item
+        """
+        if type(origin_id) is not int:
+            origin_id = self.completion.add(origin_id, weight)
+            if origin_id is None:
+                return
+        if origin_id < self.watermark:
+            return
+        self.done.add(origin_id)
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+
+    def maybe_commit(self):
+        if time.time() - self.last_commit >= self.interval:
+            self.commit()
+
+    def commit(self):
+        """输出文件落盘后，与已完成id一起原子提交"""
+        for file_path, sink in self.sinks.items():
+            self.sink_offsets[file_path] = sink.sync()
+        state = {
+            "offset": self.offset,
+            "watermark": self.watermark,
+            "done": sorted(self.done),
+            "sinks": self.sink_offsets,
+        }
+        _atomic_write(self.path, json.dumps(state))
+        self.last_commit = time.time()
+
+
+class CheckpointSink:
+    """与Checkpoint配套的输出文件，追加写入
+    checkpoint提交时落盘并记录文件长度，续跑时截断到上次提交的长度，丢弃未提交的输出，保证输出不重复
+    """
+
+    def __init__(self, file_path: str, checkpoint: Checkpoint = None):
+        """[summary]
+
+        Args:
+            file_path ([str]): [输出文件路径]
+            checkpoint ([Checkpoint]): [None时等同于普通写入]
+        """
+        self.file_path = file_path
+        self.checkpoint = checkpoint
+        offset = checkpoint.sink_offsets.get(file_path, 0) if checkpoint else 0
+        if offset and os.path.exists(file_path):
+            self.f = open(file_path, "r+b")
+            self.f.truncate(offset)
+            self.f.seek(offset)
+        else:
+            self.f = open(file_path, "wb")
+        self.offset = self.f.tell()
+        if checkpoint is not None:
+            checkpoint.sinks[file_path] = self
+
+    def write(self, text: str):
+        self.f.write(text.encode("utf8"))
+
+    def sync(self) -> int:
+        """落盘，返回当前文件长度"""
+        if not self.f.closed:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.offset = self.f.tell()
+        return self.offset
+
+    def close(self):
+        if not self.f.closed:
+            self.sync()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
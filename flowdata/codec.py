@@ -0,0 +1,136 @@
+"""
+json编解码: 优先使用已安装的 orjson、msgspec，否则使用标准库json
+orjson、msgspec 会改变标准库json能表示的值(超过64位的整数解码为float，NaN、Infinity无法解码，nan、inf写为null)，
+这些情况回退到标准库json，读写结果与标准库一致
+"""
+
+import json
+from typing import Callable, NamedTuple, Tuple
+
+CODEC_NAMES = ("orjson", "msgspec", "json")
+
+
+class Codec(NamedTuple):
+    name: str
+    loads: Callable  # bytes -> obj
+    dumps: Callable  # obj -> bytes，不含换行符
+    errors: Tuple[type, ...]  # 解码异常类型
+
+
+# 数字映射为0，其他字符映射为空格，连续19个0表示可能超过64位的整数(19位以下不会溢出)
+_DIGITS = bytes(48 if 48 <= i <= 57 else 32 for i in range(256))
+_LONG_DIGITS = b"0" * 19
+
+
+def _json_dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False).encode("utf8")
+
+
+def _non_finite(obj) -> bool:
+    """是否为或包含nan、inf"""
+    if isinstance(obj, float):
+        return obj - obj != 0  # nan、inf相减为nan
+    if isinstance(obj, dict):
+        obj = obj.values()
+    elif not isinstance(obj, (list, tuple)):
+        return False
+    for value in obj:
+        if isinstance(value, float):
+            if value - value != 0:
+                return True
+        elif isinstance(value, (dict, list, tuple)):
+            if _non_finite(value):
+                return True
+    return False
+
+
+def _fast_codec(
+    name: str,
+    decode: Callable,
+    decode_errors: tuple,
+    encode: Callable,
+    encode_errors: tuple,
+) -> Codec:
+    """[summary]
+
+    Args:
+        name ([str]): [codec名称]
+        decode ([Callable]): [bytes -> obj]
+        decode_errors ([tuple]): [decode的异常类型，如NaN、Infinity无法解析]
+        encode ([Callable]): [obj -> bytes]
+        encode_errors ([tuple]): [encode不支持的值(如超过64位的整数)抛出的异常类型]
+    """
+
+    def loads(data: bytes):
+        if _LONG_DIGITS not in data.translate(_DIGITS):
+            try:
+                return decode(data)
+            except decode_errors:  # 交给标准库判断，仍失败时抛出ValueError
+                pass
+        return json.loads(data)
+
+    def dumps(obj) -> bytes:
+        try:
+            data = encode(obj)
+        except encode_errors:
+            return _json_dumps(obj)
+        # nan、inf被写为null，只在输出包含null时检查
+        if b"null" in data and _non_finite(obj):
+            return _json_dumps(obj)
+        return data
+
+    return Codec(name, loads, dumps, (ValueError,))
+
+
+def _orjson_codec() -> Codec:
+    import orjson
+
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    return _fast_codec(
+        "orjson",
+        orjson.loads,
+        (orjson.JSONDecodeError,),
+        lambda obj: orjson.dumps(obj, option=option),
+        (TypeError,),
+    )
+
+
+def _msgspec_codec() -> Codec:
+    import msgspec
+
+    encoder, decoder = msgspec.json.Encoder(), msgspec.json.Decoder()
+    return _fast_codec(
+        "msgspec",
+        decoder.decode,
+        (msgspec.DecodeError,),
+        encoder.encode,
+        (TypeError, OverflowError),
+    )
+
+
+def _std_codec() -> Codec:
+    return Codec("json", json.loads, _json_dumps, (ValueError,))
+
+
+_FACTORIES = {"orjson": _orjson_codec, "msgspec": _msgspec_codec, "json": _std_codec}
+_CODECS = {}
+
+
+def get_codec(name: str = None) -> Codec:
+    """[summary]
+
+    Args:
+        name ([str]): [orjson/msgspec/json，None时按顺序选择第一个已安装的]
+    """
+    if name is not None and name not in _FACTORIES:
+        raise ValueError(f"codec必须为{CODEC_NAMES}之一: {name}")
+
+    for codec_name in [name] if name else CODEC_NAMES:
+        if codec_name not in _CODECS:
+            try:
+                _CODECS[codec_name] = _FACTORIES[codec_name]()
+            except ImportError:
+                if name:
+                    raise
+                continue
+        return _CODECS[codec_name]
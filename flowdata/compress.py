@@ -0,0 +1,147 @@
+"""
+压缩文件流式读写: 按扩展名识别 gzip/bz2/zstd，解压、压缩在后台线程中执行，与解析及数据处理并行
+"""
+
+import bz2
+import gzip
+import os
+import queue
+import threading
+
+COMPRESSIONS = {".gz": "gzip", ".bz2": "bz2", ".zst": "zstd", ".zstd": "zstd"}
+DEFAULT_LEVELS = {"gzip": 6, "bz2": 9, "zstd": 3}
+QUEUE_SIZE = 8  # 后台线程与主线程之间最多缓存的block数量
+
+
+def get_compression(file_path) -> str:
+    """按扩展名识别压缩格式，非压缩文件返回None"""
+    return COMPRESSIONS.get(os.path.splitext(str(file_path))[1].lower())
+
+
+def open_file(file_path, mode: str = "rb", level: int = None):
+    """打开二进制文件，压缩文件自动解压/压缩
+
+    Args:
+        file_path ([str]): [文件路径]
+        mode ([str]): [rb/wb/ab]
+        level ([int]): [压缩等级，None使用各格式的默认值]
+    """
+    compression = get_compression(file_path)
+    if compression is None:
+        return open(file_path, mode)
+
+    level = DEFAULT_LEVELS[compression] if level is None else level
+    if compression == "gzip":
+        if "r" in mode:
+            return gzip.open(file_path, mode)
+        return gzip.open(file_path, mode, compresslevel=level)
+    if compression == "bz2":
+        if "r" in mode:
+            return bz2.open(file_path, mode)
+        return bz2.open(file_path, mode, compresslevel=level)
+
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("读写zstd文件需要安装zstandard: pip install zstandard")
+    if "r" in mode:
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, "rb"))
+    return zstandard.ZstdCompressor(level=level).stream_writer(open(file_path, mode))
+
+
+def _put(q: queue.Queue, obj, stop_event: threading.Event) -> bool:
+    """放入队列，stop_event设置后放弃"""
+    while not stop_event.is_set():
+        try:
+            q.put(obj, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def read_blocks(f, block_size: int, background: bool = False):
+    """按块读取，background为True时在后台线程中读取(解压)
+
+    Args:
+        f ([file]): [二进制文件对象]
+        block_size ([int]): [每次读取的字节数]
+        background ([bool]): [是否在后台线程中读取]
+    """
+    if not background:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return
+            yield block
+
+    blocks, stop_event = queue.Queue(QUEUE_SIZE), threading.Event()
+
+    def produce():
+        try:
+            while True:
+                block = f.read(block_size)
+                if not _put(blocks, block, stop_event) or not block:
+                    return
+        except Exception as err:
+            _put(blocks, err, stop_event)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            block = blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            if not block:
+                return
+            yield block
+    finally:
+        stop_event.set()  # 提前退出时通知后台线程结束
+        thread.join()
+
+
+class BackgroundWriter:
+    """后台线程写入(压缩)，主线程只负责编码"""
+
+    def __init__(self, f):
+        """[summary]
+
+        Args:
+            f ([file]): [二进制文件对象，close()时关闭]
+        """
+        self.f = f
+        self.blocks = queue.Queue(QUEUE_SIZE)
+        self.stop_event = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.consume, daemon=True)
+        self.thread.start()
+
+    def consume(self):
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                return
+            try:
+                self.f.write(block)
+            except Exception as err:
+                self.error = err
+                self.stop_event.set()
+                return
+
+    def write(self, block: bytes):
+        if not _put(self.blocks, block, self.stop_event):
+            raise self.error
+
+    def close(self):
+        _put(self.blocks, None, self.stop_event)
+        self.thread.join()
+        self.f.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
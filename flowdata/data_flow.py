@@ -2,40 +2,178 @@
 通用跑数任务流
 """
 
-import heapq
+import asyncio
+import inspect
+import os
+import time
 from collections import Counter
-from typing import Generator
+from functools import partial
+from typing import Generator, List
 
+from ._io import ShardedReader
 from ._logger import logger
-from .data_parallel import DataParallel
-from .decorator import err_catch, interrupt_catch, timer, tps
-from .task import TASK_LIST, Task, get_max_work_nums
+from .autoscale import CpuBudget
+from .broker import Broker, run_worker
+from .cache import MISS
+from .checkpoint import Checkpoint, CheckpointSink
+from .data_parallel import DataParallel, Many
+from .deadletter import (
+    REPLAY_KEY,
+    DeadLetter,
+    failure_record,
+    read_failures,
+    replay_start_fn,
+)
+from .decorator import (
+    clear_last_error,
+    err_catch,
+    interrupt_catch,
+    is_err_caught,
+    timer,
+    tps,
+)
+from .metrics import MetricsReporter, StageMetrics, snapshot
+from .profiler import get_dir, get_mode, merge_profiles, profiling
+from .reorder import (
+    FAILURE_KEY,
+    FILTERED_KEY,
+    WEIGHT_KEY,
+    OrderWindow,
+    ReorderBuffer,
+    derive,
+    dropped,
+    filtered,
+    is_dropped,
+    root_id,
+)
+from .retry import DEFERRED, Deferred, DelayQueue
+from .task import TASK_LIST, Stage, Task, fuse_tasks
+from .watchdog import ItemTimeout
+
+
+def _identity(item, *args, **kwargs):
+    return item
 
 
 class FlowBase:
-    def __init__(self, verbose=True, keep_order=False):
+    def __init__(
+        self,
+        verbose=True,
+        keep_order=False,
+        order_window: int = 1000,
+        cpu_budget: int = None,
+        metrics_path: str = None,
+        metrics_interval: float = 5,
+        checkpoint_path: str = None,
+        checkpoint_interval: float = 5,
+        dead_letter_path: str = None,
+    ):
         """[summary]
 
         Args:
             verbose ([bool]): [是否打印日志]
-            keep_order ([bool]): [是否按照输入顺序返回，True时，无法流式保存数据]
+            keep_order ([bool]): [是否按照输入顺序返回]
+            order_window ([int]): [保序窗口，已输入未输出的item达到该数量时get_data暂停，超出部分写入磁盘]
+            cpu_budget ([int]): [自动扩缩容时所有stage的worker总数上限，默认为cpu核数]
+            metrics_path ([str]): [指标输出路径前缀，main()运行期间定时写入 {metrics_path}.json 及 {metrics_path}.prom]
+            metrics_interval ([float]): [指标输出间隔(秒)]
+            checkpoint_path ([str]): [checkpoint文件路径，设置后记录已完成的item，main(resume=True)时跳过]
+            checkpoint_interval ([float]): [checkpoint提交间隔(秒)]
+            dead_letter_path ([str]): [死信文件路径，失败的item追加写入该jsonl，记录stage、task、异常、traceback、
+                __origin_id 及失败task的输入，main(replay_failures=dead_letter_path)时只重跑这些item]
         """
         self.verbose = verbose
         self.keep_order = keep_order
+        self.order_window = order_window
+        self._order_window = None
+        self.cpu_budget = cpu_budget or os.cpu_count()
+        self._cpu_budget = None
         self.counter = Counter()
+        self.metrics_path = metrics_path
+        self.metrics_interval = metrics_interval
+        self.metrics = {}  # stage运行指标 stage_name: StageMetrics
+        self._profile = None  # 性能分析模式，main()时设置
+        self._profile_dir = None
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint: Checkpoint = None
+        self.dead_letter_path = dead_letter_path
+        self.dead_letter: DeadLetter = None
+        self._remote = (
+            False  # 作为多机worker运行，filter丢弃的item需返回占位供broker确认
+        )
+        self.pools = {}  # 常驻进程池 stage_name: DataParallel
+        self.states = {}  # 单进程stage的init_fn返回值 stage_name: state
+
+    def __enter__(self):
+        self.warm()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    def warm(self):
+        """预热: 为并行task启动常驻进程池，多次调用main()时复用，需显式close()"""
+        start = time.time()
+        for stage in self.get_stages():
+            if stage.task.parallel and stage.task.max_work_num is not None:
+                # 常驻进程池的进程数量固定，启动前检查全部stage
+                raise ValueError(
+                    f"persistent pool does not support max_work_num: {stage.name}"
+                )
+        for stage in self.get_stages():
+            if not stage.task.parallel or stage.name in self.pools:
+                continue
+            self.pools[stage.name] = self.data_parallel(stage).start()
+        logger.info("常驻进程池启动完成，耗时 %.3f 秒", time.time() - start)
+
+    def close(self):
+        """关闭常驻进程池"""
+        while self.pools:
+            _, pool = self.pools.popitem()
+            pool.close()
 
     def get_data(self) -> Generator[dict, None, None]:
-        """获取数据"""
+        """获取数据
+        定义为 get_data(self, offset, head_num) 时，main()的offset、head_num下推到数据读取，
+        如 JsonlTool.read_iter(file_path, offset, head_num) 通过行偏移索引直接定位
+        """
         raise NotImplementedError("get_data: not implemented!")
 
+    def read_data(self, offset: int = 0, head_num: int = None):
+        """读取数据，get_data支持offset、head_num参数时下推，续跑时同时跳过水位线之前的item
+
+        Returns:
+            [tuple]: [数据迭代器, clip_data中需要跳过的数量, 第一个item的 __origin_id]
+        """
+        params = inspect.signature(self.get_data).parameters
+        if "offset" not in params or "head_num" not in params:
+            return self.get_data(), offset, 0
+
+        start_id = self.checkpoint.resumed[0] if self.checkpoint is not None else 0
+        if head_num:
+            head_num = max(head_num - start_id, 0)
+        else:
+            head_num = None
+        item_iter = self.get_data(offset=offset + start_id, head_num=head_num)
+        return item_iter, 0, start_id
+
     @tps(step=20)
     def save_data(self, item_iter):
         """保存数据"""
         raise NotImplementedError("save_data: not implemented!")
 
-    def clip_data(self, item_iter, offset: int = 0, head_num: int = None):
-        """偏移及截断处理"""
-        num = 0
+    def clip_data(
+        self, item_iter, offset: int = 0, head_num: int = None, start_id: int = 0
+    ):
+        """偏移及截断处理
+
+        Args:
+            offset (int): [跳过的数量]
+            head_num (int): [__origin_id 小于该值的item才处理]
+            start_id (int): [第一个item的 __origin_id]
+        """
+        num = start_id
         for i, item in enumerate(item_iter):
 
             if i < offset:
@@ -46,137 +184,808 @@ class FlowBase:
             if head_num and num > head_num:
                 break
 
+            if self.checkpoint is not None and self.checkpoint.is_resumed(num - 1):
+                continue  # 续跑时跳过已完成的item
+
+            if self._order_window is not None:
+                self._order_window.acquire(num - 1)
+
             if self.verbose:
                 logger.info("准备处理第%s条数据", i)
 
             yield item
 
+    def clip_shard(
+        self,
+        reader: ShardedReader,
+        shard_i: int,
+        offset: int = 0,
+        head_num: int = None,
+        start_id: int = 0,
+    ):
+        """单个分片的偏移及截断处理，__origin_id 由分片内的稳定序号得到，与分片读取的先后无关
+        解析时跳过的行在保序或checkpoint时输出filter占位，否则直接跳过
+        """
+        for num, item in reader.iter_shard(shard_i):
+            if num < offset:
+                continue
+
+            origin_id = start_id + num - offset
+            if head_num and origin_id >= head_num:
+                break
+            if item is None:
+                if not self.keep_order and self.checkpoint is None:
+                    continue
+                item = filtered({"__origin_id": origin_id})
+            item["__origin_id"] = origin_id
+
+            if self.checkpoint is not None and self.checkpoint.is_resumed(origin_id):
+                continue  # 续跑时跳过已完成的item
+
+            if self._order_window is not None:
+                self._order_window.acquire(origin_id)
+
+            yield item
+
+    def clip_shards(
+        self,
+        reader: ShardedReader,
+        offset: int = 0,
+        head_num: int = None,
+        start_id: int = 0,
+    ) -> list:
+        """分片读取，返回每个分片的数据迭代器fn，由首个stage的输入进程分别执行"""
+        if self._order_window is not None:
+            # 各分片的 __origin_id 为连续区间，按分片划分保序窗口
+            self._order_window.split(
+                [
+                    start_id + shard.global_start - reader.offset - offset
+                    for shard in reader.shards
+                ]
+            )
+        return [
+            partial(self.clip_shard, reader, shard_i, offset, head_num, start_id)
+            for shard_i in range(len(reader))
+        ]
+
     def count_data(self, item_iter):
         """任务执行统计
-        过滤掉 None 的 item
+        过滤掉 None 的 item，保序时异常item的占位交给_keep_order处理，占位中的失败记录写入死信文件
         """
         for item in item_iter:
-            self.counter["total_num"] += 1
-            if not item:
+            if not item or is_dropped(item):
+                if (
+                    item and FILTERED_KEY in item
+                ):  # filter丢弃的占位，只用于保序及checkpoint
+                    if self.checkpoint is not None:
+                        self.checkpoint.mark(item["__origin_id"], item.get(WEIGHT_KEY))
+                    if self.keep_order:
+                        yield item
+                    continue
+                self.counter["total_num"] += 1
                 self.counter["error_num"] += 1
+                failure = item.pop(FAILURE_KEY, None) if item else None
+                if failure is not None and self.dead_letter is not None:
+                    self.dead_letter.add(failure)
+                if self.checkpoint is not None and item:
+                    self.checkpoint.mark(item["__origin_id"], item.get(WEIGHT_KEY))
+                if self.keep_order and item:
+                    yield item
                 continue
 
+            self.counter["total_num"] += 1
             yield item
 
-    def _exec(self, item_iter, task: Task):
-        """单进程"""
-        for i, item in enumerate(item_iter):
-            task_func = getattr(self, task.func_name)
-            item = task_func(item)
-            yield item
+    def stage_fn(self, stage: Stage):
+        """stage执行函数，融合的task在同一worker内依次执行
+        task异常或返回None时，替换为只保留 __origin_id 及失败记录的占位，不再传入后续task
+        重跑的item(带REPLAY_KEY)从失败的task开始执行，失败的task在之后的stage时直接传递
+        """
+        metrics = self.stage_metrics(stage)
+        funcs = [self.cache_fn(task, metrics) for task in stage.tasks]
+        if any(task.init_fn for task in stage.tasks):
+            funcs = [
+                self.state_fn(task, func) for task, func in zip(stage.tasks, funcs)
+            ]
+        replay_start = replay_start_fn(stage, self.get_tasks())
+        if stage.task.batch_size > 1:
+            return self.batch_fn(stage, funcs[0], replay_start)
+        if stage.task.mode == "async":
+            return self.async_fn(stage, funcs, metrics, replay_start)
+        return self.sync_fn(stage, funcs, metrics, replay_start)
+
+    @property
+    def records_failures(self) -> bool:
+        """是否需要失败记录: 写入死信文件，或作为多机worker返回给driver"""
+        return bool(self.dead_letter_path or self._remote)
+
+    def failed(self, stage: Stage, task: Task, item: dict, err=None) -> dict:
+        """task执行失败，返回占位，需要时附带失败记录(traceback及item副本)"""
+        failure = None
+        if self.records_failures:
+            failure = failure_record(stage.name, task.func_name, item, err)
+        return dropped(item["__origin_id"], failure, item.get(WEIGHT_KEY))
+
+    def drop(self, item: dict, metrics: StageMetrics, work_i: int):
+        """filter丢弃item，保序或checkpoint时需要占位，否则在worker内直接丢弃，不再传输"""
+        metrics.add(work_i, "filtered")
+        if self.keep_order or self.checkpoint_path or self._remote:
+            return filtered(item)
+        return Many()
+
+    def expand(self, item: dict, children: list, metrics: StageMetrics, work_i: int):
+        """flat_map的输出，子item的 __origin_id 为 (父id, k)"""
+        if not children:
+            return self.drop(item, metrics, work_i)
+        return Many(derive(item, children))
+
+    def sync_fn(self, stage: Stage, funcs: list, metrics: StageMetrics, replay_start):
+        """同步stage执行函数
+        设置了retry的task抛出异常时抛出Deferred，由worker放入延迟队列，到期后从该task继续执行，超过重试次数时返回占位
+        """
+        tasks = stage.tasks
+        kinds = [task.kind for task in tasks]
+
+        def run_from(item, task_i: int, attempt: int, args: tuple, kwargs: dict):
+            records_failures = self.records_failures
+            for i in range(task_i, len(funcs)):
+                if records_failures:
+                    clear_last_error()
+                try:
+                    result = funcs[i](item, *args, **kwargs)
+                    if kinds[i] == "flat_map" and result is not None:
+                        result = list(result)  # 生成器在此执行，异常同样重试或记录
+                except Exception as err:
+                    retry = tasks[i].retry
+                    if retry is None or not isinstance(err, retry.exceptions):
+                        logger.error(
+                            "task执行失败 %s item: %s: %s",
+                            tasks[i].func_name,
+                            item,
+                            err,
+                        )
+                        return self.failed(stage, tasks[i], item, err)
+                    if attempt >= retry.max_retries:
+                        logger.error(
+                            "task重试%s次后仍失败 %s item: %s: %s",
+                            attempt,
+                            tasks[i].func_name,
+                            item,
+                            err,
+                        )
+                        return self.failed(stage, tasks[i], item, err)
+                    metrics.add(kwargs.get("work_i", 0), "retries")
+                    resume = partial(run_from, item, i, attempt + 1, args, kwargs)
+                    raise Deferred(retry.delay(attempt), resume)
+                attempt = 0  # 下一个task重新计数
+                if kinds[i] == "map":
+                    if not result:  # task执行异常
+                        return self.failed(stage, tasks[i], item)
+                    item = result
+                elif kinds[i] == "filter":
+                    if not result:
+                        return self.drop(item, metrics, kwargs.get("work_i", 0))
+                elif result is None:  # flat_map执行异常
+                    return self.failed(stage, tasks[i], item)
+                else:  # flat_map为stage的最后一个task
+                    return self.expand(item, result, metrics, kwargs.get("work_i", 0))
+            return item
+
+        def _sync_fn(item, *args, **kwargs):
+            if is_dropped(item):
+                return item
+            start = 0
+            if REPLAY_KEY in item:
+                start = replay_start(item)
+                if start is None:
+                    return item
+            return run_from(item, start, 0, args, kwargs)
+
+        return _sync_fn
+
+    def task_init_fn(self, task: Task):
+        """task的init_fn，为方法名或本类中定义的函数时绑定到self"""
+        init_fn = task.init_fn
+        if (
+            callable(init_fn)
+            and getattr(self.__class__, getattr(init_fn, "__name__", ""), None)
+            is init_fn
+        ):
+            init_fn = init_fn.__name__
+        if isinstance(init_fn, str):
+            init_fn = getattr(self, init_fn)
+        return init_fn
+
+    def stage_init_fn(self, stage: Stage):
+        """stage的init_fn，依次执行各task的init_fn，返回 func_name: state"""
+        init_fns = {
+            task.func_name: self.task_init_fn(task)
+            for task in stage.tasks
+            if task.init_fn is not None
+        }
+        if not init_fns:
+            return None
+
+        def _init_fn(work_i: int) -> dict:
+            return {name: init_fn(work_i) for name, init_fn in init_fns.items()}
+
+        return _init_fn
+
+    def state_fn(self, task: Task, func):
+        """从stage的state中取出本task的state传给func"""
+        name, has_init = task.func_name, task.init_fn is not None
+
+        def task_kwargs(kwargs: dict) -> dict:
+            states = kwargs.pop("state", None) or {}
+            if has_init:
+                kwargs["state"] = states.get(name)
+            return kwargs
+
+        if task.mode == "async":
+
+            async def _async_state_fn(item, *args, **kwargs):
+                return await func(item, *args, **task_kwargs(kwargs))
+
+            return _async_state_fn
+
+        def _state_fn(item, *args, **kwargs):
+            return func(item, *args, **task_kwargs(kwargs))
+
+        return _state_fn
+
+    def cache_fn(self, task: Task, metrics: StageMetrics):
+        """task设置cache时，先按item查找结果，未命中时执行并写入，命中数量记录到stage指标"""
+        func = getattr(self, task.func_name)
+        cache = task.cache
+        if cache is None:
+            return func
+        name = f"{task.class_name}.{task.func_name}"
+
+        def restore(item, result):
+            """缓存的结果不含 __origin_id，使用当前item的"""
+            if isinstance(result, dict) and isinstance(item, dict):
+                result["__origin_id"] = item.get("__origin_id")
+                if WEIGHT_KEY in item:
+                    result[WEIGHT_KEY] = item[WEIGHT_KEY]
+            return result
+
+        if task.batch_size > 1:
+
+            def _batch_cache_fn(items, *args, **kwargs):
+                work_i = kwargs.get("work_i", 0)
+                keys = [cache.key(name, item) for item in items]
+                results = [cache.get(key) for key in keys]
+                index_list = [i for i, result in enumerate(results) if result is MISS]
+                metrics.add(work_i, "cache_hits", len(items) - len(index_list))
+                metrics.add(work_i, "cache_misses", len(index_list))
+                if index_list:
+                    outputs = func([items[i] for i in index_list], *args, **kwargs)
+                    if outputs is None or len(outputs) != len(index_list):
+                        return outputs  # 由batch_fn报错
+                    for i, output in zip(index_list, outputs):
+                        if output:
+                            cache.put(keys[i], output)
+                        results[i] = output
+                return [
+                    result if i in index_list else restore(items[i], result)
+                    for i, result in enumerate(results)
+                ]
+
+            return _batch_cache_fn
+
+        if task.mode == "async":
+
+            async def _async_cache_fn(item, *args, **kwargs):
+                work_i = kwargs.get("work_i", 0)
+                key = cache.key(name, item)
+                result = cache.get(key)
+                if result is not MISS:
+                    metrics.add(work_i, "cache_hits")
+                    return restore(item, result)
+                metrics.add(work_i, "cache_misses")
+                result = await func(item, *args, **kwargs)
+                if result:
+                    cache.put(key, result)
+                return result
+
+            return _async_cache_fn
+
+        def _cache_fn(item, *args, **kwargs):
+            work_i = kwargs.get("work_i", 0)
+            key = cache.key(name, item)
+            result = cache.get(key)
+            if result is not MISS:
+                metrics.add(work_i, "cache_hits")
+                return restore(item, result)
+            metrics.add(work_i, "cache_misses")
+            result = func(item, *args, **kwargs)
+            if result:
+                cache.put(key, result)
+            return result
+
+        return _cache_fn
+
+    def async_fn(self, stage: Stage, funcs: list, metrics: StageMetrics, replay_start):
+        """async任务执行函数，协程函数无法使用err_catch，异常时返回占位
+        设置了retry的task异常时在协程内等待后重试，不影响同一worker内的其他item
+        设置了item_timeout的task超时时取消协程，视为异常
+        """
+        tasks = stage.tasks
 
-    def _exec_mp(self, item_iter, task: Task):
-        """多进程"""
-        task_func = getattr(self, task.func_name)
-        item_iter_fn = lambda: item_iter
-        with DataParallel(
+        async def _async_fn(item, *args, **kwargs):
+            if is_dropped(item):
+                return item
+            start = 0
+            if REPLAY_KEY in item:
+                start = replay_start(item)
+                if start is None:
+                    return item
+            for func, task in zip(funcs[start:], tasks[start:]):
+                attempt = 0
+                while True:
+                    if self.records_failures:
+                        clear_last_error()
+                    try:
+                        result = await asyncio.wait_for(
+                            func(item, *args, **kwargs), task.item_timeout
+                        )
+                        if task.kind == "flat_map" and result is not None:
+                            result = list(result)
+                    except Exception as err:
+                        if isinstance(err, asyncio.TimeoutError):
+                            metrics.add(kwargs.get("work_i", 0), "timeouts")
+                            err = ItemTimeout(f"item执行超过 {task.item_timeout} 秒")
+                        retry = task.retry
+                        if (
+                            retry is not None
+                            and isinstance(err, retry.exceptions)
+                            and attempt < retry.max_retries
+                        ):
+                            metrics.add(kwargs.get("work_i", 0), "retries")
+                            await asyncio.sleep(retry.delay(attempt))
+                            attempt += 1
+                            continue
+                        logger.error(
+                            "task执行失败 %s item: %s: %s", func.__name__, item, err
+                        )
+                        return self.failed(stage, task, item, err)
+                    break
+                if task.kind == "map":
+                    if not result:
+                        return self.failed(stage, task, item)
+                    item = result
+                elif task.kind == "filter":
+                    if not result:
+                        return self.drop(item, metrics, kwargs.get("work_i", 0))
+                elif result is None:
+                    return self.failed(stage, task, item)
+                else:
+                    return self.expand(item, result, metrics, kwargs.get("work_i", 0))
+            return item
+
+        return _async_fn
+
+    def batch_fn(self, stage: Stage, func, replay_start):
+        """batch任务执行函数，占位item及失败的task在之后stage的重跑item不传入func
+        整个batch异常时由DataParallel逐条执行，单条执行仍异常时返回占位
+        """
+
+        def _batch_fn(items, *args, **kwargs):
+            results = list(items)
+            index_list = [
+                i
+                for i, item in enumerate(items)
+                if not is_dropped(item)
+                and (REPLAY_KEY not in item or replay_start(item) is not None)
+            ]
+            if not index_list:
+                return results
+
+            err = None
+            if self.records_failures:
+                clear_last_error()
+            try:
+                outputs = func([items[i] for i in index_list], *args, **kwargs)
+            except Exception as _err:
+                if len(index_list) > 1:
+                    raise
+                err = _err
+                logger.error("item执行失败 item: %s: %s", items[index_list[0]], err)
+                outputs = [None]
+
+            if outputs is None or len(outputs) != len(index_list):
+                raise ValueError("batch结果数量与输入不一致")
+            for i, output in zip(index_list, outputs):
+                results[i] = output or self.failed(stage, stage.task, items[i], err)
+            return results
+
+        return _batch_fn
+
+    def stage_metrics(self, stage: Stage) -> StageMetrics:
+        """stage的运行指标，多次调用main()时累计"""
+        if stage.name not in self.metrics:
+            task = stage.task
+            slot_num = max(task.work_num, task.max_work_num or 0)
+            self.metrics[stage.name] = StageMetrics(slot_num)
+        return self.metrics[stage.name]
+
+    def metrics_snapshot(self) -> dict:
+        """当前各stage的运行指标快照"""
+        return snapshot(self.metrics)
+
+    def data_parallel(self, stage: Stage, item_iter_fn=None) -> DataParallel:
+        task = stage.task
+        return DataParallel(
             item_iter_fn=item_iter_fn,
             work_num=task.work_num,
-            process_fn=task_func,
+            process_fn=self.stage_fn(stage),
             dummy=task.dummy,
-        ) as _item_iter:
+            chunk_size=task.chunk_size,
+            batch_size=task.batch_size,
+            max_wait_ms=task.max_wait_ms,
+            shm_threshold=task.shm_threshold,
+            concurrency=task.concurrency,
+            max_work_num=task.max_work_num,
+            cpu_budget=self._cpu_budget,
+            name=stage.name,
+            metrics=self.stage_metrics(stage),
+            profile=self._profile,
+            profile_dir=self._profile_dir,
+            init_fn=self.stage_init_fn(stage),
+            # async任务在async_fn中按task超时取消协程
+            item_timeout=task.item_timeout if task.mode == "sync" else None,
+        )
+
+    def _exec(self, item_iter, stage: Stage):
+        """单进程"""
+        stage_fn = self.stage_fn(stage)
+        metrics = self.stage_metrics(stage)
+        kwargs = {}
+        init_fn = self.stage_init_fn(stage)
+        if init_fn is not None:  # 主进程中只执行一次
+            if stage.name not in self.states:
+                self.states[stage.name] = init_fn(0)
+            kwargs["state"] = self.states[stage.name]
+        delayed = DelayQueue()  # 等待重试的item，输入间隙中执行到期的
+        local = metrics.local(0)  # 本地累计，定期写入共享内存
+
+        def run(item, resume=None):
+            """执行单个item，进入延迟队列时返回DEFERRED"""
+            start = time.time()
+            try:
+                result = stage_fn(item, **kwargs) if resume is None else resume()
+            except Deferred as deferred:
+                delayed.push(deferred.delay, deferred.resume)
+                return DEFERRED
+            now = time.time()
+            cost = now - start
+            local.observe(cost)
+            errors = DataParallel.error_num([item], [result])
+            local.record(now, 0, 1, errors, cost, 0, 0)
+            return result
+
+        def run_due():
+            for resume in delayed.pop_due():
+                result = run(None, resume)
+                if type(result) is Many:
+                    yield from result
+                elif result is not DEFERRED:
+                    yield result
+
+        try:
+            for item in item_iter:
+                if delayed:
+                    yield from run_due()
+                local.add("items_in")
+                result = run(item)
+                if type(result) is Many:
+                    yield from result
+                elif result is not DEFERRED:
+                    yield result
+            while delayed:
+                time.sleep(delayed.timeout())
+                yield from run_due()
+        finally:
+            local.flush()
+
+    def _exec_mp(self, item_iter, stage: Stage):
+        """多进程，item_iter为数据迭代器fn列表时，每个fn一个输入进程"""
+        pool = self.pools.get(stage.name)
+        if pool is not None:  # 复用常驻进程池
+            if isinstance(item_iter, list):
+                item_iter = self.merge_shards(item_iter, stage.task.chunk_size)
+            yield from pool.imap(item_iter)
+            return
+
+        if isinstance(item_iter, list):
+            item_iter_fn = item_iter
+        else:
+            item_iter_fn = lambda: item_iter
+        with self.data_parallel(stage, item_iter_fn) as _item_iter:
             for index, item in enumerate(_item_iter):
                 yield item
 
-    def exec_task(self, item_iter, task: Task):
-        """执行单task"""
-        if task.work_num > 1:
-            item_iter = self._exec_mp(item_iter, task)
+    def merge_shards(self, item_iter_fns: list, chunk_size: int = 1):
+        """多个输入进程并行读取，合并为一个数据迭代器"""
+        with DataParallel(
+            item_iter_fn=item_iter_fns,
+            work_num=1,
+            process_fn=_identity,
+            dummy=True,
+            chunk_size=chunk_size,
+            name="read_shards",
+        ) as item_iter:
+            yield from item_iter
+
+    def exec_stage(self, item_iter, stage: Stage):
+        """执行单stage"""
+        if stage.task.parallel:
+            item_iter = self._exec_mp(item_iter, stage)
         else:
-            item_iter = self._exec(item_iter, task)
+            if isinstance(item_iter, list):  # 单进程stage前合并分片
+                item_iter = self.merge_shards(item_iter, stage.task.chunk_size)
+            item_iter = self._exec(item_iter, stage)
 
         return item_iter
 
+    def exec_task(self, item_iter, task: Task):
+        """执行单task"""
+        return self.exec_stage(item_iter, Stage([task]))
+
+    def get_tasks(self) -> List[Task]:
+        """当前类的task列表"""
+        tasks = [
+            task
+            for task in TASK_LIST
+            if task.class_name == self.__class__.__name__
+            and hasattr(self, task.func_name)
+        ]
+        for task in tasks:
+            # err_catch在add_task外层时，捕获异常后返回None，retry不会触发
+            if task.retry is not None and is_err_caught(getattr(self, task.func_name)):
+                raise ValueError(
+                    f"retry task must not be wrapped by err_catch: {task.func_name}"
+                )
+        return tasks
+
+    def get_stages(self) -> List[Stage]:
+        """执行计划，相邻的兼容task融合为一个stage"""
+        return fuse_tasks(self.get_tasks())
+
     def exec_tasks(self, item_iter):
         """执行多task， TASK_LIST中上一个task的输出是下一个task的输入"""
-        for task in TASK_LIST:
-            if task.class_name != self.__class__.__name__:
-                continue
-            if not hasattr(self, task.func_name):
-                continue
-            item_iter = self.exec_task(item_iter, task)
+        for stage in self.get_stages():
+            item_iter = self.exec_stage(item_iter, stage)
 
+        if isinstance(item_iter, list):  # 没有task
+            item_iter = self.merge_shards(item_iter)
         return item_iter
 
-    def print_task(self):
-        num = 0
-        for task in TASK_LIST:
-            if task.class_name != self.__class__.__name__:
-                continue
-            num += 1
-            logger.info("task_%s: %s", num, task)
-
-    def _keep_order(self, item_iter):
-        max_work_nums = get_max_work_nums()  # 任务中最大进程数量
-        heap_items = []
-        order_id = 0  # 当前应该返回的item id
-
-        def get_order_item(item):
-            nonlocal order_id
+    def exec_remote(self, item_iter, broker: Broker):
+        """多机执行: 数据经broker分发给各worker主机执行全部task"""
+        if isinstance(item_iter, list):
+            item_iter = self.merge_shards(item_iter)
+        return broker.run(item_iter, self.__class__.__name__)
+
+    def run_worker(
+        self,
+        address,
+        authkey: bytes,
+        credit: int = 64,
+        timeout: float = 60,
+    ) -> int:
+        """worker主机: 连接driver的broker，执行本类的全部task，直到driver的main()结束
 
-            # 当前 item 顺序正确，直接返回
-            if item["__origin_id"] == order_id:
-                order_id += 1
-                return item
-
-            # 当前 item 顺序不正确，放入堆中
-            heapq.heappush(heap_items, (item["__origin_id"], item))
-            # 从堆中取出一个 h_item
-            _, h_item = heapq.heappop(heap_items)
-            if h_item["__origin_id"] == order_id:
-                order_id += 1
-                return h_item
+        Args:
+            address ([tuple]): [broker地址 (host, port)]
+            authkey ([bytes]): [连接认证密钥，与Broker一致]
+            credit ([int]): [最多同时处理的item数量]
+            timeout ([float]): [连接broker的超时时间(秒)]
 
-            # h_item 顺序也不正确，再次放入堆中
-            heapq.heappush(heap_items, (h_item["__origin_id"], h_item))
+        Returns:
+            [int]: [处理的item数量]
+        """
+        self.print_task()
+        self._remote = True
+        return run_worker(self, address, authkey, credit, timeout)
 
-            # heap_items 累积过多 items 时，强制更改 order_id
-            if len(heap_items) >= max_work_nums + 3:
-                _, h_item = heapq.heappop(heap_items)
-                order_id = h_item["__origin_id"]
-                return h_item
+    def print_task(self):
+        num = 0
+        for stage_num, stage in enumerate(self.get_stages(), 1):
+            logger.info("stage_%s: %s", stage_num, stage.name)
+            for task in stage.tasks:
+                num += 1
+                logger.info("  task_%s: %s", num, task)
 
+    def _keep_order(self, item_iter):
+        """按 __origin_id 严格保序，内存中最多缓存order_window个item"""
+        skip = self.checkpoint.is_resumed if self.checkpoint is not None else None
+        buffer = ReorderBuffer(self.order_window, skip=skip)
+
+        last_root = None  # flat_map派生的item，每个根item只释放一次窗口
+
+        def release(items):
+            nonlocal last_root
+            for item in items:
+                root = root_id(item["__origin_id"])
+                if self._order_window is not None and root != last_root:
+                    self._order_window.release(root)
+                last_root = root
+                if not is_dropped(item):
+                    yield item
+
+        try:
+            for item in item_iter:
+                yield from release(buffer.push(item))
+            yield from release(buffer.pop_all())
+        finally:
+            buffer.close()
+
+    def checkpoint_data(self, item_iter):
+        """记录已完成的item
+        item交给save_data时标记完成，save_data请求下一个item时上一个item已处理完，此时提交
+        """
         for item in item_iter:
-            _item = get_order_item(item)
-            if _item:
-                yield _item
+            self.checkpoint.maybe_commit()
+            self.checkpoint.mark(item["__origin_id"], item.get(WEIGHT_KEY))
+            yield item
+
+    def checkpoint_sink(self, file_path: str) -> CheckpointSink:
+        """save_data中使用的输出文件，与checkpoint一起提交，续跑时输出不重复
 
-        while heap_items:
-            _, h_item = heapq.heappop(heap_items)
-            yield h_item
+        Args:
+            file_path ([str]): [输出文件路径]
+        """
+        return CheckpointSink(file_path, self.checkpoint)
 
     def rm_keys(self, item_iter):
         """去掉多余key"""
         for item in item_iter:
             item.pop("__origin_id")
+            item.pop(WEIGHT_KEY, None)
             yield item
 
     @timer("main")
     @interrupt_catch
-    def main(self, offset: int = 0, head_num: int = None):
+    def main(
+        self,
+        offset: int = 0,
+        head_num: int = None,
+        profile=None,
+        resume=False,
+        broker: Broker = None,
+        replay_failures: str = None,
+    ):
         """主函数
 
         Args:
             offset (int, optional): 偏移量. Defaults to 0.
             head_num (int, optional): 要跑的数据总量. Defaults to None.
+            profile (bool, str, optional): 性能分析，True/"sample"为采样分析，"cprofile"为确定性分析.
+                结束后每个stage合并为一个文件，写入环境变量FLOWDATA_PROFILE_DIR指定的目录(默认./profile).
+                Defaults to None，此时读取环境变量FLOWDATA_PROFILE.
+            resume (bool, optional): 从checkpoint续跑，跳过已完成的item，需设置checkpoint_path. Defaults to False.
+            broker (Broker, optional): 多机执行，task由连接到broker的worker主机执行(run_worker)，
+                本机只执行get_data、save_data. Defaults to None.
+            replay_failures (str, optional): 死信文件路径，只重跑其中的item(不调用get_data)，每个item从失败的task开始执行，
+                item按文件顺序重新编号 __origin_id，仍失败的item写入dead_letter_path，不使用checkpoint. Defaults to None.
         """
         self.print_task()
-        item_iter = self.get_data()
-        item_iter = self.clip_data(item_iter, offset, head_num)
-        item_iter = self.exec_tasks(item_iter)
-        item_iter = self.count_data(item_iter)
+        self.checkpoint = None
+        if replay_failures:
+            if resume:
+                raise ValueError("replay_failures 不支持 resume=True")
+            if self.dead_letter_path and os.path.abspath(
+                self.dead_letter_path
+            ) == os.path.abspath(replay_failures):
+                raise ValueError("replay_failures 不能与 dead_letter_path 为同一文件")
+        elif self.checkpoint_path:
+            self.checkpoint = Checkpoint(self.checkpoint_path, self.checkpoint_interval)
+            if resume:
+                self.checkpoint.load(offset)
+                self.counter["skip_num"] = self.checkpoint.resumed_num
+            else:
+                self.checkpoint.reset(offset)
+        elif resume:
+            raise ValueError("resume=True 需要设置 checkpoint_path")
+
+        self.dead_letter = None
+        if self.dead_letter_path:
+            self.dead_letter = DeadLetter(self.dead_letter_path)
 
         if self.keep_order:
-            item_iter = self._keep_order(item_iter)
-
-        item_iter = self.rm_keys(item_iter)
-        self.save_data(item_iter)
+            self._order_window = OrderWindow(self.order_window)
+
+        stages = self.get_stages()
+        if any(stage.task.max_work_num for stage in stages):
+            # 扩容预算: 总预算减去各stage的最小进程数
+            min_work_num = sum(stage.task.work_num for stage in stages)
+            self._cpu_budget = CpuBudget(self.cpu_budget - min_work_num)
+
+        self._profile, self._profile_dir = get_mode(profile), get_dir()
+        if self._profile and self.pools:
+            logger.warning("常驻进程池在warm()时启动，不做性能分析")
+
+        for task in self.get_tasks():
+            if task.cache is not None:
+                task.cache.conn  # 在主进程中建表，避免各worker同时初始化
+
+        reporter = None
+        for stage in stages:
+            self.stage_metrics(stage)
+        if self.metrics_path:
+            reporter = MetricsReporter(
+                self.metrics, self.metrics_path, self.metrics_interval
+            )
+            reporter.start()
+
+        try:
+            # 主进程中执行get_data、单进程stage及save_data
+            with profiling(self._profile, self._profile_dir, "main", "main"):
+                if replay_failures:
+                    item_iter = read_failures(replay_failures, stages)
+                    skip_num, start_id = offset, 0
+                else:
+                    item_iter, skip_num, start_id = self.read_data(offset, head_num)
+                if isinstance(item_iter, ShardedReader):
+                    item_iter = self.clip_shards(
+                        item_iter, skip_num, head_num, start_id
+                    )
+                else:
+                    item_iter = self.clip_data(item_iter, skip_num, head_num, start_id)
+                if broker is not None:
+                    item_iter = self.exec_remote(item_iter, broker)
+                else:
+                    item_iter = self.exec_tasks(item_iter)
+                item_iter = self.count_data(item_iter)
+
+                if self.keep_order:
+                    item_iter = self._keep_order(item_iter)
+
+                if self.checkpoint is not None:
+                    item_iter = self.checkpoint_data(item_iter)
+
+                item_iter = self.rm_keys(item_iter)
+                self.save_data(item_iter)
+
+                if self.checkpoint is not None:
+                    self.checkpoint.commit()  # 正常结束时提交全部
+        finally:
+            if self.dead_letter is not None:
+                self.dead_letter.flush()
+                if self.dead_letter.num:
+                    logger.info(
+                        "失败的item %s 条已写入 %s",
+                        self.dead_letter.num,
+                        self.dead_letter_path,
+                    )
+            if reporter is not None:
+                reporter.stop()
+                logger.info("运行指标已写入 %s.json/.prom", self.metrics_path)
+            if self._profile:
+                self.merge_profiles(stages)
+
+        tasks = [task for stage in stages for task in stage.tasks]
+        for field, key, enabled in [
+            ("cache_hits", "cache_hit", any(task.cache for task in tasks)),
+            ("cache_misses", "cache_miss", any(task.cache for task in tasks)),
+            ("retries", "retry_num", any(task.retry for task in tasks)),
+            ("timeouts", "timeout_num", any(task.item_timeout for task in tasks)),
+            ("filtered", "filter_num", any(task.kind != "map" for task in tasks)),
+        ]:
+            if enabled:
+                self.counter[key] = int(
+                    sum(self.metrics[stage.name].total(field) for stage in stages)
+                )
 
         print()
         logger.info("数据执行统计: %s", self.counter)
         logger.info("finish")
+
+    def merge_profiles(self, stages: List[Stage]):
+        """合并各进程的性能分析结果，每个stage一个文件"""
+        for name in ["main"] + [stage.name for stage in stages]:
+            path = merge_profiles(self._profile, self._profile_dir, name)
+            if path:
+                logger.info("性能分析结果已写入 %s", path)
+        self._profile = None
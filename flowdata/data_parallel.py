@@ -1,14 +1,49 @@
+import asyncio
+import itertools
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
 from enum import Enum
+from multiprocessing.sharedctypes import RawArray
+from queue import Empty
 from typing import List
 
+from ._logger import logger
+from ._shm import ShmQueue
+from .autoscale import AutoScaler, CpuBudget
+from .deadletter import failure_record
 from .decorator import interrupt_catch
+from .metrics import LocalMetrics, StageMetrics
+from .profiler import profiling
+from .reorder import WEIGHT_KEY, dropped, is_dropped, is_failed
+from .retry import Deferred, DelayQueue
+from .watchdog import Alarm, ItemTimeout, Ledger, Watchdog
 
 
 class FLAG(Enum):
     END = "[end]"  # 进程结束标志
+    STOP = "[stop]"  # 缩容时单个进程退出标志
 
 
 MAX_QUEUE_SIZE = 3
+NO_DEADLINE = nullcontext()  # 未设置item_timeout时复用
+NONE = itertools.repeat(
+    None
+)  # 与chunk组成 (seq, data, resume)，不需要为每个item构造元组
+
+
+class WorkerReplaced(Exception):
+    """线程模式下item执行超时的线程已被替换，执行结束后直接退出"""
+
+
+class WorkerInitError(RuntimeError):
+    """worker的init_fn执行失败，经queue_out传给主进程后抛出"""
+
+
+class Many(list):
+    """process_fn的多个结果，worker展开后输出，为空时该item不输出"""
 
 
 class DataParallel:
@@ -21,88 +56,689 @@ class DataParallel:
         process_fn: callable,
         dummy: bool = False,
         *args,
-        **kwargs
+        chunk_size: int = 1,
+        batch_size: int = 1,
+        max_wait_ms: float = 10,
+        shm_threshold: int = None,
+        concurrency: int = 100,
+        max_work_num: int = None,
+        cpu_budget: CpuBudget = None,
+        scale_interval: float = 1,
+        name: str = None,
+        metrics: StageMetrics = None,
+        profile: str = None,
+        profile_dir: str = None,
+        init_fn: callable = None,
+        item_timeout: float = None,
+        **kwargs,
     ):
         """[summary]
 
         Args:
-            item_iter_fn ([callable]): [输入数据迭代器fn]
+            item_iter_fn ([callable, List[callable]]): [输入数据迭代器fn，为列表时每个fn一个输入进程]
             work_num ([int]): [执行任务进程数量]
             process_fn (callable): [执行函数,外部传入]
             dummy (bool): [False是多进程，True则是多线程]
+            chunk_size (int): [每次经queue传输的item数量，增大可减少序列化及加锁次数]
+            batch_size (int): [大于1时开启batch模式，process_fn输入item列表，返回等长结果列表]
+            max_wait_ms (float): [batch模式下组batch的最长等待时间(毫秒)，超时后不满batch_size也执行]
+            shm_threshold (int): [多进程模式下，不小于该字节数的bytes、numpy数组等经共享内存传输，None不开启]
+            concurrency (int): [process_fn为协程函数时，每个worker内的最大并发数]
+            max_work_num (int): [大于work_num时开启自动扩缩容，进程数量在work_num与max_work_num之间调整]
+            cpu_budget (CpuBudget): [全局扩容预算]
+            scale_interval (float): [扩缩容决策间隔(秒)]
+            name (str): [名称，用于日志]
+            metrics (StageMetrics): [运行指标，None时内部创建]
+            profile (str): [性能分析模式 sample/cprofile，None不开启]
+            profile_dir (str): [性能分析结果输出目录]
+            init_fn (callable): [每个worker开始取数据前调用一次 init_fn(work_i)，返回值作为state参数传给process_fn，
+                用于每个进程只加载一次模型、数据库连接等资源]
+            item_timeout (float): [同步process_fn执行单个item的超时时间(秒)，超时的item结果为占位，None不限制]
         """
         self.dummy = dummy
         if dummy:
-            from multiprocessing.dummy import Manager, Queue, Process
+            from multiprocessing.dummy import Barrier, Event, Process, Queue
         else:
-            from multiprocessing import Manager, Queue, Process
+            from multiprocessing import Barrier, Event, Process, Queue
 
         self.Process = Process
-        self.Manager = Manager
+        self.Barrier = Barrier
+        self.Event = Event
 
         self.item_iter_fn = item_iter_fn
         self.work_num = work_num
         self.process_fn = process_fn
+        self.chunk_size = max(1, chunk_size)
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.concurrency = max(1, concurrency)
+        self.max_work_num = max_work_num or work_num
+        self.cpu_budget = cpu_budget
+        self.scale_interval = scale_interval
+        self.name = name or getattr(process_fn, "__name__", "")
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.init_fn = init_fn
+        self.states = {}  # 各worker的init_fn返回值 work_i: state
+        self.item_timeout = item_timeout
         self.args = args
         self.kwargs = kwargs
 
+        self.queue_size = MAX_QUEUE_SIZE
         self.queue_in = Queue(MAX_QUEUE_SIZE)  # 接收数据的queue
         self.queue_out = Queue(MAX_QUEUE_SIZE)  # 数据处理后输出queue
+        if shm_threshold is not None and not dummy:
+            self.queue_in = ShmQueue(self.queue_in, shm_threshold)
+            self.queue_out = ShmQueue(self.queue_out, shm_threshold)
         self.p_list: List[self.Process] = []
+        slot_num = max(self.work_num, self.max_work_num)
+        # 各进程的运行指标，累计执行耗时同时用于计算利用率
+        self.metrics = metrics or StageMetrics(slot_num)
+        self.alive = RawArray("b", slot_num)  # 各进程索引是否在运行
+        self.scaler: AutoScaler = None
+        # item_timeout: 各worker当前item的开始时间(0为空闲)、__origin_id、ledger中的seq，被替换的次数
+        self.started = RawArray("d", slot_num)
+        self.current = RawArray("q", slot_num)
+        self.position = RawArray("q", slot_num)
+        self.generation = RawArray("i", slot_num)
+        self.ledgers = {}  # 线程模式下各worker的Ledger work_i: Ledger
+        self.ledger_dir = None  # 多进程模式下Ledger的记录文件目录
+        if item_timeout is not None and self.batch_size == 1 and not dummy:
+            self.ledger_dir = tempfile.TemporaryDirectory(prefix="flowdata_ledger_")
+        self.workers = {}  # 各进程索引对应的进程 work_i: Process
+        self.watchdog: Watchdog = None
+        self.serving = False  # 是否为常驻模式
+        self.run_lock = threading.Lock()  # 常驻模式下，同一时刻只处理一轮数据
+        self.abort = threading.Event()  # 线程模式下提前退出时通知输入线程停止
+
+    def put_chunks(self, item_iter, stop_event=None):
+        """数据按chunk_size分块放入队列"""
+        chunk = []
+        for item in item_iter:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                self.queue_in.put(chunk)
+                chunk = []
+            if stop_event is not None and stop_event.is_set():
+                return
+        if chunk:
+            self.queue_in.put(chunk)
 
     @interrupt_catch
     def recv_data(self):
         """数据放入队列"""
-        for item in self.item_iter_fn():
-            self.queue_in.put(item)
+        with profiling(self.profile, self.profile_dir, self.name, "feeder"):
+            self.put_chunks(self.item_iter_fn(), self.feeder_stop)
         self.queue_in.put(FLAG.END)  # 队列放入终止标志
 
+    @interrupt_catch
+    def recv_shard(self, shard_i: int):
+        """多输入进程模式下，单个分片的数据放入队列"""
+        with profiling(self.profile, self.profile_dir, self.name, f"feeder{shard_i}"):
+            self.put_chunks(self.item_iter_fn[shard_i](), self.feeder_stop)
+
+    @property
+    def feeder_stop(self):
+        """多进程模式下提前退出时直接结束输入进程，不需要检查"""
+        return self.abort if self.dummy else None
+
+    def end_shards(self, feeders: list):
+        """所有输入进程结束后放入终止标志"""
+        for p in feeders:
+            p.join()
+        self.queue_in.put(FLAG.END)
+
+    def start_feeders(self):
+        """启动接收数据进程"""
+        if callable(self.item_iter_fn):
+            recv_p = self.Process(target=self.recv_data)
+            recv_p.start()
+            self.p_list.append(recv_p)
+            return
+
+        feeders = []
+        for shard_i in range(len(self.item_iter_fn)):
+            p = self.Process(target=self.recv_shard, args=(shard_i,))
+            p.start()
+            feeders.append(p)
+        self.p_list.extend(feeders)
+        threading.Thread(target=self.end_shards, args=(feeders,), daemon=True).start()
+
     def send_data(self):
-        """数据从队列取出"""
+        """数据从队列取出，并拆分chunk
+        每个进程结束时各放入一个终止标志，终止标志在该进程的数据之后，收齐后结束
+        """
+        done_num = 0
+        while done_num < self.work_num:
+            chunk = self.queue_out.get(block=True, timeout=None)
+            if chunk == FLAG.END:
+                done_num += 1
+                continue
+            if type(chunk) is WorkerInitError:
+                raise chunk
+            yield from chunk
+
+    def iter_chunks(self, relay_end: bool = True, delayed: DelayQueue = None):
+        """从queue_in中取数据，直到遇到终止标志
+        batch模式下按batch_size重新组块，首个item等待超过max_wait_ms时不满batch_size也返回
+        delayed中有等待重试的item时，到期时返回空chunk，输入结束后等待其全部执行完
+
+        Args:
+            relay_end (bool): 是否将终止标志放回队列，通知其他进程退出
+            delayed (DelayQueue): 本worker的延迟重试队列
+        """
+        if self.batch_size <= 1:
+            while True:
+                timeout = delayed.timeout() if delayed else None
+                try:
+                    chunk = self.queue_in.get(block=True, timeout=timeout)
+                except Empty:  # 有到期的重试item
+                    yield []
+                    continue
+                if chunk == FLAG.STOP:
+                    break
+                if chunk == FLAG.END:
+                    if relay_end:
+                        self.queue_in.put(FLAG.END)  # 解决多进程退出问题
+                    break
+                yield chunk
+
+            while delayed:  # 退出前执行完本worker的重试item
+                time.sleep(delayed.timeout())
+                yield []
+            return
+
+        buffer, deadline = [], None
+        while True:
+            timeout = None
+            if buffer:
+                deadline = deadline or time.time() + self.max_wait
+                timeout = max(0, deadline - time.time())
+
+            try:
+                chunk = self.queue_in.get(block=True, timeout=timeout)
+            except Empty:  # 等待超时，不满batch_size也执行
+                yield buffer
+                buffer, deadline = [], None
+                continue
+
+            if chunk == FLAG.STOP:
+                break
+            if chunk == FLAG.END:
+                if relay_end:
+                    self.queue_in.put(FLAG.END)  # 解决多进程退出问题
+                break
+
+            buffer.extend(chunk)
+            while len(buffer) >= self.batch_size:
+                yield buffer[: self.batch_size]
+                buffer, deadline = buffer[self.batch_size :], None
+
+        if buffer:
+            yield buffer
+
+    def init_worker(self, work_i: int):
+        """worker启动时执行init_fn，异常时抛出WorkerInitError"""
+        if self.init_fn is None:
+            return
+        start = time.time()
+        try:
+            self.states[work_i] = self.init_fn(work_i)
+        except Exception as err:
+            logger.exception("worker[%s] init_fn执行失败 %s", work_i, self.name)
+            raise WorkerInitError(
+                f"worker[{work_i}] {self.name} init_fn执行失败: {type(err).__name__}: {err}"
+            ) from err
+        logger.info(
+            "worker[%s] init_fn执行完成 %s，耗时 %.3f 秒",
+            work_i,
+            self.name,
+            time.time() - start,
+        )
+
+    def worker_kwargs(self, work_i: int) -> dict:
+        """传给process_fn的关键字参数"""
+        kwargs = dict(self.kwargs, work_i=work_i)
+        if self.init_fn is not None:
+            kwargs["state"] = self.states.get(work_i)
+        return kwargs
+
+    def process_batch(self, batch: list, work_i: int) -> list:
+        """batch模式执行
+        整个batch执行失败时，逐条执行定位异常item，异常item结果为None
+        """
+        kwargs = self.worker_kwargs(work_i)
+        try:
+            results = self.process_fn(batch, *self.args, **kwargs)
+            if results is None or len(results) != len(batch):
+                raise ValueError("batch结果数量与输入不一致")
+            return list(results)
+        except Exception as err:
+            logger.warning("batch执行失败，逐条执行定位异常item: %s", err)
+
+        results = []
+        for data in batch:
+            try:
+                result = self.process_fn([data], *self.args, **kwargs)
+                results.append(result[0] if result else None)
+            except Exception as err:
+                logger.error("item执行失败 item: %s: %s", data, err)
+                results.append(None)
+        return results
+
+    async def async_work_loop(self, work_i: int, relay_end: bool = True):
+        """异步模式: worker内运行事件循环，最多concurrency个item同时执行"""
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        chunks = self.iter_chunks(relay_end)
+        results, tasks = [], set()
+        kwargs = self.worker_kwargs(work_i)
+
+        async def flush():
+            chunk = results[:]
+            results.clear()
+            start = time.time()
+            await loop.run_in_executor(None, self.queue_out.put, chunk)
+            self.metrics.add(work_i, "wait_out", time.time() - start)
+            self.metrics.add(work_i, "items_out", len(chunk))
+
+        async def run_item(data):
+            start = time.time()
+            try:
+                result = await self.process_fn(data, *self.args, **kwargs)
+            except Exception as err:
+                logger.error("item执行失败 item: %s: %s", data, err)
+                result = None
+            finally:
+                semaphore.release()
+
+            self.metrics.observe(work_i, time.time() - start)
+            self.metrics.add(work_i, "errors", self.error_num([data], [result]))
+            if type(result) is Many:
+                results.extend(result)
+            else:
+                results.append(result)
+            # 攒够chunk_size或当前没有执行中的item时输出
+            if len(results) >= self.chunk_size or len(tasks) <= 1:
+                await flush()
+
+        while True:
+            start = time.time()
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            self.metrics.add(work_i, "wait_in", time.time() - start)
+            if chunk is None:
+                break
+            self.metrics.add(work_i, "items_in", len(chunk))
+            for data in chunk:
+                await semaphore.acquire()
+                task = asyncio.ensure_future(run_item(data))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.wait(tasks)
+        if results:
+            await flush()
+
+    def work_loop(self, work_i: int, relay_end: bool = True, pending: list = None):
+        """处理queue_in中的数据，直到遇到终止标志
+
+        Args:
+            work_i ([int]): [进程索引]
+            relay_end ([bool]): [是否将终止标志放回队列]
+            pending ([list]): [被替换的worker中未开始执行的item，先于queue_in执行]
+        """
+        if asyncio.iscoroutinefunction(self.process_fn):
+            asyncio.run(self.async_work_loop(work_i, relay_end))
+            return
+
+        metrics = self.metrics.local(work_i)  # 本地累计，定期写入共享内存
+        try:
+            self.run_chunks(work_i, metrics, relay_end, pending)
+        finally:
+            metrics.flush()  # 在放入终止标志前写入，主进程读取到完整的指标
+
+    def run_chunks(
+        self, work_i: int, metrics: LocalMetrics, relay_end: bool, pending: list
+    ):
+        """work_loop的同步执行循环"""
+        kwargs = self.worker_kwargs(work_i)
+        generation = self.generation[work_i]
+        alarm = Alarm(self.item_timeout)
+        ledger = self.open_ledger(work_i)
+        # 只有设置item_timeout时worker会被watchdog替换，需要超时检查及替换检查
+        timed = self.item_timeout is not None
+        process_fn, args = self.process_fn, self.args
+        perf_counter = time.perf_counter
+        delayed = DelayQueue()
+        chunks = self.iter_chunks(relay_end, delayed)
+        if pending:
+            chunks = itertools.chain([pending], chunks)
         while True:
-            data = self.queue_out.get(block=True, timeout=None)
-            if data == FLAG.END:
+            start = time.time()
+            chunk = next(chunks, None)
+            now = time.time()
+            wait_in = now - start
+            if chunk is None:
+                metrics.add("wait_in", wait_in)
                 break
-            yield data
+            # 被替换的worker已统计
+            items_in = len(chunk) if chunk is not pending else 0
+
+            start, many = now, False
+            if self.batch_size > 1:  # batch模式下记录每个batch的耗时
+                results = self.process_batch(chunk, work_i)
+                metrics.observe(time.time() - start)
+                inputs = chunk
+            else:
+                # 到期的重试item先执行，抛出Deferred的item放入延迟队列，不阻塞后续item
+                if ledger is None:
+                    calls = zip(NONE, chunk, NONE)
+                else:
+                    with self.guard(work_i, generation, ledger):
+                        seqs = ledger.take(chunk)
+                    calls = zip(seqs, chunk, NONE)
+                if delayed:
+                    calls = itertools.chain(list(delayed.pop_due()), calls)
+                inputs, results = [], []
+                for seq, data, resume in calls:
+                    item_start = perf_counter()
+                    try:
+                        if not timed:
+                            result = (
+                                process_fn(data, *args, **kwargs)
+                                if resume is None
+                                else resume()
+                            )
+                        else:
+                            with self.deadline(work_i, data, alarm, seq):
+                                if resume is None:
+                                    result = process_fn(data, *args, **kwargs)
+                                else:
+                                    result = resume()
+                    except Deferred as deferred:
+                        if timed:
+                            with self.guard(work_i, generation, ledger):
+                                if ledger is not None:
+                                    ledger.settle(seq, None, deferred=True)
+                        delayed.push(deferred.delay, (seq, data, deferred.resume))
+                        continue
+                    except ItemTimeout as err:
+                        logger.error(
+                            "item执行超时 %s item: %s: %s", self.name, data, err
+                        )
+                        result = self.failed_result(data, err)
+                    if timed:
+                        # 线程模式下已被watchdog替换时退出
+                        with self.guard(work_i, generation, ledger):
+                            if ledger is not None:
+                                ledger.settle(seq, result)
+                    metrics.observe(perf_counter() - item_start)
+                    inputs.append(data)
+                    results.append(result)
+                    many = many or type(result) is Many
+            now = time.time()
+            busy, errors = now - start, self.error_num(inputs, results)
+            if many:
+                results = self.flatten(results)
+            if ledger is None and not results:
+                metrics.record(now, items_in, 0, errors, busy, wait_in, 0)
+                continue
+
+            start = now
+            if timed:
+                with self.guard(work_i, generation, ledger):
+                    if results:
+                        self.queue_out.put(results)
+                    if ledger is not None:
+                        ledger.sent()
+            else:
+                self.queue_out.put(results)
+            now = time.time()
+            metrics.record(
+                now, items_in, len(results), errors, busy, wait_in, now - start
+            )
+
+    def open_ledger(self, work_i: int) -> Ledger:
+        """设置item_timeout时，记录worker已取出、尚未输出的item，被替换时由主进程恢复"""
+        if self.item_timeout is None or self.batch_size > 1:
+            return None
+        if self.dummy:
+            ledger = self.ledgers[work_i] = Ledger()
+        else:
+            ledger = Ledger(self.ledger_path(work_i))
+        return ledger
+
+    def ledger_path(self, work_i: int) -> str:
+        return os.path.join(self.ledger_dir.name, f"worker{work_i}.pkl")
+
+    def guard(self, work_i: int, generation: int, ledger: Ledger):
+        """线程模式下与watchdog互斥地更新ledger，已被替换时抛出WorkerReplaced"""
+        if ledger is None:
+            if self.generation[work_i] != generation:
+                raise WorkerReplaced()
+            return NO_DEADLINE
+        return self._guard(work_i, generation, ledger)
+
+    @contextmanager
+    def _guard(self, work_i: int, generation: int, ledger: Ledger):
+        with ledger.lock:
+            if self.generation[work_i] != generation:
+                raise WorkerReplaced()
+            yield
+
+    def deadline(self, work_i: int, data, alarm: Alarm, seq: int = None):
+        """设置item_timeout时，记录当前item供watchdog检查，并在worker内定时中断"""
+        if self.item_timeout is None:
+            return NO_DEADLINE
+        return self._deadline(work_i, data, alarm, seq)
+
+    @contextmanager
+    def _deadline(self, work_i: int, data, alarm: Alarm, seq: int):
+        origin_id = data.get("__origin_id") if isinstance(data, dict) else None
+        # 只用于日志，flat_map派生的item记为-1
+        self.current[work_i] = origin_id if type(origin_id) is int else -1
+        self.position[work_i] = seq or 0
+        self.started[work_i] = time.time()
+        try:
+            with alarm:
+                yield
+        finally:
+            self.started[work_i] = 0
+            if alarm.fired:
+                self.metrics.add(work_i, "timeouts")
+
+    def failed_result(self, data, err: BaseException, keep_item: bool = True):
+        """超时或无法恢复的item的结果，FlowBase的item替换为带失败记录的占位
+
+        Args:
+            data ([dict]): [失败的item]
+            err ([BaseException]): [超时等异常]
+            keep_item ([bool]): [是否在失败记录中保存item，item可能已被部分修改时为False，不重跑]
+        """
+        if not isinstance(data, dict) or "__origin_id" not in data:
+            return None
+        origin_id, weight = data["__origin_id"], data.get(WEIGHT_KEY)
+        failure = failure_record(
+            self.name, None, data if keep_item else None, err, origin_id
+        )
+        return dropped(origin_id, failure, weight)
+
+    @staticmethod
+    def error_num(chunk: list, results: list) -> int:
+        """本次执行失败的item数量，上游已失败的占位及filter丢弃的item不计数"""
+        num = 0
+        for data, result in zip(chunk, results):
+            # 先检查结果，成功的item不需要再检查输入
+            if type(result) is Many:
+                if not is_dropped(data):
+                    num += sum(1 for r in result if not r or is_failed(r))
+            elif (not result or is_failed(result)) and not is_dropped(data):
+                num += 1
+        return num
+
+    @staticmethod
+    def flatten(results: list) -> list:
+        """展开Many结果"""
+        flat = []
+        for result in results:
+            if type(result) is Many:
+                flat.extend(result)
+            else:
+                flat.append(result)
+        return flat
 
     @interrupt_catch
-    def work(self, work_done_value, lock, work_i: int):
+    def work(self, work_i: int, pending: list = None):
         """[summary]
 
         Args:
-            work_done_value ([type]): [跟踪子进程是否结束]
             work_i ([int]): [进程索引id，外部任务可能用到]
+            pending ([list]): [被替换的worker中未开始执行的item]
         """
-        while True:
-            data = self.queue_in.get(block=True, timeout=None)
-            if data == FLAG.END:
-                self.queue_in.put(FLAG.END)  # 解决多进程退出问题
-                break
+        try:
+            with profiling(
+                self.profile, self.profile_dir, self.name, f"worker{work_i}"
+            ):
+                try:
+                    self.init_worker(work_i)
+                except WorkerInitError as err:
+                    self.fail(err)
+                else:
+                    self.work_loop(work_i, pending=pending)
+        except WorkerReplaced:
+            return
+        self.alive[work_i] = 0
+        self.queue_out.put(FLAG.END)  # 队列放入终止标志
 
-            data = self.process_fn(data, work_i=work_i, *self.args, **self.kwargs)
-            self.queue_out.put(data)
+    def fail(self, err: WorkerInitError, relay_end: bool = True):
+        """init_fn失败的worker: 通知主进程抛出异常，丢弃本轮输入直到终止标志，避免输入端阻塞
+        收到本轮的输入后才通知，常驻模式下不会被上一轮的排空读取
+        """
+        notified = False
+        for _ in self.iter_chunks(relay_end):
+            if not notified:
+                self.queue_out.put(err)
+                notified = True
+        if not notified:
+            self.queue_out.put(err)
+
+    def live_num(self) -> int:
+        """运行中的进程数量"""
+        return sum(self.alive)
 
-        with lock:
-            work_done_value.value += 1
+    def start_worker(self, work_i: int, pending: list = None):
+        """启动索引为work_i的处理数据进程，pending为被替换的worker中未开始执行的item"""
+        if self.serving:
+            p = self.Process(
+                target=self.serve,
+                args=(self.barrier, self.stop_event, work_i, pending),
+            )
+            p.daemon = True
+        else:
+            p = self.Process(target=self.work, args=(work_i, pending))
+        p.start()
+        self.p_list.append(p)
+        self.workers[work_i] = p
 
-            if work_done_value.value >= self.work_num:
-                self.queue_out.put(FLAG.END)  # 队列放入终止标志
+    def add_worker(self):
+        """启动一个处理数据进程，使用空闲的进程索引"""
+        work_i = list(self.alive).index(0)
+        self.alive[work_i] = 1
+        self.work_num += 1  # send_data按启动的进程总数统计终止标志
+        self.start_worker(work_i)
 
-    def run(self):
-        m = self.Manager()
+    def replace_worker(self, work_i: int, started: float):
+        """item执行超时: 杀死(线程模式下放弃)该worker，在同一索引上启动新的worker，新worker代替其发送终止标志
+        被替换worker中已取出、尚未输出的item: 超时的item输出失败占位，未开始执行的item交给新的worker，
+        线程模式下已执行完的输出结果、等待重试的输出失败占位；多进程模式下其余item均由新的worker重新执行
+
+        Args:
+            work_i ([int]): [进程索引]
+            started ([float]): [超时item的开始时间，与当前不一致时说明已执行完，不再替换]
+        """
+        if self.started[work_i] != started:
+            return
+        seq = self.position[work_i]
+        self.generation[work_i] += 1
+        p = self.workers.pop(work_i)
+        if not self.dummy:
+            p.kill()
+        p.join(timeout=0 if self.dummy else None)
+        self.p_list.remove(p)
+        self.started[work_i] = 0
+
+        err = ItemTimeout(f"item执行超过 {self.item_timeout} 秒，worker已被替换")
+        outputs, pending = self.recover(work_i, seq, err)
+        self.metrics.add(work_i, "timeouts")
+        self.metrics.add(
+            work_i, "errors", sum(1 for r in outputs if not r or is_failed(r))
+        )
+        self.metrics.add(work_i, "items_out", len(outputs))
+        if outputs:
+            self.queue_out.put(outputs)
+        self.start_worker(work_i, pending)
+
+    def recover(self, work_i: int, seq: int, err: ItemTimeout):
+        """读取被替换worker的ledger，返回需要输出的结果及交给新worker的item
+
+        Args:
+            work_i ([int]): [进程索引]
+            seq ([int]): [超时item在ledger中的seq]
+            err ([ItemTimeout]): [超时异常]
+        """
+        if self.dummy:
+            # 加锁读取，被放弃的线程之后更新ledger前会发现已被替换而退出
+            ledger = self.ledgers.pop(work_i)
+            with ledger.lock:
+                items, results = dict(ledger.items), dict(ledger.results)
+                deferred = set(ledger.deferred)
+        else:
+            items, results, deferred = Ledger.load(self.ledger_path(work_i)), {}, set()
 
+        lost = RuntimeError("worker已被替换，等待重试的item无法恢复")
+        outputs, pending = [], []
+        for i, data in items.items():
+            if i in results:
+                outputs.append(results[i])
+            elif i == seq:
+                # 线程模式下item可能已被部分修改，不保存，不重跑
+                outputs.append(self.failed_result(data, err, not self.dummy))
+            elif i in deferred:
+                outputs.append(self.failed_result(data, lost, False))
+            else:
+                pending.append(data)
+        return self.flatten(outputs), pending
+
+    def remove_worker(self):
+        """通知任意一个处理数据进程退出"""
+        self.queue_in.put(FLAG.STOP)
+
+    def start_watchdog(self):
+        if self.item_timeout is not None:
+            self.watchdog = Watchdog(self, self.item_timeout, self.name)
+            self.watchdog.start()
+
+    def run(self):
         # 接收数据进程
-        recv_p = self.Process(target=self.recv_data)
-        recv_p.start()
-        self.p_list.append(recv_p)
+        self.start_feeders()
 
         # 处理数据进程
-        work_done_value = m.Value("i", 0)
-        lock = m.Lock()
-        for work_i in range(self.work_num):
-            p = self.Process(target=self.work, args=(work_done_value, lock, work_i))
-            p.start()
-            self.p_list.append(p)
+        work_num, self.work_num = self.work_num, 0
+        for _ in range(work_num):
+            self.add_worker()
+
+        if self.max_work_num > work_num:
+            self.scaler = AutoScaler(
+                self,
+                work_num,
+                self.max_work_num,
+                self.cpu_budget,
+                self.scale_interval,
+                self.name,
+            )
+            self.scaler.start()
+        self.start_watchdog()
 
         for i in self.send_data():
             yield i
@@ -111,8 +747,131 @@ class DataParallel:
         return self.run()
 
     def __exit__(self, *args, **kwargs):
+        if self.scaler is not None:
+            self.scaler.stop()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        self.abort.set()
         # 结束所有进程
         for p in self.p_list:
             if not self.dummy and p.is_alive():
                 p.terminate()  # 终止活跃进程
-            p.join()  # 等待进程结束
+            self.join(p)  # 等待进程结束
+        self.cleanup()
+
+    def join(self, p):
+        """等待进程结束，线程模式下提前退出时(如worker异常)取出queue_out中的数据，避免线程阻塞在put"""
+        while True:
+            p.join(timeout=None if not self.dummy else 0.1)
+            if not p.is_alive():
+                return
+            try:
+                while True:
+                    self.queue_out.get_nowait()
+            except Empty:
+                pass
+
+    @interrupt_catch
+    def serve(self, barrier, stop_event, work_i: int, pending: list = None):
+        """常驻进程: 每轮数据处理完后确认，直到close()；init_fn失败时每轮都通知主进程抛出异常"""
+        try:
+            self.init_worker(work_i)
+            failed = None
+        except WorkerInitError as err:
+            failed = err
+        while True:
+            try:
+                if failed is not None:
+                    self.fail(failed, relay_end=False)
+                else:
+                    self.work_loop(work_i, relay_end=False, pending=pending)
+            except WorkerReplaced:
+                return
+            pending = None
+            barrier.wait()  # 每个进程只消费本轮的一个终止标志
+            stop = stop_event.is_set()
+            self.queue_out.put(FLAG.END)  # 本轮结束确认
+            if stop:
+                break
+
+    def start(self):
+        """启动常驻进程"""
+        self.barrier = self.Barrier(self.work_num)
+        self.stop_event = self.Event()
+        self.serving = True
+        for work_i in range(self.work_num):
+            self.start_worker(work_i)
+        self.start_watchdog()
+        return self
+
+    def feed(self, item_iter, stop_event, errors: list):
+        """常驻模式下的数据输入线程"""
+        try:
+            self.put_chunks(item_iter, stop_event)
+        except Exception as err:
+            errors.append(err)
+        finally:
+            for _ in range(self.work_num):
+                self.queue_in.put(FLAG.END)
+
+    def imap(self, item_iter):
+        """常驻模式下处理一轮数据
+
+        Args:
+            item_iter ([iter]): [输入数据迭代器]
+        """
+        with self.run_lock:
+            stop_event, errors = threading.Event(), []
+            feeder = threading.Thread(
+                target=self.feed, args=(item_iter, stop_event, errors), daemon=True
+            )
+            feeder.start()
+
+            done_num = 0
+            try:
+                while done_num < self.work_num:
+                    chunk = self.queue_out.get(block=True, timeout=None)
+                    if chunk == FLAG.END:
+                        done_num += 1
+                        continue
+                    if type(chunk) is WorkerInitError:
+                        raise chunk
+                    yield from chunk
+            finally:
+                # 提前退出时，停止输入并排空本轮数据，保证下一轮可用
+                stop_event.set()
+                while done_num < self.work_num:
+                    if self.queue_out.get(block=True, timeout=None) == FLAG.END:
+                        done_num += 1
+                feeder.join()
+
+            if errors:
+                raise errors[0]
+
+    def close(self):
+        """关闭常驻进程"""
+        if not self.p_list:
+            return
+        self.stop_event.set()
+        try:
+            for _ in self.imap([]):
+                pass
+        except WorkerInitError:  # 已在之前的轮次中抛出
+            pass
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        for p in self.p_list:
+            p.join(timeout=5)
+            if not self.dummy and p.is_alive():
+                p.terminate()
+                p.join()
+        self.p_list = []
+        self.cleanup()
+
+    def cleanup(self):
+        """进程结束后删除未被消费的共享内存及ledger文件"""
+        for queue in (self.queue_in, self.queue_out):
+            if isinstance(queue, ShmQueue):
+                queue.cleanup()
+        if self.ledger_dir is not None:
+            self.ledger_dir.cleanup()
@@ -0,0 +1,128 @@
+"""
+失败item的死信记录: task异常、返回None、重试耗尽及超时的item，记录stage、task、异常、traceback及原始输入，
+由主进程追加写入jsonl文件；main(replay_failures=path)时只重跑这些item，并从失败的task开始执行
+"""
+
+import traceback
+
+from ._io import JsonlTool
+from ._logger import logger
+from .codec import get_codec
+from .decorator import pop_last_error
+from .reorder import WEIGHT_KEY
+
+REPLAY_KEY = "__replay_task"  # 重跑时item开始执行的task
+INTERNAL_KEYS = ("__origin_id", REPLAY_KEY, WEIGHT_KEY)
+
+
+def failure_record(
+    stage: str, task: str, item, err: BaseException = None, origin_id=None
+) -> dict:
+    """[summary]
+
+    Args:
+        stage ([str]): [stage名称]
+        task ([str]): [失败的task名称，None时(如worker被替换)重跑时从stage的第一个task开始]
+        item ([dict]): [失败task的输入，None时不记录]
+        err ([BaseException]): [异常，None时取err_catch最近捕获的异常(task返回None)]
+        origin_id ([int]): [item为None时的 __origin_id]
+    """
+    if err is None:
+        err = pop_last_error()
+    if isinstance(item, dict):
+        origin_id = item.get("__origin_id", origin_id)
+        item = {k: v for k, v in item.items() if k not in INTERNAL_KEYS}
+    return {
+        "stage": stage,
+        "task": task,
+        "__origin_id": origin_id,
+        "error": f"{type(err).__name__}: {err}" if err is not None else "task返回None",
+        "traceback": (
+            "".join(traceback.format_exception(type(err), err, err.__traceback__))
+            if err is not None
+            else None
+        ),
+        "item": item,
+    }
+
+
+class DeadLetter:
+    """主进程中收集失败记录，每flush_num条追加写入一次jsonl"""
+
+    def __init__(self, path: str, flush_num: int = 100):
+        """[summary]
+
+        Args:
+            path ([str]): [死信文件路径，追加写入]
+            flush_num ([int]): [缓存的记录数量达到该值时写入]
+        """
+        self.path = path
+        self.flush_num = flush_num
+        self.records = []
+        self.num = 0
+
+    def add(self, record: dict):
+        self.records.append(record)
+        if len(self.records) >= self.flush_num:
+            self.flush()
+
+    def flush(self):
+        if not self.records:
+            return
+        dumps = get_codec(JsonlTool.codec_name).dumps
+        for record in self.records:
+            try:
+                dumps(record)
+            except (TypeError, ValueError):
+                # item中有无法序列化的值，只保留repr，无法重跑
+                record["item"] = repr(record["item"])
+        JsonlTool.write(self.records, self.path, mode="a")
+        self.num += len(self.records)
+        self.records = []
+
+
+def read_failures(path: str, stages: list):
+    """读取死信记录，返回重跑的item，REPLAY_KEY为开始执行的task
+
+    Args:
+        path ([str]): [死信文件路径]
+        stages ([List[Stage]]): [当前执行计划，task为None的记录从所在stage的第一个task开始]
+    """
+    first_task = {stage.name: stage.tasks[0].func_name for stage in stages}
+    for record in JsonlTool.read_iter(path):
+        item = record.get("item")
+        if not isinstance(item, dict):
+            logger.warning(
+                "死信记录没有可重跑的item，跳过 __origin_id: %s, error: %s",
+                record.get("__origin_id"),
+                record.get("error"),
+            )
+            continue
+        task = record.get("task") or first_task.get(record.get("stage"))
+        if task is not None:
+            item[REPLAY_KEY] = task
+        yield item
+
+
+def replay_start_fn(stage, tasks: list):
+    """重跑的item在本stage中开始执行的task序号，失败的task在之后的stage时返回None(直接传递)
+
+    Args:
+        stage ([Stage]): [当前stage]
+        tasks ([List[Task]]): [全部task]
+    """
+    order = {task.func_name: i for i, task in enumerate(tasks)}
+    names = [task.func_name for task in stage.tasks]
+    last = order.get(names[-1], -1)
+
+    def start(item: dict):
+        name = item[REPLAY_KEY]
+        if name in names:
+            item.pop(REPLAY_KEY)
+            return names.index(name)
+        if order.get(name, -1) > last:
+            return None
+        item.pop(REPLAY_KEY)  # 未知的task(如已改名)从当前stage开始
+        return 0
+
+    return start
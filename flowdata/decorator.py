@@ -69,6 +69,21 @@ def timeout(seconds=10000, works=2):
     return decorator
 
 
+_last_error = threading.local()  # err_catch最近捕获的异常，死信记录中使用
+
+
+def pop_last_error():
+    """当前线程中err_catch最近捕获的异常，读取后清空"""
+    err = getattr(_last_error, "err", None)
+    _last_error.err = None
+    return err
+
+
+def clear_last_error():
+    """task调用前清空，避免读取到之前item的异常"""
+    _last_error.err = None
+
+
 def err_catch(info="", level="error"):
     """异常捕获装饰器
 
@@ -85,16 +100,23 @@ def err_catch(info="", level="error"):
                 # print(args)  # 装饰类中函数时， self参数包含在args中
                 return func(*args, **kwargs)
             except Exception as err:
+                _last_error.err = err
                 extract_list = traceback.extract_tb(err.__traceback__, limit=10)
                 for item in traceback.format_list(extract_list):
                     level_func(item.strip())
                 level_func(f"{info} args:{args}, kwargs: {kwargs}: {err}")
 
+        decorated._err_catch = True  # functools.wraps复制到外层装饰器
         return decorated
 
     return decorator
 
 
+def is_err_caught(func) -> bool:
+    """函数是否被err_catch包装，异常被捕获后返回None"""
+    return getattr(func, "_err_catch", False)
+
+
 def interrupt_catch(func):
     def wrapper(*args, **kwargs):
         try:
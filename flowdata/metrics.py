@@ -0,0 +1,276 @@
+"""
+stage级别的运行指标: 吞吐、耗时分布、队列等待、利用率
+各worker只写自己的槽位，跨进程共享内存汇总，不需要加锁
+worker的执行循环中先在本地累计，每隔FLUSH_INTERVAL秒写入一次共享内存，单个item不访问共享内存
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from multiprocessing.sharedctypes import RawArray
+from typing import Dict
+
+from ._logger import logger
+
+# 单worker的计数字段
+FIELDS = (
+    "items_in",  # 输入item数量
+    "items_out",  # 输出item数量
+    "errors",  # 执行异常item数量
+    "busy",  # 执行耗时(秒)
+    "wait_in",  # 等待queue_in.get耗时(秒)
+    "wait_out",  # 等待queue_out.put耗时(秒)
+    "latency_sum",  # 耗时分布的总和(秒)
+    "cache_hits",  # 结果缓存命中数量
+    "cache_misses",  # 结果缓存未命中数量
+    "retries",  # 失败后延迟重试的次数
+    "timeouts",  # 执行超时的item数量
+    "filtered",  # filter丢弃及flat_map没有输出的item数量
+)
+# 耗时分布的桶上限(秒)，最后一个桶为+Inf
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+FLUSH_INTERVAL = 0.1  # 本地累计的指标写入共享内存的间隔(秒)
+
+
+class StageMetrics:
+    """单个stage各worker的指标，存放在共享内存RawArray中"""
+
+    def __init__(self, slot_num: int = 1):
+        """[summary]
+
+        Args:
+            slot_num ([int]): [worker槽位数量，与进程索引work_i对应]
+        """
+        self.slot_num = max(1, slot_num)
+        self.stride = len(FIELDS) + len(BUCKETS) + 1
+        self.values = RawArray("d", self.slot_num * self.stride)
+        self.index = {field: i for i, field in enumerate(FIELDS)}
+
+    def add(self, work_i: int, field: str, value: float = 1):
+        self.values[work_i * self.stride + self.index[field]] += value
+
+    def observe(self, work_i: int, seconds: float):
+        """记录一次执行耗时"""
+        base = work_i * self.stride
+        self.values[base + self.index["latency_sum"]] += seconds
+        self.values[base + len(FIELDS) + bisect_left(BUCKETS, seconds)] += 1
+
+    def local(self, work_i: int) -> "LocalMetrics":
+        """worker执行循环中使用的本地累计"""
+        return LocalMetrics(self, work_i)
+
+    def total(self, field: str) -> float:
+        offset = self.index[field]
+        return sum(self.values[offset :: self.stride])
+
+    def worker(self, work_i: int) -> dict:
+        base = work_i * self.stride
+        return {field: self.values[base + i] for i, field in enumerate(FIELDS)}
+
+    def buckets(self) -> list:
+        """各桶累计数量(不累加)，最后一个为+Inf"""
+        return [
+            sum(self.values[len(FIELDS) + i :: self.stride])
+            for i in range(len(BUCKETS) + 1)
+        ]
+
+
+class LocalMetrics:
+    """单个worker本地累计的指标，record()时每隔FLUSH_INTERVAL秒写入共享内存，结束时需flush()
+    worker被杀死时最多丢失FLUSH_INTERVAL秒内的计数
+    """
+
+    def __init__(self, metrics: StageMetrics, work_i: int):
+        """[summary]
+
+        Args:
+            metrics ([StageMetrics]): [写入的stage指标]
+            work_i ([int]): [进程索引]
+        """
+        self.metrics = metrics
+        self.base = work_i * metrics.stride
+        self.index = metrics.index
+        self.latency = metrics.index["latency_sum"]
+        self.values = [0.0] * metrics.stride
+        self.flushed = time.time()
+
+    def add(self, field: str, value: float = 1):
+        self.values[self.index[field]] += value
+
+    def observe(self, seconds: float):
+        """记录一次执行耗时"""
+        self.values[self.latency] += seconds
+        self.values[len(FIELDS) + bisect_left(BUCKETS, seconds)] += 1
+
+    def record(
+        self,
+        now: float,
+        items_in: int,
+        items_out: int,
+        errors: int,
+        busy: float,
+        wait_in: float,
+        wait_out: float,
+    ):
+        """记录一个chunk的统计，参数与FIELDS的前6个字段顺序一致，并按需写入共享内存"""
+        values = self.values
+        values[0] += items_in
+        values[1] += items_out
+        values[2] += errors
+        values[3] += busy
+        values[4] += wait_in
+        values[5] += wait_out
+        if now - self.flushed >= FLUSH_INTERVAL:
+            self.flush(now)
+
+    def flush(self, now: float = None):
+        shared, base = self.metrics.values, self.base
+        for i, value in enumerate(self.values):
+            if value:
+                shared[base + i] += value
+                self.values[i] = 0.0
+        self.flushed = now or time.time()
+
+
+def snapshot(metrics: Dict[str, StageMetrics], last: dict = None) -> dict:
+    """指标快照，last为上一次快照，用于计算区间内的吞吐及利用率
+
+    Args:
+        metrics ([dict]): [stage_name: StageMetrics]
+        last ([dict]): [上一次快照]
+    """
+    now = time.time()
+    last_stages = (last or {}).get("stages", {})
+    interval = now - last["time"] if last else 0
+
+    stages = {}
+    for name, stage_metrics in metrics.items():
+        workers = [stage_metrics.worker(i) for i in range(stage_metrics.slot_num)]
+        total = {field: stage_metrics.total(field) for field in FIELDS}
+        buckets = stage_metrics.buckets()
+        stage = {
+            "total": total,
+            "workers": {
+                str(i): worker for i, worker in enumerate(workers) if worker["items_in"]
+            },
+            "latency": {
+                "count": sum(buckets),
+                "sum": total["latency_sum"],
+                "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], buckets)),
+            },
+        }
+
+        _total = last_stages.get(name, {}).get("total")
+        if _total and interval > 0:
+            worker_num = max(len(stage["workers"]), 1)
+            stage["throughput"] = (total["items_out"] - _total["items_out"]) / interval
+            stage["utilization"] = (total["busy"] - _total["busy"]) / (
+                interval * worker_num
+            )
+        stages[name] = stage
+    return {"time": now, "stages": stages}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(snap: dict) -> str:
+    """快照转为Prometheus text格式"""
+    counters = {
+        "items_in": ("flowdata_items_in_total", "输入item数量"),
+        "items_out": ("flowdata_items_out_total", "输出item数量"),
+        "errors": ("flowdata_errors_total", "执行异常item数量"),
+        "busy": ("flowdata_busy_seconds_total", "执行耗时(秒)"),
+        "wait_in": ("flowdata_wait_in_seconds_total", "等待queue_in耗时(秒)"),
+        "wait_out": ("flowdata_wait_out_seconds_total", "等待queue_out耗时(秒)"),
+        "cache_hits": ("flowdata_cache_hits_total", "结果缓存命中数量"),
+        "cache_misses": ("flowdata_cache_misses_total", "结果缓存未命中数量"),
+        "retries": ("flowdata_retries_total", "失败后延迟重试的次数"),
+        "timeouts": ("flowdata_timeouts_total", "执行超时的item数量"),
+        "filtered": ("flowdata_filtered_total", "filter丢弃的item数量"),
+    }
+    lines = []
+    for field, (name, info) in counters.items():
+        lines.append(f"# HELP {name} {info}")
+        lines.append(f"# TYPE {name} counter")
+        for stage_name, stage in snap["stages"].items():
+            for work_i, worker in stage["workers"].items():
+                labels = f'stage="{_escape(stage_name)}",worker="{work_i}"'
+                lines.append(f"{name}{{{labels}}} {worker[field]:g}")
+
+    name = "flowdata_latency_seconds"
+    lines.append(f"# HELP {name} 执行耗时分布(秒)")
+    lines.append(f"# TYPE {name} histogram")
+    for stage_name, stage in snap["stages"].items():
+        stage_label = f'stage="{_escape(stage_name)}"'
+        count = 0
+        for le, num in stage["latency"]["buckets"].items():
+            count += num
+            lines.append(f'{name}_bucket{{{stage_label},le="{le}"}} {count:g}')
+        lines.append(f"{name}_sum{{{stage_label}}} {stage['latency']['sum']:g}")
+        lines.append(f"{name}_count{{{stage_label}}} {count:g}")
+
+    gauges = {
+        "throughput": ("flowdata_throughput", "最近一个输出周期的吞吐(item/秒)"),
+        "utilization": ("flowdata_utilization", "最近一个输出周期的worker利用率"),
+    }
+    for field, (name, info) in gauges.items():
+        lines.append(f"# HELP {name} {info}")
+        lines.append(f"# TYPE {name} gauge")
+        for stage_name, stage in snap["stages"].items():
+            if field in stage:
+                labels = f'stage="{_escape(stage_name)}"'
+                lines.append(f"{name}{{{labels}}} {stage[field]:g}")
+    return "\n".join(lines) + "\n"
+
+
+def _write(path: str, text: str):
+    """先写临时文件再替换，避免读取到写了一半的文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class MetricsReporter(threading.Thread):
+    """定时输出指标快照: {path}.json 及 Prometheus text格式的 {path}.prom"""
+
+    def __init__(
+        self, metrics: Dict[str, StageMetrics], path: str, interval: float = 5
+    ):
+        """[summary]
+
+        Args:
+            metrics ([dict]): [stage_name: StageMetrics]
+            path ([str]): [输出文件路径前缀]
+            interval ([float]): [输出间隔(秒)]
+        """
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.last = snapshot(metrics)
+
+    def report(self) -> dict:
+        snap = snapshot(self.metrics, self.last)
+        self.last = snap
+        try:
+            _write(f"{self.path}.json", json.dumps(snap, ensure_ascii=False, indent=2))
+            _write(f"{self.path}.prom", to_prometheus(snap))
+        except OSError as err:
+            logger.warning("指标输出失败 %s: %s", self.path, err)
+        return snap
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.report()
+
+    def stop(self) -> dict:
+        """停止定时输出，并输出最终快照"""
+        self.stop_event.set()
+        self.join()
+        return self.report()
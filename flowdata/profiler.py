@@ -0,0 +1,154 @@
+"""
+跨进程性能分析: 每个worker及输入进程分别采集，结束后按stage合并
+sample: 采样分析，输出collapsed stack(.folded)，可用flamegraph.pl、speedscope查看，开销低
+cprofile: 确定性分析，输出pstats(.prof)，可用pstats、snakeviz查看
+"""
+
+import cProfile
+import glob
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from ._logger import logger
+
+PROFILE_ENV = "FLOWDATA_PROFILE"  # 环境变量开启性能分析: 1/sample/cprofile
+PROFILE_DIR_ENV = "FLOWDATA_PROFILE_DIR"  # 输出目录，默认为 ./profile
+MODES = ("sample", "cprofile")
+EXTENSIONS = {"sample": "folded", "cprofile": "prof"}
+
+
+def get_mode(profile=None) -> str:
+    """解析性能分析模式，profile为None时读取环境变量
+
+    Args:
+        profile ([bool, str]): [True/"sample"为采样分析，"cprofile"为确定性分析，False不开启]
+    """
+    if profile is None:
+        profile = os.environ.get(PROFILE_ENV, "").lower()
+        if profile in ("", "0", "false"):
+            return None
+    if profile is True or profile in ("1", "true"):
+        return "sample"
+    if not profile:
+        return None
+    if profile not in MODES:
+        raise ValueError(f"profile必须为{MODES}之一: {profile}")
+    return profile
+
+
+def get_dir() -> str:
+    return os.environ.get(PROFILE_DIR_ENV, "profile")
+
+
+class Sampler(threading.Thread):
+    """采样线程: 每隔interval秒记录一次目标线程的调用栈"""
+
+    def __init__(self, ident: int, interval: float = 0.01):
+        super().__init__(daemon=True)
+        self.target_ident = ident
+        self.interval = interval
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_ident)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def _dump_stacks(stacks: Counter, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, num in stacks.items():
+            f.write(f"{stack} {num}\n")
+
+
+@contextmanager
+def profiling(mode: str, profile_dir: str, name: str, role: str):
+    """对当前线程进行性能分析，结束时写入 {profile_dir}/{name}.{role}-{pid}-{tid}.part.{ext}
+
+    Args:
+        mode ([str]): [sample/cprofile，None时不分析]
+        profile_dir ([str]): [输出目录]
+        name ([str]): [stage名称，合并时按名称汇总]
+        role ([str]): [worker/feeder等，用于区分文件]
+    """
+    if mode is None:
+        yield
+        return
+
+    ident = threading.get_ident()
+    path = os.path.join(
+        profile_dir,
+        f"{name}.{role}-{os.getpid()}-{ident}.part.{EXTENSIONS[mode]}",
+    )
+
+    profiler = None
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as err:  # python3.12+ 同一进程内只能有一个cProfile
+            logger.warning("性能分析开启失败 %s: %s", path, err)
+            profiler = None
+    else:
+        profiler = Sampler(ident)
+        profiler.start()
+
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+            if mode == "cprofile":
+                profiler.disable()
+                profiler.dump_stats(path)
+            else:
+                profiler.stop()
+                _dump_stacks(profiler.stacks, path)
+
+
+def merge_profiles(mode: str, profile_dir: str, name: str) -> str:
+    """合并同一stage各进程的分析结果为 {profile_dir}/{name}.{ext}，并删除中间文件
+
+    Returns:
+        [str]: [合并后的文件路径，没有分析结果时返回None]
+    """
+    ext = EXTENSIONS[mode]
+    pattern = os.path.join(
+        glob.escape(profile_dir), f"{glob.escape(name)}.*.part.{ext}"
+    )
+    parts = sorted(glob.glob(pattern))
+    if not parts:
+        return None
+
+    path = os.path.join(profile_dir, f"{name}.{ext}")
+    if mode == "cprofile":
+        pstats.Stats(*parts).dump_stats(path)
+    else:
+        stacks = Counter()
+        for part in parts:
+            with open(part, encoding="utf-8") as f:
+                for line in f:
+                    stack, _, num = line.rstrip("\n").rpartition(" ")
+                    stacks[stack] += int(num)
+        _dump_stacks(stacks, path)
+
+    for part in parts:
+        os.remove(part)
+    return path
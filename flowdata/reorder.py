@@ -0,0 +1,267 @@
+"""
+按 __origin_id 严格保序输出
+"""
+
+import bisect
+import heapq
+import multiprocessing
+import pickle
+import tempfile
+from fractions import Fraction
+from typing import List
+
+from ._logger import logger
+
+DROPPED_KEY = "__dropped"
+FAILURE_KEY = "__failure"  # 失败记录，主进程count_data中取出写入死信文件
+FILTERED_KEY = "__filtered"  # filter丢弃的占位，不计入error_num
+WEIGHT_KEY = "__weight"  # flat_map派生item占根item的比例(Fraction)，未设置时为1
+
+
+def dropped(origin_id, failure: dict = None, weight: Fraction = None) -> dict:
+    """异常/过滤的item占位，只保留 __origin_id，保证保序时不出现空洞"""
+    item = {"__origin_id": origin_id, DROPPED_KEY: True}
+    if failure is not None:
+        item[FAILURE_KEY] = failure
+    if weight is not None:
+        item[WEIGHT_KEY] = weight
+    return item
+
+
+def filtered(item: dict) -> dict:
+    """filter丢弃的item的占位"""
+    tombstone = dropped(item["__origin_id"], weight=item.get(WEIGHT_KEY))
+    tombstone[FILTERED_KEY] = True
+    return tombstone
+
+
+def is_dropped(item) -> bool:
+    return isinstance(item, dict) and DROPPED_KEY in item
+
+
+def is_failed(item) -> bool:
+    """执行失败的占位，filter丢弃的不算"""
+    return is_dropped(item) and FILTERED_KEY not in item
+
+
+def root_id(origin_id) -> int:
+    """flat_map派生的 (父id, k) 所属的根item id"""
+    return origin_id if type(origin_id) is int else origin_id[0]
+
+
+def derive(parent: dict, children: list) -> list:
+    """flat_map输出的子item，__origin_id 为 (父id, k)，多次派生时依次追加k，权重为父item的1/n"""
+    parent_id = parent["__origin_id"]
+    prefix = (parent_id,) if type(parent_id) is int else parent_id
+    weight = parent.get(WEIGHT_KEY, 1) / Fraction(len(children))
+    for k, child in enumerate(children):
+        child["__origin_id"] = prefix + (k,)
+        child[WEIGHT_KEY] = weight
+    return children
+
+
+class Completion:
+    """派生item的完成进度，同一根item的子item权重之和为1时根item完成"""
+
+    def __init__(self):
+        self.weights = {}  # 根item id: 已完成的权重
+
+    def __len__(self):
+        return len(self.weights)
+
+    def add(self, origin_id, weight: Fraction):
+        """返回完成的根item id，未完成时返回None"""
+        root = origin_id[0]
+        total = self.weights.get(root, 0) + weight
+        if total < 1:
+            self.weights[root] = total
+            return None
+        self.weights.pop(root, None)
+        return root
+
+
+class OrderWindow:
+    """保序窗口背压
+    已输入但未按序输出的item数量达到window时，输入端暂停等待。
+    等待超时(如chunk_size、batch_size大于window导致无法推进)时放行，超出窗口的item由ReorderBuffer写入磁盘。
+    多个分片并行输入时按 __origin_id 区间划分窗口，每个分片只占用自己的一份。
+    """
+
+    def __init__(self, window: int = 1000, timeout: float = 1):
+        """[summary]
+
+        Args:
+            window (int): [窗口大小]
+            timeout (float): [等待超时时间(秒)]
+        """
+        self.window = window
+        self.timeout = timeout
+        self.split([0])
+
+    def split(self, bounds: list):
+        """按 __origin_id 区间划分窗口，在输入进程启动前调用
+        后面的分片占满自己的一份时，不影响第一个分片推进
+
+        Args:
+            bounds ([List[int]]): [各分区第一个 __origin_id，升序]
+        """
+        share = max(1, self.window // len(bounds))
+        self.bounds = list(bounds)
+        self.slots = [multiprocessing.Semaphore(share) for _ in bounds]
+        # 超时放行的item数量
+        self.overflow = [multiprocessing.Value("i", 0) for _ in bounds]
+
+    def _part(self, origin_id: int) -> int:
+        return max(0, bisect.bisect_right(self.bounds, origin_id) - 1)
+
+    def acquire(self, origin_id: int = 0):
+        """输入端获取窗口位置"""
+        i = self._part(origin_id)
+        if self.slots[i].acquire(timeout=self.timeout):
+            return
+        with self.overflow[i].get_lock():
+            self.overflow[i].value += 1
+
+    def release(self, origin_id: int = 0):
+        """输出端按序输出一个item(flat_map派生的item为根item)后释放窗口位置"""
+        i = self._part(origin_id)
+        with self.overflow[i].get_lock():
+            if self.overflow[i].value > 0:
+                self.overflow[i].value -= 1
+                return
+        self.slots[i].release()
+
+
+class ReorderBuffer:
+    """重排序缓冲区
+    内存中最多缓存window个item(派生item按子item计数)，超出部分写入磁盘临时文件，按序输出时再读回。
+    """
+
+    def __init__(self, window: int = 1000, start_id: int = 0, skip=None):
+        """[summary]
+
+        Args:
+            window (int): [内存中最多缓存的item数量]
+            start_id (int): [第一个item的id]
+            skip ([callable]): [判断id是否不会到达(如续跑时已完成)，输出时跳过]
+        """
+        self.window = window
+        self.skip = skip
+        self.next_id = start_id - 1  # 当前应该输出的item id
+        self._advance()
+        self.heap: List[int] = []  # 所有缓存item的id
+        self.items = (
+            {}
+        )  # 内存中的item  origin_id: item，派生item为同一根item的子item列表
+        self.children = {}  # 未完成的派生item  根item id: 内存中的子item列表
+        self.spilled_children = {}  # 未完成的派生item  根item id: 磁盘中的子item id列表
+        self.completion = Completion()
+        self.size = 0  # 内存中的item数量，派生item按子item计数
+        self.spilled = {}  # 磁盘中的item  origin_id: (offset, size)
+        self.spill_file = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def _spill(self, origin_id, item):
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(prefix="flowdata_reorder_")
+            logger.warning("保序缓冲区超过窗口大小 %s，写入磁盘", self.window)
+        data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        offset = self.spill_file.seek(0, 2)
+        self.spill_file.write(data)
+        self.spilled[origin_id] = (offset, len(data))
+
+    def _load(self, origin_id):
+        offset, size = self.spilled.pop(origin_id)
+        self.spill_file.seek(offset)
+        return pickle.loads(self.spill_file.read(size))
+
+    def _advance(self):
+        self.next_id += 1
+        while self.skip is not None and self.skip(self.next_id):
+            self.next_id += 1
+
+    def _pop(self, origin_id):
+        if origin_id in self.items:
+            item = self.items.pop(origin_id)
+            self.size -= _size(item)
+            return item
+        return self._load(origin_id)
+
+    def _gather(self, root: int) -> list:
+        """根item的全部子item，按 __origin_id 排序"""
+        children = self.children.pop(root, [])
+        self.size -= len(children)
+        children.extend(self._load(i) for i in self.spilled_children.pop(root, []))
+        return sorted(children, key=_child_key)
+
+    def push(self, item) -> list:
+        """放入一个item，返回可按序输出的item列表
+        派生的item在同一根item的子item全部到达后，按 __origin_id 排序作为一个整体输出
+        """
+        origin_id = item["__origin_id"]
+        if type(origin_id) is not int:
+            root = origin_id[0]
+            if self.size < self.window:
+                self.children.setdefault(root, []).append(item)
+                self.size += 1
+            else:
+                self._spill(origin_id, item)
+                self.spilled_children.setdefault(root, []).append(origin_id)
+            if self.completion.add(origin_id, item[WEIGHT_KEY]) is None:
+                return []
+            origin_id = root
+            item = self._gather(root)
+        if origin_id != self.next_id:
+            heapq.heappush(self.heap, origin_id)
+            if self.size + _size(item) <= self.window:
+                self.items[origin_id] = item
+                self.size += _size(item)
+            else:
+                self._spill(origin_id, item)
+            return []
+
+        ready = []
+        _extend(ready, item)
+        self._advance()
+        while self.heap and self.heap[0] == self.next_id:
+            _extend(ready, self._pop(heapq.heappop(self.heap)))
+            self._advance()
+        return ready
+
+    def pop_all(self) -> list:
+        """输入结束后输出剩余item，存在缺失id时按id顺序输出"""
+        for root in {**self.children, **self.spilled_children}:  # 子item未全部到达
+            heapq.heappush(self.heap, root)
+            self.items[root] = self._gather(root)
+            self.size += len(self.items[root])
+        if self.heap:
+            logger.warning("保序缓冲区存在缺失的 __origin_id: %s", self.next_id)
+        ready = []
+        while self.heap:
+            _extend(ready, self._pop(heapq.heappop(self.heap)))
+        self.close()
+        return ready
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+
+
+def _child_key(item: dict) -> tuple:
+    return item["__origin_id"]
+
+
+def _size(item) -> int:
+    """派生item的列表按子item计数"""
+    return len(item) if type(item) is list else 1
+
+
+def _extend(ready: list, item):
+    """派生item的列表展开输出"""
+    if type(item) is list:
+        ready.extend(item)
+    else:
+        ready.append(item)
@@ -0,0 +1,74 @@
+"""
+task失败重试: 失败的item按指数退避加随机抖动计算重试时间，放入worker内的延迟队列，
+worker不等待，继续处理其他item，到期后再执行
+"""
+
+import heapq
+import itertools
+import random
+import time
+from dataclasses import dataclass, field
+
+DEFERRED = object()  # 执行结果已进入延迟队列的标志
+
+
+@dataclass
+class RetryPolicy:
+    """重试策略，通过 add_task(retry=RetryPolicy(...)) 开启，retry为int时表示max_retries"""
+
+    max_retries: int = field(default=3, metadata={"help": "单个item的最大重试次数"})
+    backoff: float = field(default=1, metadata={"help": "首次重试的等待时间(秒)"})
+    max_backoff: float = field(default=60, metadata={"help": "等待时间上限(秒)"})
+    jitter: float = field(
+        default=0.5, metadata={"help": "随机抖动比例，避免大量item同时重试"}
+    )
+    exceptions: tuple = field(
+        default=(Exception,), metadata={"help": "需要重试的异常类型"}
+    )
+
+    def __post_init__(self):
+        if type(self.max_retries) is not int or self.max_retries < 1:
+            raise ValueError(
+                f"max_retries must be a positive int: {self.max_retries!r}"
+            )
+
+    def delay(self, attempt: int) -> float:
+        """第attempt次(从0开始)重试前的等待时间"""
+        delay = min(self.max_backoff, self.backoff * 2**attempt)
+        return max(0, delay * (1 + random.uniform(-self.jitter, self.jitter)))
+
+
+class Deferred(Exception):
+    """process_fn抛出时，worker将resume放入延迟队列，delay秒后执行resume()得到结果"""
+
+    def __init__(self, delay: float, resume):
+        super().__init__(delay)
+        self.delay = delay
+        self.resume = resume
+
+
+class DelayQueue:
+    """worker内的延迟执行队列，按到期时间排序的最小堆"""
+
+    def __init__(self):
+        self.heap = []
+        self.seq = itertools.count()  # 到期时间相同时按加入顺序，不比较resume
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, delay: float, resume):
+        heapq.heappush(self.heap, (time.time() + delay, next(self.seq), resume))
+
+    def timeout(self) -> float:
+        """距最早到期的剩余时间(秒)，队列为空时返回None"""
+        if not self.heap:
+            return None
+        return max(0, self.heap[0][0] - time.time())
+
+    def pop_due(self) -> list:
+        """取出已到期的resume"""
+        now, due = time.time(), []
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap)[2])
+        return due
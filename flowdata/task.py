@@ -1,6 +1,10 @@
 import functools
 from dataclasses import dataclass, field
-from typing import List
+from typing import Callable, List, Union
+
+from .cache import TaskCache
+from .decorator import is_err_caught
+from .retry import RetryPolicy
 
 
 @dataclass
@@ -14,19 +18,177 @@ class Task:
         default=None, metadata={"help": "任务函数，由add_task添加至task_list"}
     )
     work_num: int = field(default=1, metadata={"help": "进程数量"})
+    max_work_num: int = field(
+        default=None,
+        metadata={"help": "大于work_num时开启自动扩缩容，进程数量在两者之间调整"},
+    )
     dummy: bool = field(
         default=False, metadata={"help": "False是多进程，True则是多线程"}
     )
+    chunk_size: int = field(
+        default=1, metadata={"help": "每次经queue传输的item数量，批量传输降低通信开销"}
+    )
+    batch_size: int = field(
+        default=1,
+        metadata={"help": "大于1时为batch任务，func输入item列表，返回等长结果列表"},
+    )
+    max_wait_ms: float = field(
+        default=10, metadata={"help": "batch任务组batch的最长等待时间(毫秒)"}
+    )
+    shm_threshold: int = field(
+        default=None,
+        metadata={"help": "不小于该字节数的buffer经共享内存传输，None不开启"},
+    )
+    mode: str = field(
+        default="sync",
+        metadata={"help": "async时func为协程函数，worker内以事件循环并发执行"},
+    )
+    concurrency: int = field(
+        default=100, metadata={"help": "async模式下每个worker的最大并发数"}
+    )
+    fuse: bool = field(
+        default=True, metadata={"help": "是否允许与相邻的兼容task融合执行"}
+    )
+    cache: TaskCache = field(
+        default=None, metadata={"help": "结果缓存，命中时不再执行func"}
+    )
+    init_fn: Union[str, Callable] = field(
+        default=None,
+        metadata={"help": "每个worker启动时调用一次，返回值作为state参数传给func"},
+    )
+    retry: RetryPolicy = field(
+        default=None,
+        metadata={"help": "func抛出异常时延迟重试，worker不等待，None不重试"},
+    )
+    item_timeout: float = field(
+        default=None,
+        metadata={
+            "help": "单个item的执行超时时间(秒)，超时时中断或替换worker，None不限制"
+        },
+    )
+    kind: str = field(
+        default="map",
+        metadata={
+            "help": "map: 返回新item; filter: 返回bool，False时在worker内丢弃; "
+            "flat_map: 返回0或多个item"
+        },
+    )
+
+    @property
+    def parallel(self):
+        """是否需要DataParallel执行"""
+        return (
+            max(self.work_num, self.max_work_num or 0) > 1
+            or self.batch_size > 1
+            or self.mode == "async"
+            or self.item_timeout is not None  # 主进程中无法中断
+        )
+
+    def can_fuse(self, other: "Task") -> bool:
+        """与下一个task执行配置一致时可融合，flat_map为stage的最后一个task"""
+        return (
+            self.fuse
+            and self.kind != "flat_map"
+            and other.fuse
+            and self.batch_size == other.batch_size == 1
+            and self.work_num == other.work_num
+            and self.max_work_num == other.max_work_num
+            and self.dummy == other.dummy
+            and self.chunk_size == other.chunk_size
+            and self.shm_threshold == other.shm_threshold
+            and self.mode == other.mode
+            and self.concurrency == other.concurrency
+            and self.item_timeout == other.item_timeout
+        )
+
+
+@dataclass
+class Stage:
+    """执行阶段，由相邻且可融合的task组成，在同一worker内依次执行，省去task间的序列化与传输"""
+
+    tasks: List[Task] = field(default_factory=list)
+
+    @property
+    def task(self) -> Task:
+        """stage的执行配置，与首个task一致"""
+        return self.tasks[0]
+
+    @property
+    def name(self) -> str:
+        return "+".join(task.func_name for task in self.tasks)
 
 
 TASK_LIST: List[Task] = []
+KINDS = ("map", "filter", "flat_map")
 
 
 # 添加至任务列表
-def add_task(work_num: int = 1, dummy=False):
+def add_task(
+    work_num: int = 1,
+    dummy=False,
+    max_work_num: int = None,
+    chunk_size: int = 1,
+    batch_size: int = 1,
+    max_wait_ms: float = 10,
+    shm_threshold: int = None,
+    mode: str = "sync",
+    concurrency: int = 100,
+    fuse: bool = True,
+    cache: Union[str, TaskCache] = None,
+    init_fn: Union[str, Callable] = None,
+    retry: Union[int, RetryPolicy] = None,
+    item_timeout: float = None,
+    kind: str = "map",
+):
+    if mode not in ("sync", "async"):
+        raise ValueError(f"mode must be sync or async: {mode}")
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {KINDS}: {kind}")
+    if kind != "map" and batch_size > 1:
+        raise ValueError(f"batch task does not support kind={kind}")
+    if mode == "async" and batch_size > 1:
+        raise ValueError("async task does not support batch_size")
+    if mode == "async" and max_work_num is not None:
+        # 协程并发时worker利用率无法统计，不做扩缩容
+        raise ValueError("async task does not support max_work_num")
+    if isinstance(cache, str):
+        cache = TaskCache(cache)
+    if cache is not None and kind == "flat_map":
+        raise ValueError("flat_map task does not support cache")
+    if isinstance(retry, bool) or not isinstance(retry, (int, RetryPolicy, type(None))):
+        raise ValueError(f"retry must be a positive int or RetryPolicy: {retry!r}")
+    if isinstance(retry, int):
+        retry = RetryPolicy(max_retries=retry)
+    if retry is not None and batch_size > 1:
+        raise ValueError("batch task does not support retry")
+    if item_timeout is not None and batch_size > 1:
+        raise ValueError("batch task does not support item_timeout")
+
     def _add_task(func):
+        if retry is not None and is_err_caught(func):
+            raise ValueError(
+                f"retry task must not be wrapped by err_catch: {func.__name__}"
+            )
         TASK_LIST.append(
-            Task(func.__qualname__.split(".")[0], func.__name__, work_num, dummy)
+            Task(
+                func.__qualname__.split(".")[0],
+                func.__name__,
+                work_num=work_num,
+                max_work_num=max_work_num,
+                dummy=dummy,
+                chunk_size=chunk_size,
+                batch_size=batch_size,
+                max_wait_ms=max_wait_ms,
+                shm_threshold=shm_threshold,
+                mode=mode,
+                concurrency=concurrency,
+                fuse=fuse,
+                cache=cache,
+                init_fn=init_fn,
+                retry=retry,
+                item_timeout=item_timeout,
+                kind=kind,
+            )
         )
 
         @functools.wraps(func)
@@ -38,6 +200,17 @@ def add_task(work_num: int = 1, dummy=False):
     return _add_task
 
 
+def fuse_tasks(tasks: List[Task]) -> List[Stage]:
+    """融合相邻的兼容task"""
+    stages: List[Stage] = []
+    for task in tasks:
+        if stages and stages[-1].tasks[-1].can_fuse(task):
+            stages[-1].tasks.append(task)
+        else:
+            stages.append(Stage([task]))
+    return stages
+
+
 def clear_task():
     while TASK_LIST:
         TASK_LIST.pop()
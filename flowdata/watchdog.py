@@ -0,0 +1,152 @@
+"""
+item执行超时: 单个item执行超过item_timeout时取消，避免一个异常输入卡住整个stage
+多进程模式下worker内通过SIGALRM在任务函数中抛出ItemTimeout，sleep、socket读写等阻塞调用及python代码均可被中断；
+无法中断时(如卡在C扩展中)，主进程中的Watchdog线程杀死该worker进程并启动新的worker；
+线程模式下线程无法被杀死，Watchdog放弃该线程(执行完后直接退出，结果丢弃)并启动新的线程；
+被替换worker中已取出、尚未输出的item由Ledger记录，未开始执行的交给新的worker，其余输出结果或失败占位
+"""
+
+import os
+import pickle
+import signal
+import threading
+import time
+
+from ._logger import logger
+
+
+class ItemTimeout(TimeoutError):
+    """item执行超时"""
+
+
+class Alarm:
+    """seconds秒后在当前执行位置抛出ItemTimeout，只在主线程中生效(多进程模式下的worker)"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.enabled = (
+            seconds is not None
+            and hasattr(signal, "setitimer")
+            and threading.current_thread() is threading.main_thread()
+        )
+        self.fired = False
+        self.handler = None
+
+    def _raise(self, signum, frame):
+        self.fired = True
+        raise ItemTimeout(f"item执行超过 {self.seconds} 秒")
+
+    def __enter__(self):
+        self.fired = False
+        if self.enabled:
+            self.handler = signal.signal(signal.SIGALRM, self._raise)
+            signal.setitimer(signal.ITIMER_REAL, self.seconds)
+        return self
+
+    def __exit__(self, *args):
+        if self.enabled:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.handler)
+
+
+class Ledger:
+    """worker已取出、结果尚未输出的item，worker被替换时由主进程恢复
+    线程模式下主进程加锁直接读取；多进程模式下item取出时保存原始item的pickle，成员变化时原子写入path
+    """
+
+    def __init__(self, path: str = None):
+        """[summary]
+
+        Args:
+            path ([str]): [多进程模式下的记录文件，None为线程模式]
+        """
+        self.path = path
+        self.items = {}  # seq: item，多进程模式下为pickle
+        self.results = {}  # seq: 已执行完、尚未输出的结果
+        self.deferred = set()  # 等待重试的seq
+        self.seq = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def take(self, chunk: list) -> list:
+        """记录新取出的item，返回各item的seq"""
+        seqs = []
+        for data in chunk:
+            self.seq += 1
+            if self.path is not None:
+                data = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+            self.items[self.seq] = data
+            seqs.append(self.seq)
+        if self.path is not None and (chunk or self.dirty):
+            self.dump()
+        return seqs
+
+    def settle(self, seq: int, result, deferred: bool = False):
+        """记录item的执行结果，deferred为True时item等待重试"""
+        if deferred:
+            self.deferred.add(seq)
+            return
+        self.deferred.discard(seq)
+        self.results[seq] = result if self.path is None else None
+
+    def sent(self):
+        """已执行完的结果已输出"""
+        for seq in self.results:
+            del self.items[seq]
+        self.dirty = self.dirty or bool(self.results)
+        self.results = {}
+
+    def dump(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(self.items, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    @staticmethod
+    def load(path: str) -> dict:
+        """读取被杀死的worker进程的记录 seq: item"""
+        try:
+            with open(path, "rb") as f:
+                items = pickle.load(f)
+        except FileNotFoundError:
+            return {}
+        return {seq: pickle.loads(data) for seq, data in items.items()}
+
+
+class Watchdog(threading.Thread):
+    """超时检查线程，每隔interval秒检查各worker当前item的开始时间
+    线程模式超过item_timeout、多进程模式超过2倍item_timeout(SIGALRM未能中断)时替换该worker
+    """
+
+    def __init__(self, dp, item_timeout: float, name: str = ""):
+        """[summary]
+
+        Args:
+            dp ([DataParallel]): [被检查的DataParallel]
+            item_timeout ([float]): [单个item的执行超时时间(秒)]
+            name ([str]): [日志中的stage名称]
+        """
+        super().__init__(daemon=True)
+        self.dp = dp
+        self.limit = item_timeout if dp.dummy else item_timeout * 2
+        self.interval = min(1, item_timeout / 4)
+        self.name = name
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            now = time.time()
+            for work_i, started in enumerate(self.dp.started):
+                if started and now - started > self.limit:
+                    logger.error(
+                        "[watchdog] %s worker[%s] 执行item超过 %.1f 秒未结束，替换该worker，__origin_id: %s",
+                        self.name,
+                        work_i,
+                        now - started,
+                        self.dp.current[work_i],
+                    )
+                    self.dp.replace_worker(work_i, started)
+
+    def stop(self):
+        self.stop_event.set()
@@ -20,6 +20,6 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/zouweidong91/flowdata",
-    python_requires=">=3.6",
+    python_requires=">=3.8",
     install_requires=["pandas", "XlsxWriter>=3.0.3", "tqdm", "openpyxl"],
 )
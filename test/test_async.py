@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from flowdata import FlowBase, add_task
+
+HOST = "127.0.0.1"
+
+
+class EchoServer:
+    """本地模拟后端服务: 延迟50ms后返回请求内容，记录最大并发连接数"""
+
+    def __init__(self):
+        self.current = self.max_current = 0
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle, HOST, 0)
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    async def handle(self, reader, writer):
+        self.current += 1
+        self.max_current = max(self.max_current, self.current)
+        data = await reader.readline()
+        await asyncio.sleep(0.05)
+        writer.write(data)
+        await writer.drain()
+        writer.close()
+        self.current -= 1
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class AsyncFlow(FlowBase):
+    def __init__(self, port, **kwargs):
+        super().__init__(**kwargs)
+        self.port = port
+
+    @add_task(work_num=2, mode="async", concurrency=5)
+    async def async_request(self, item: dict, *args, **kwargs) -> dict:
+        if item["id"] == 7:
+            raise Exception("ha")
+        reader, writer = await asyncio.open_connection(HOST, self.port)
+        writer.write(f"{item['id']}\n".encode())
+        await writer.drain()
+        item["r"] = int(await reader.readline())
+        writer.close()
+        return item
+
+    def get_data(self):
+        for i in range(60):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class AsyncThreadFlow(AsyncFlow):
+    @add_task(work_num=2, dummy=True, mode="async", concurrency=5)
+    async def async_thread_request(self, item: dict, *args, **kwargs) -> dict:
+        return await self.async_request(item)
+
+
+class AsyncTest(unittest.TestCase):
+    def setUp(self):
+        self.server = EchoServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_async(self):
+        flow = AsyncFlow(self.server.port, verbose=False, keep_order=True)
+        start = time.time()
+        flow.main()
+        self.assertEqual(
+            [item["r"] for item in flow.items], [i for i in range(60) if i != 7]
+        )
+        self.assertEqual(flow.counter["error_num"], 1)
+        # 2个worker * 5并发
+        self.assertLessEqual(self.server.max_current, 10)
+        self.assertGreater(self.server.max_current, 2)
+        self.assertLess(time.time() - start, 60 * 0.05 / 2)
+
+    def test_async_thread_pool(self):
+        with AsyncThreadFlow(self.server.port, verbose=False) as flow:
+            flow.main()
+        self.assertEqual(len(flow.items), 59)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import time
+import unittest
+from unittest import mock
+
+from flowdata import FlowBase, add_task
+from flowdata.autoscale import AutoScaler
+
+
+class ScaleFlow(FlowBase):
+    @add_task(work_num=1, max_work_num=4, dummy=True)
+    def scale_task(self, item: dict, work_i: int, *args, **kwargs) -> dict:
+        time.sleep(0.02)
+        item["work_i"] = work_i
+        return item
+
+    def data_parallel(self, stage, item_iter_fn=None):
+        dp = super().data_parallel(stage, item_iter_fn)
+        dp.scale_interval = 0.1  # 加快测试中的扩缩容决策
+        return dp
+
+    def get_data(self):
+        for i in range(300):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class AutoScaleTest(unittest.TestCase):
+    def run_flow(self, cpu_budget):
+        flow = ScaleFlow(verbose=False, keep_order=True, cpu_budget=cpu_budget)
+        flow.main()
+        self.assertEqual([item["id"] for item in flow.items], list(range(300)))
+        return {item["work_i"] for item in flow.items}
+
+    def test_scale_up(self):
+        self.assertGreater(len(self.run_flow(cpu_budget=8)), 1)
+
+    def test_cpu_budget(self):
+        # 总预算2，最小进程数1，最多扩容1个
+        self.assertLessEqual(len(self.run_flow(cpu_budget=2)), 2)
+
+    def test_no_qsize(self):
+        # macOS上qsize抛出NotImplementedError时只根据利用率决策
+        dp = mock.Mock(queue_size=10)
+        dp.live_num.return_value = 1
+        dp.queue_in.qsize.side_effect = NotImplementedError
+        dp.queue_out.qsize.side_effect = NotImplementedError
+        scaler = AutoScaler(dp, 1, 4)
+        scaler.step(1, 0.9)
+        dp.add_worker.assert_called_once()
+        scaler.step(2, 0.1)
+        dp.remove_worker.assert_called_once()
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            add_task(mode="async", max_work_num=4)
+        flow = ScaleFlow(verbose=False)
+        with self.assertRaises(ValueError):
+            flow.warm()
+        self.assertEqual(flow.pools, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import time
+import unittest
+
+import numpy as np
+
+from flowdata import DataParallel, FlowBase, add_task
+
+
+class BatchFlow(FlowBase):
+    @add_task(work_num=2, batch_size=8, max_wait_ms=20)
+    def batch_norm(self, items: list, *args, **kwargs) -> list:
+        ids = np.array([item["id"] for item in items], dtype=np.float64)
+        if (ids == 13).any():
+            raise ValueError("bad item")
+        for item, r in zip(items, ids * 2):
+            item["r"] = float(r)
+            item["batch_len"] = len(items)
+        return items
+
+    def get_data(self):
+        for i in range(100):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class BatchThreadFlow(FlowBase):
+    @add_task(work_num=2, dummy=True, batch_size=4)
+    def batch_thread(self, items: list, *args, **kwargs) -> list:
+        ids = np.array([item["id"] for item in items])
+        return [dict(item, r=int(r)) for item, r in zip(items, ids + 1)]
+
+    def get_data(self):
+        for i in range(50):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class BatchTest(unittest.TestCase):
+    def test_batch_process(self):
+        flow = BatchFlow(verbose=False)
+        flow.main()
+        self.assertEqual(flow.counter["total_num"], 100)
+        self.assertEqual(flow.counter["error_num"], 1)
+        ids = sorted(item["id"] for item in flow.items)
+        self.assertEqual(ids, [i for i in range(100) if i != 13])
+        self.assertTrue(all(item["r"] == item["id"] * 2 for item in flow.items))
+        self.assertTrue(all(item["batch_len"] <= 8 for item in flow.items))
+
+    def test_batch_thread(self):
+        flow = BatchThreadFlow(verbose=False)
+        flow.main()
+        self.assertEqual(sorted(item["r"] for item in flow.items), list(range(1, 51)))
+
+    def test_batch_max_wait(self):
+        """数据稀疏时，不满batch也会在max_wait_ms后执行"""
+
+        def item_iter_fn():
+            for i in range(3):
+                time.sleep(0.2)
+                yield {"id": i, "t": time.time()}
+
+        def process_fn(items, *args, **kwargs):
+            return [
+                dict(item, size=len(items), latency=time.time() - item["t"])
+                for item in items
+            ]
+
+        with DataParallel(
+            item_iter_fn=item_iter_fn,
+            work_num=1,
+            process_fn=process_fn,
+            dummy=True,
+            batch_size=64,
+            max_wait_ms=20,
+        ) as data_iter:
+            items = list(data_iter)
+
+        self.assertEqual(len(items), 3)
+        self.assertTrue(all(item["latency"] < 0.15 for item in items))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+import multiprocessing
+import os
+import threading
+import time
+import unittest
+
+from flowdata import Broker, FlowBase, add_task
+
+AUTHKEY = b"test"
+
+
+class BrokerFlow(FlowBase):
+    crash_after = None  # 处理该数量的item后进程退出，模拟worker主机断开
+
+    @add_task()
+    def broker_prepare(self, item: dict, *args, **kwargs) -> dict:
+        self.num = getattr(self, "num", 0) + 1
+        if self.crash_after and self.num > self.crash_after:
+            for pool in self.pools.values():  # 整个worker主机退出
+                for p in pool.p_list:
+                    p.kill()
+            os._exit(1)
+        if item["id"] % 10 == 0:
+            return None
+        time.sleep(0.005)  # 两个worker都能分到数据
+        item["pid"] = os.getpid()
+        return item
+
+    @add_task(work_num=2, chunk_size=4, fuse=False)
+    def broker_task(self, item: dict, *args, **kwargs) -> dict:
+        item["r"] = item["id"] * 2
+        return item
+
+    def get_data(self):
+        for i in range(200):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class OtherFlow(BrokerFlow):
+    pass
+
+
+class SplitFlow(FlowBase):
+    crash_after = None
+
+    @add_task(kind="flat_map")
+    def broker_split(self, item: dict, *args, **kwargs) -> list:
+        return [{"id": item["id"], "k": k} for k in range(3)]
+
+    @add_task(fuse=False)
+    def broker_child(self, item: dict, *args, **kwargs) -> dict:
+        self.num = getattr(self, "num", 0) + 1
+        if self.crash_after and self.num > self.crash_after:
+            os._exit(1)  # 输入item的子item只返回了一部分
+        return item
+
+    def get_data(self):
+        for i in range(20):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+def start_worker(address, crash_after=None, flow_cls=BrokerFlow):
+    def target():
+        flow = flow_cls(verbose=False)
+        flow.crash_after = crash_after
+        flow.run_worker(address, AUTHKEY, credit=8)
+
+    p = multiprocessing.Process(target=target)
+    p.start()
+    return p
+
+
+class BrokerTest(unittest.TestCase):
+    def run_flow(self, worker_args: list, **kwargs):
+        broker = Broker(("127.0.0.1", 0), AUTHKEY, chunk_size=4)
+        workers = [start_worker(broker.address, *args) for args in worker_args]
+        flow = BrokerFlow(verbose=False, **kwargs)
+        flow.main(broker=broker)
+        for p in workers:
+            p.join(timeout=30)
+        return flow, workers
+
+    def test_workers(self):
+        flow, workers = self.run_flow([(), ()], keep_order=True)
+        self.assertEqual(
+            [item["id"] for item in flow.items], [i for i in range(200) if i % 10]
+        )
+        self.assertTrue(all(item["r"] == item["id"] * 2 for item in flow.items))
+        self.assertEqual(flow.counter["total_num"], 200)
+        self.assertEqual(flow.counter["error_num"], 20)
+        # 数据分散到两个worker主机执行
+        self.assertEqual({item["pid"] for item in flow.items}, {p.pid for p in workers})
+        self.assertTrue(all(p.exitcode == 0 for p in workers))
+
+    def test_reassign(self):
+        # 第一个worker处理30个item后退出，未返回的item重新分配给之后连接的worker
+        broker = Broker(("127.0.0.1", 0), AUTHKEY, chunk_size=4)
+        crashed = start_worker(broker.address, 30)
+        workers = []
+
+        def start_later():
+            crashed.join(timeout=30)
+            workers.append(start_worker(broker.address))
+
+        thread = threading.Thread(target=start_later)
+        thread.start()
+        flow = BrokerFlow(verbose=False, keep_order=True)
+        flow.main(broker=broker)
+        thread.join()
+        workers[0].join(timeout=30)
+
+        self.assertEqual(
+            [item["id"] for item in flow.items], [i for i in range(200) if i % 10]
+        )
+        self.assertEqual(flow.counter["total_num"], 200)
+        self.assertEqual(crashed.exitcode, 1)
+        self.assertEqual(workers[0].exitcode, 0)
+
+    def test_reassign_flat_map(self):
+        # 部分返回的flat_map结果不输出，重新分配后子item不重复
+        broker = Broker(("127.0.0.1", 0), AUTHKEY, chunk_size=4)
+        crashed = start_worker(broker.address, 10, SplitFlow)
+        workers = []
+
+        def start_later():
+            crashed.join(timeout=30)
+            workers.append(start_worker(broker.address, flow_cls=SplitFlow))
+
+        thread = threading.Thread(target=start_later)
+        thread.start()
+        flow = SplitFlow(verbose=False)
+        flow.main(broker=broker)
+        thread.join()
+        workers[0].join(timeout=30)
+
+        self.assertEqual(crashed.exitcode, 1)
+        self.assertEqual(
+            sorted((item["id"], item["k"]) for item in flow.items),
+            [(i, k) for i in range(20) for k in range(3)],
+        )
+
+    def test_unordered(self):
+        flow, _ = self.run_flow([()])
+        self.assertEqual(
+            sorted(item["id"] for item in flow.items), [i for i in range(200) if i % 10]
+        )
+
+    def test_authkey(self):
+        # 未指定authkey时随机生成，worker必须显式传入
+        broker = Broker(("127.0.0.1", 0))
+        address = broker.address
+        self.assertEqual(address[0], "127.0.0.1")
+        self.assertGreaterEqual(len(broker.authkey), 32)
+        broker.close()
+        with self.assertRaises(TypeError):
+            BrokerFlow(verbose=False).run_worker(address)
+        with self.assertRaises(ValueError):
+            BrokerFlow(verbose=False).run_worker(address, b"")
+
+    def test_flow_mismatch(self):
+        broker = Broker(("127.0.0.1", 0), AUTHKEY)
+        other = start_worker(broker.address, flow_cls=OtherFlow)
+        worker = start_worker(broker.address)
+        flow = BrokerFlow(verbose=False)
+        flow.main(broker=broker)
+        other.join(timeout=30)
+        self.assertEqual(len(flow.items), 180)
+        self.assertNotEqual(other.exitcode, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from flowdata import FlowBase, TaskCache, add_task
+from flowdata.cache import MISS
+
+CACHE_DIR = tempfile.mkdtemp()
+CACHE_PATH = os.path.join(CACHE_DIR, "cache.db")
+
+
+class CacheFlow(FlowBase):
+    @add_task(work_num=2, chunk_size=4, cache=TaskCache(CACHE_PATH, version="1"))
+    def cache_task(self, item: dict, *args, **kwargs) -> dict:
+        if item["id"] % 10 == 0:
+            return None  # 执行失败的结果不缓存
+        item["r"] = item["id"] * 2
+        item["pid"] = os.getpid()
+        return item
+
+    @add_task(cache=TaskCache(CACHE_PATH, keys=["id"]))
+    def cache_serial(self, item: dict, *args, **kwargs) -> dict:
+        item["calls"] = item.get("calls", 0) + 1
+        return item
+
+    def get_data(self):
+        for i in range(50):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class CacheBatchFlow(FlowBase):
+    @add_task(work_num=1, batch_size=8, cache=os.path.join(CACHE_DIR, "batch.db"))
+    def cache_batch(self, items: list, *args, **kwargs) -> list:
+        for item in items:
+            item["r"] = item["id"] + 1
+            item["batch_size"] = len(items)
+        return items
+
+    def get_data(self):
+        for i in range(self.num):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        for file_name in os.listdir(CACHE_DIR):
+            os.remove(os.path.join(CACHE_DIR, file_name))
+
+    def test_flow(self):
+        flow = CacheFlow(verbose=False, keep_order=True)
+        flow.main()
+        self.assertEqual(flow.counter["cache_hit"], 0)
+        self.assertEqual(flow.counter["cache_miss"], 95)
+        first = flow.items
+
+        flow = CacheFlow(verbose=False, keep_order=True)
+        flow.main()
+        # 失败的5个item重新执行
+        self.assertEqual(flow.counter["cache_hit"], 90)
+        self.assertEqual(flow.counter["cache_miss"], 5)
+        self.assertEqual(flow.items, first)
+        self.assertTrue(all(item["calls"] == 1 for item in flow.items))
+        snap = flow.metrics_snapshot()["stages"]["cache_task"]
+        self.assertEqual(snap["total"]["cache_hits"], 45)
+
+    def test_batch(self):
+        flow = CacheBatchFlow(verbose=False, keep_order=True)
+        flow.num = 20
+        flow.main()
+        flow = CacheBatchFlow(verbose=False, keep_order=True)
+        flow.num = 24
+        flow.main()
+        self.assertEqual(flow.counter["cache_hit"], 20)
+        self.assertEqual([item["r"] for item in flow.items], list(range(1, 25)))
+        # 只有未命中的item传入func
+        self.assertEqual(flow.items[-1]["batch_size"], 4)
+
+    def test_key(self):
+        cache = TaskCache(CACHE_PATH, keys=["a", "b"])
+        key = cache.key("task", {"a": 1, "b": [1, 2], "c": 3, "__origin_id": 0})
+        self.assertEqual(key, cache.key("task", {"b": [1, 2], "a": 1, "c": 4}))
+        self.assertNotEqual(key, cache.key("task2", {"a": 1, "b": [1, 2]}))
+        self.assertNotEqual(
+            key,
+            TaskCache(CACHE_PATH, keys=["a", "b"], version=2).key(
+                "task", {"a": 1, "b": [1, 2]}
+            ),
+        )
+
+        cache = TaskCache(CACHE_PATH)
+        self.assertEqual(
+            cache.key("task", {"a": 1, "__origin_id": 0}),
+            cache.key("task", {"a": 1, "__origin_id": 5}),
+        )
+        cache.put("k", {"a": 1, "__origin_id": 3})
+        self.assertEqual(cache.get("k"), {"a": 1})
+
+    def test_array_key(self):
+        # 数组按dtype、shape及内容hash，repr省略的部分不同也能区分
+        cache = TaskCache(CACHE_PATH)
+        a = np.zeros(10000)
+        b = a.copy()
+        b[5000] = 1
+        key = cache.key("task", {"x": a})
+        self.assertEqual(key, cache.key("task", {"x": a.copy()}))
+        self.assertNotEqual(key, cache.key("task", {"x": b}))
+        self.assertNotEqual(key, cache.key("task", {"x": a.astype(np.float32)}))
+        self.assertNotEqual(key, cache.key("task", {"x": a.reshape(100, 100)}))
+        self.assertNotEqual(
+            cache.key("task", {"x": b"ab"}), cache.key("task", {"x": b"ac"})
+        )
+
+        # 没有稳定序列化的对象不使用缓存
+        self.assertIsNone(cache.key("task", {"x": object()}))
+        self.assertIs(cache.get(None), MISS)
+
+        with self.assertRaises(ValueError):
+            add_task(kind="flat_map", cache=cache)
+
+    def test_lru(self):
+        cache = TaskCache(CACHE_PATH, max_bytes=2000)
+        value = "x" * 400
+        for i in range(4):
+            cache.put(str(i), value)
+        cache.get("0")  # 最近访问，不淘汰
+        time.sleep(0.01)
+        cache.put("4", value)
+        cache.evict()
+        self.assertEqual(len(cache), 4)
+        self.assertIs(cache.get("1"), MISS)
+        self.assertEqual(cache.get("0"), value)
+
+    def test_ttl(self):
+        cache = TaskCache(CACHE_PATH, ttl=10)
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        with mock.patch("time.time", return_value=time.time() + 11):
+            self.assertIs(cache.get("a"), MISS)
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import unittest
+
+from flowdata import FlowBase, add_task
+
+
+class CheckpointFlow(FlowBase):
+    crash_num = None  # 写入该数量后模拟进程崩溃
+
+    @add_task(work_num=2, chunk_size=4)
+    def checkpoint_task(self, item: dict, *args, **kwargs) -> dict:
+        if item["id"] % 10 == 9:
+            return None  # 模拟执行失败
+        item["r"] = item["id"] * 2
+        return item
+
+    def get_data(self):
+        for i in range(100):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        with self.checkpoint_sink(self.output_path) as f:
+            for num, item in enumerate(item_iter, 1):
+                f.write(json.dumps(item) + "\n")
+                if num == self.crash_num:
+                    raise RuntimeError("crash")
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        CheckpointFlow.output_path = os.path.join(self.tmp_dir.name, "output.jsonl")
+        self.checkpoint_path = os.path.join(self.tmp_dir.name, "checkpoint.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def new_flow(self, **kwargs) -> CheckpointFlow:
+        return CheckpointFlow(
+            verbose=False,
+            checkpoint_path=self.checkpoint_path,
+            checkpoint_interval=0,
+            **kwargs
+        )
+
+    def read_ids(self) -> list:
+        with open(CheckpointFlow.output_path, encoding="utf8") as f:
+            return [json.loads(line)["id"] for line in f]
+
+    def run_resume(self, **kwargs) -> list:
+        flow = self.new_flow(**kwargs)
+        flow.crash_num = 30
+        self.assertRaises(RuntimeError, flow.main)
+        self.assertEqual(len(self.read_ids()), 30)
+
+        flow = self.new_flow(**kwargs)
+        flow.main(resume=True)
+        # 至少包含已提交的29条输出，执行失败的item到达即完成
+        self.assertGreaterEqual(flow.counter["skip_num"], 29)
+        return self.read_ids()
+
+    def test_resume(self):
+        ids = self.run_resume()
+        # 未提交的输出被截断后重跑，输出不重复、不遗漏
+        self.assertEqual(sorted(ids), [i for i in range(100) if i % 10 != 9])
+
+    def test_resume_keep_order(self):
+        ids = self.run_resume(keep_order=True)
+        self.assertEqual(ids, [i for i in range(100) if i % 10 != 9])
+
+    def test_fresh_run(self):
+        flow = self.new_flow()
+        flow.main()
+        with open(self.checkpoint_path, encoding="utf8") as f:
+            state = json.load(f)
+        self.assertEqual(state["watermark"], 100)
+        self.assertEqual(state["done"], [])
+
+        # 不续跑时从头开始，覆盖输出
+        flow = self.new_flow()
+        flow.main()
+        self.assertEqual(len(self.read_ids()), 90)
+
+    def test_resume_offset(self):
+        flow = self.new_flow()
+        flow.main(offset=10)
+        self.assertRaises(ValueError, flow.main, offset=0, resume=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from flowdata import DataParallel, FlowBase, add_task
+from flowdata.decorator import err_catch
+
+
+class ChunkFlow(FlowBase):
+    @add_task(work_num=3, chunk_size=16)
+    @err_catch()
+    def chunk_add(self, item: dict, *args, **kwargs) -> dict:
+        item["r"] = item["id"] + 1
+        return item
+
+    def get_data(self):
+        for i in range(500):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class ChunkTest(unittest.TestCase):
+    def process_fn(self, item, *args, **kwargs):
+        item["id"] += 1
+        return item
+
+    def test_dataParallel_chunk(self):
+        with DataParallel(
+            item_iter_fn=lambda: ({"id": i} for i in range(103)),
+            work_num=2,
+            process_fn=self.process_fn,
+            chunk_size=10,
+        ) as data_iter:
+            ids = sorted(item["id"] for item in data_iter)
+        self.assertEqual(ids, list(range(1, 104)))
+
+    def test_flow_chunk_keep_order(self):
+        flow = ChunkFlow(verbose=False, keep_order=True)
+        flow.main()
+        self.assertEqual([item["id"] for item in flow.items], list(range(500)))
+
+    def test_flow_chunk(self):
+        flow = ChunkFlow(verbose=False)
+        flow.main()
+        self.assertEqual(sorted(item["id"] for item in flow.items), list(range(500)))
+        self.assertTrue(all(item["r"] == item["id"] + 1 for item in flow.items))
+
+
+if __name__ == "__main__":
+    unittest.main()
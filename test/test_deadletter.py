@@ -0,0 +1,199 @@
+import os
+import signal
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from flowdata import FlowBase, JsonlTool, add_task
+from flowdata.decorator import err_catch
+
+
+def count(item: dict, key: str) -> dict:
+    item[key] = item.get(key, 0) + 1
+    return item
+
+
+class DeadLetterFlow(FlowBase):
+    broken = True
+
+    @add_task(work_num=2)
+    def dl_prepare(self, item: dict, *args, **kwargs) -> dict:
+        return count(item, "prepare")
+
+    @add_task(work_num=2)
+    def dl_parse(self, item: dict, *args, **kwargs) -> dict:
+        if self.broken and item["id"] % 5 == 1:
+            raise ValueError(f"bad id {item['id']}")
+        return count(item, "parse")
+
+    @err_catch()
+    @add_task(work_num=2, dummy=True)
+    def dl_save(self, item: dict, *args, **kwargs) -> dict:
+        if self.broken and item["id"] % 7 == 2:
+            raise KeyError("missing")
+        return count(item, "save")
+
+    def get_data(self):
+        for i in range(40):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class SerialDeadLetterFlow(DeadLetterFlow):
+    @add_task()
+    def dl_prepare(self, item: dict, *args, **kwargs) -> dict:
+        return count(item, "prepare")
+
+    @add_task()
+    def dl_parse(self, item: dict, *args, **kwargs) -> dict:
+        return DeadLetterFlow.dl_parse(self, item)
+
+    @err_catch()
+    @add_task()
+    def dl_save(self, item: dict, *args, **kwargs) -> dict:
+        return DeadLetterFlow.dl_save.__wrapped__(self, item)
+
+
+class BlockedFlow(FlowBase):
+    broken = True
+
+    @add_task(item_timeout=0.3)
+    def dl_blocked(self, item: dict, *args, **kwargs) -> dict:
+        if self.broken and item["id"] == 3:
+            # 屏蔽SIGALRM，只能由watchdog替换worker
+            signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+            time.sleep(100)
+        return item
+
+    def get_data(self):
+        for i in range(10):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class StaleErrorFlow(FlowBase):
+    @err_catch()
+    def helper(self):
+        raise KeyError("stale")
+
+    @add_task()
+    def dl_stale(self, item: dict, *args, **kwargs) -> dict:
+        if item["id"] == 0:
+            self.helper()  # err_catch捕获的异常不影响本item
+        if item["id"] == 1:
+            return None
+        return item
+
+    def get_data(self):
+        for i in range(3):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class DeadLetterTest(unittest.TestCase):
+    parse_failed = [i for i in range(40) if i % 5 == 1]
+    save_failed = [i for i in range(40) if i % 7 == 2 and i % 5 != 1]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "failed.jsonl")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def check(self, flow_cls):
+        flow = flow_cls(verbose=False, keep_order=True, dead_letter_path=self.path)
+        flow.main()
+        failed = self.parse_failed + self.save_failed
+        self.assertEqual(flow.counter["error_num"], len(failed))
+
+        records = {
+            record["__origin_id"]: record for record in JsonlTool.read_iter(self.path)
+        }
+        self.assertEqual(sorted(records), sorted(failed))
+        for i in self.parse_failed:
+            record = records[i]
+            self.assertEqual(record["task"], "dl_parse")
+            self.assertEqual(record["error"], f"ValueError: bad id {i}")
+            self.assertIn("Traceback", record["traceback"])
+            # 记录失败task的输入
+            self.assertEqual(record["item"], {"id": i, "prepare": 1})
+        for i in self.save_failed:
+            record = records[i]
+            # 单进程时三个task融合为一个stage，重跑时从stage中间开始
+            self.assertTrue(record["stage"].endswith("dl_save"))
+            self.assertEqual(record["task"], "dl_save")
+            # task返回None时取err_catch捕获的异常
+            self.assertEqual(record["error"], "KeyError: 'missing'")
+            self.assertEqual(record["item"], {"id": i, "prepare": 1, "parse": 1})
+
+        # 只重跑失败的item，从失败的task开始，之前的task不再执行
+        flow.broken = False
+        replay_path = os.path.join(self.tmp_dir.name, "replay.jsonl")
+        flow.dead_letter_path = replay_path
+        flow.main(replay_failures=self.path)
+        # 按死信文件中的顺序(失败的先后)重跑
+        self.assertEqual(sorted(item["id"] for item in flow.items), sorted(failed))
+        for item in flow.items:
+            self.assertEqual(
+                item, {"id": item["id"], "prepare": 1, "parse": 1, "save": 1}
+            )
+        self.assertFalse(os.path.exists(replay_path))
+
+    def test_parallel(self):
+        self.check(DeadLetterFlow)
+
+    def test_serial(self):
+        self.check(SerialDeadLetterFlow)
+
+    def test_timeout(self):
+        # 多进程模式下worker被watchdog替换时记录原始item，重跑时从stage的第一个task开始
+        flow = BlockedFlow(verbose=False, dead_letter_path=self.path)
+        flow.main()
+        records = JsonlTool.read_list(self.path)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["__origin_id"], 3)
+        self.assertEqual(records[0]["stage"], "dl_blocked")
+        self.assertTrue(records[0]["error"].startswith("ItemTimeout"))
+        self.assertEqual(records[0]["item"], {"id": 3})
+
+        flow.broken = False
+        flow.dead_letter_path = None
+        flow.main(replay_failures=self.path)
+        self.assertEqual(flow.items, [{"id": 3}])
+
+    def test_stale_error(self):
+        # 之前item中err_catch捕获的异常不会记录到返回None的item
+        flow = StaleErrorFlow(verbose=False, dead_letter_path=self.path)
+        flow.main()
+        records = JsonlTool.read_list(self.path)
+        self.assertEqual([record["__origin_id"] for record in records], [1])
+        self.assertEqual(records[0]["error"], "task返回None")
+
+    def test_disabled(self):
+        # 未设置dead_letter_path时不生成失败记录
+        with mock.patch("flowdata.data_flow.failure_record") as record:
+            flow = SerialDeadLetterFlow(verbose=False)
+            flow.main()
+        record.assert_not_called()
+        self.assertEqual(
+            flow.counter["error_num"], len(self.parse_failed + self.save_failed)
+        )
+
+    def test_replay_args(self):
+        flow = DeadLetterFlow(verbose=False, dead_letter_path=self.path)
+        with self.assertRaises(ValueError):
+            flow.main(replay_failures=self.path)
+        with self.assertRaises(ValueError):
+            flow.main(replay_failures="other.jsonl", resume=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import unittest
+
+from flowdata import FlowBase, add_task
+from flowdata.decorator import err_catch
+
+
+class FuseFlow(FlowBase):
+    @add_task(work_num=2)
+    @err_catch()
+    def fuse_a(self, item: dict, *args, **kwargs) -> dict:
+        item["pid_a"] = os.getpid()
+        if item["id"] == 3:
+            raise Exception("ha")
+        return item
+
+    @add_task(work_num=2)
+    @err_catch()
+    def fuse_b(self, item: dict, *args, **kwargs) -> dict:
+        item["pid_b"] = os.getpid()
+        return item
+
+    @add_task(work_num=2, fuse=False)
+    def fuse_c(self, item: dict, *args, **kwargs) -> dict:
+        item["pid_c"] = os.getpid()
+        return item
+
+    def get_data(self):
+        for i in range(20):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class FuseTest(unittest.TestCase):
+    def test_plan(self):
+        stages = FuseFlow(verbose=False).get_stages()
+        self.assertEqual([stage.name for stage in stages], ["fuse_a+fuse_b", "fuse_c"])
+
+    def test_fused_flow(self):
+        flow = FuseFlow(verbose=False)
+        flow.main()
+        self.assertEqual(flow.counter["error_num"], 1)
+        self.assertEqual(len(flow.items), 19)
+        # 融合的task在同一进程内执行
+        self.assertTrue(all(item["pid_a"] == item["pid_b"] for item in flow.items))
+        self.assertTrue(all(item["pid_a"] != item["pid_c"] for item in flow.items))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import asyncio
+import multiprocessing
+import os
+import unittest
+
+from flowdata import DataParallel, FlowBase, add_task
+from flowdata.data_parallel import WorkerInitError
+
+INIT_NUM = multiprocessing.Value("i", 0)  # init_fn调用次数，跨进程累计
+
+
+def load_tokenizer(work_i: int) -> dict:
+    with INIT_NUM.get_lock():
+        INIT_NUM.value += 1
+    return {"vocab": {"a": 1}, "work_i": work_i}
+
+
+class InitFlow(FlowBase):
+    def load_model(self, work_i: int) -> dict:
+        with INIT_NUM.get_lock():
+            INIT_NUM.value += 1
+        return {"pid": os.getpid(), "work_i": work_i, "scale": self.scale}
+
+    @add_task(work_num=2, chunk_size=4, init_fn=load_model)
+    def init_model(self, item: dict, *args, state=None, **kwargs) -> dict:
+        item["pid"], item["state_pid"] = os.getpid(), state["pid"]
+        item["r"] = item["id"] * state["scale"]
+        return item
+
+    @add_task(work_num=2, chunk_size=4, init_fn=load_tokenizer)
+    def init_tokenize(self, item: dict, *args, state=None, **kwargs) -> dict:
+        item["vocab"] = state["vocab"]["a"]
+        return item
+
+    @add_task(work_num=2, chunk_size=4)
+    def init_plain(self, item: dict, *args, **kwargs) -> dict:
+        item["plain"] = "state" not in kwargs
+        return item
+
+    @add_task(init_fn="load_model")
+    def init_serial(self, item: dict, *args, state=None, **kwargs) -> dict:
+        item["serial_pid"] = state["pid"]
+        return item
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scale = 3
+
+    def get_data(self):
+        for i in range(40):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class AsyncInitFlow(InitFlow):
+    @add_task(work_num=2, mode="async", init_fn=load_tokenizer)
+    async def init_async(self, item: dict, *args, state=None, **kwargs) -> dict:
+        await asyncio.sleep(0.001)
+        item["work_i"] = state["work_i"]
+        return item
+
+    @add_task(work_num=2, batch_size=8, init_fn=load_tokenizer)
+    def init_batch(self, items: list, *args, state=None, **kwargs) -> list:
+        for item in items:
+            item["vocab"] = state["vocab"]["a"]
+        return items
+
+
+def broken_init(work_i: int) -> dict:
+    if work_i == 1:
+        raise OSError("model not found")
+    return {}
+
+
+class BrokenInitFlow(FlowBase):
+    @add_task(work_num=2, chunk_size=4, init_fn=broken_init)
+    def init_broken(self, item: dict, *args, state=None, **kwargs) -> dict:
+        return item
+
+    get_data = InitFlow.get_data
+    save_data = InitFlow.save_data
+
+
+class ThreadBrokenInitFlow(BrokenInitFlow):
+    @add_task(work_num=2, dummy=True, chunk_size=4, init_fn=broken_init)
+    def init_broken(self, item: dict, *args, state=None, **kwargs) -> dict:
+        return item
+
+
+class InitTest(unittest.TestCase):
+    def setUp(self):
+        INIT_NUM.value = 0
+
+    def test_init(self):
+        flow = InitFlow(verbose=False, keep_order=True)
+        flow.main()
+        self.assertEqual([item["r"] for item in flow.items], [i * 3 for i in range(40)])
+        # state在worker进程中创建
+        self.assertTrue(all(item["pid"] == item["state_pid"] for item in flow.items))
+        self.assertTrue(
+            all(item["vocab"] == 1 and item["plain"] for item in flow.items)
+        )
+        self.assertEqual({item["serial_pid"] for item in flow.items}, {os.getpid()})
+        # 融合stage的2个worker各调用2个init_fn，单进程stage调用1次
+        self.assertEqual(INIT_NUM.value, 5)
+
+        flow.main(head_num=10)
+        self.assertEqual(INIT_NUM.value, 9)  # 单进程stage不重复初始化
+
+    def test_pool(self):
+        with InitFlow(verbose=False) as flow:
+            for _ in range(3):
+                flow.main()
+                self.assertEqual(len(flow.items), 40)
+        # 常驻进程只初始化一次
+        self.assertEqual(INIT_NUM.value, 5)
+
+    def test_async_batch(self):
+        flow = AsyncInitFlow(verbose=False, keep_order=True)
+        flow.main()
+        self.assertEqual(len(flow.items), 40)
+        self.assertEqual({item["work_i"] for item in flow.items} - {0, 1}, set())
+        self.assertEqual(INIT_NUM.value, 4)
+
+    def test_data_parallel(self):
+        def process_fn(item, *args, state=None, work_i=None, **kwargs):
+            return (item, state["work_i"], work_i)
+
+        with DataParallel(
+            item_iter_fn=lambda: range(20),
+            work_num=3,
+            process_fn=process_fn,
+            dummy=True,
+            init_fn=load_tokenizer,
+        ) as data_iter:
+            results = list(data_iter)
+        self.assertEqual(sorted(item for item, _, _ in results), list(range(20)))
+        self.assertTrue(all(state_i == work_i for _, state_i, work_i in results))
+        self.assertEqual(INIT_NUM.value, 3)
+
+    def test_init_error(self):
+        # init_fn失败时主进程抛出异常，不再以state=None执行
+        for flow_cls in (BrokenInitFlow, ThreadBrokenInitFlow):
+            with self.assertRaisesRegex(WorkerInitError, "model not found"):
+                flow_cls(verbose=False).main()
+
+        # 常驻进程池中每轮都抛出异常
+        with BrokenInitFlow(verbose=False) as flow:
+            for _ in range(2):
+                with self.assertRaises(WorkerInitError):
+                    flow.main()
+
+
+if __name__ == "__main__":
+    unittest.main()
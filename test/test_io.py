@@ -0,0 +1,339 @@
+import json
+import math
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import openpyxl
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from flowdata import (
+    ExcelTool,
+    FileTool,
+    FlowBase,
+    JsonlTool,
+    JsonTool,
+    ParquetTool,
+    add_task,
+)
+from flowdata._io import LineIndex
+from flowdata.codec import CODEC_NAMES, get_codec
+
+
+class LineIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "data.jsonl")
+        JsonlTool.write(
+            ({"id": i, "text": "文本" * (i % 7)} for i in range(5000)), self.file_path
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_build(self):
+        with mock.patch.object(LineIndex, "BLOCK_SIZE", 1000):  # 跨block边界
+            index = LineIndex.build(self.file_path, step=100)
+        self.assertEqual(index.line_num, 5000)
+        with open(self.file_path, "rb") as f:
+            for line_no in (0, 1, 99, 100, 101, 2345, 4999):
+                index.seek(f, line_no)
+                self.assertEqual(json.loads(f.readline())["id"], line_no)
+            index.seek(f, 6000)
+            self.assertEqual(f.readline(), b"")
+
+    def test_no_trailing_newline(self):
+        with open(self.file_path, "a", encoding="utf8") as f:
+            f.write('{"id": 5000}')
+        self.assertEqual(FileTool.line_num(self.file_path), 5001)
+
+    def test_read_iter(self):
+        items = list(JsonlTool.read_iter(self.file_path, offset=1234, head_num=10))
+        self.assertEqual([item["id"] for item in items], list(range(1234, 1244)))
+        self.assertTrue(os.path.exists(f"{self.file_path}.idx"))
+        self.assertEqual(len(FileTool.read_list(self.file_path, offset=4990)), 10)
+
+    def test_rebuild(self):
+        JsonlTool.read_list(self.file_path, offset=10)
+        time.sleep(0.01)
+        JsonlTool.write(({"id": -i} for i in range(3000)), self.file_path)
+        # 文件变化后索引失效并重建
+        self.assertEqual(FileTool.line_num(self.file_path), 3000)
+        item = next(JsonlTool.read_iter(self.file_path, offset=2999))
+        self.assertEqual(item["id"], -2999)
+
+
+class CodecTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "data.jsonl")
+        with open(self.file_path, "w", encoding="utf8") as f:
+            f.write('{"id": 0}\n{"id": 1\n文本\n{"id": 3, "text": "中文"}\n')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_codecs(self):
+        item = {"id": 1, "text": "中文", 2: [1.5, None, True]}
+        for codec_name in CODEC_NAMES:
+            try:
+                codec = get_codec(codec_name)
+            except ImportError:
+                continue
+            data = codec.dumps(item)
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(codec.loads(data), json.loads(json.dumps(item)))
+        self.assertRaises(ValueError, get_codec, "ujson")
+
+    def test_codec_fallback(self):
+        # 超过64位的整数、nan、inf与标准库json的读写结果一致
+        item = {"a": 123456789012345678901234567890, "b": -(2**63) - 1, "c": 2**64}
+        special = {"nan": float("nan"), "inf": [float("inf"), -float("inf")], "n": None}
+        for codec_name in CODEC_NAMES:
+            try:
+                codec = get_codec(codec_name)
+            except ImportError:
+                continue
+            self.assertEqual(codec.loads(codec.dumps(item)), item)
+            self.assertEqual(codec.dumps(special), json.dumps(special).encode())
+            self.assertEqual(codec.dumps(float("nan")), b"NaN")
+            loaded = codec.loads(b'{"a": NaN, "b": Infinity}')
+            self.assertTrue(math.isnan(loaded["a"]), codec_name)
+            self.assertEqual(loaded["b"], float("inf"))
+            with self.assertRaises(codec.errors):
+                codec.loads(b'{"a": 1')
+
+        # 标准库json写入的NaN不会作为纯文本返回
+        file_path = os.path.join(self.tmp_dir.name, "special.jsonl")
+        JsonlTool.write([item, special], file_path)
+        items = JsonlTool.read_list(file_path)
+        self.assertEqual(items[0], item)
+        self.assertTrue(math.isnan(items[1]["nan"]))
+        self.assertEqual(items[1]["inf"], special["inf"])
+
+    def test_on_error(self):
+        items = JsonlTool.read_list(self.file_path)
+        self.assertEqual(items[1:3], ['{"id": 1', "文本"])  # 默认作为纯文本返回
+
+        items = JsonlTool.read_list(self.file_path, on_error="skip")
+        self.assertEqual([item["id"] for item in items], [0, 3])
+
+        with self.assertRaises(ValueError):
+            JsonlTool.read_list(self.file_path, on_error="raise")
+
+        dead_letter_path = os.path.join(self.tmp_dir.name, "dead_letter.jsonl")
+        items = JsonlTool.read_list(
+            self.file_path,
+            offset=1,
+            on_error="dead_letter",
+            dead_letter_path=dead_letter_path,
+        )
+        self.assertEqual(items, [{"id": 3, "text": "中文"}])
+        dead_letters = JsonlTool.read_list(dead_letter_path)
+        self.assertEqual([item["line_no"] for item in dead_letters], [1, 2])
+        self.assertEqual(dead_letters[1]["line"], "文本")
+
+    def test_write(self):
+        items = [{"id": i, "text": "中文"} for i in range(2500)]
+        JsonlTool.write(items, self.file_path)
+        JsonlTool.write(items[:10], self.file_path, mode="a", buffering=0)
+        self.assertEqual(JsonlTool.read_list(self.file_path), items + items[:10])
+
+
+class CompressTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.items = [{"id": i, "text": "压缩" * (i % 5)} for i in range(3000)]
+        self.exts = ["gz", "bz2"]
+        try:
+            import zstandard
+        except ImportError:
+            pass
+        else:
+            self.exts.append("zst")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        for ext in self.exts:
+            file_path = os.path.join(self.tmp_dir.name, f"data.jsonl.{ext}")
+            with mock.patch.object(JsonlTool, "BLOCK_SIZE", 1000):
+                JsonlTool.write(self.items[:2000], file_path, compresslevel=1)
+                JsonlTool.write(self.items[2000:], file_path, mode="a")
+                self.assertEqual(JsonlTool.read_list(file_path), self.items)
+                # 提前结束读取时后台线程退出
+                items = JsonlTool.read_list(file_path, offset=1500, head_num=3)
+            self.assertEqual([item["id"] for item in items], [1500, 1501, 1502])
+            self.assertEqual(FileTool.line_num(file_path), 3000)
+
+    def test_shards(self):
+        file_paths = []
+        for i, ext in enumerate(self.exts):
+            file_path = os.path.join(self.tmp_dir.name, f"data_{i}.jsonl.{ext}")
+            JsonlTool.write(self.items[i * 1000 : (i + 1) * 1000], file_path)
+            file_paths.append(file_path)
+        reader = JsonlTool.read_shards(file_paths, shard_num=8, offset=500)
+        self.assertEqual(len(reader), len(self.exts))  # 压缩文件不拆分
+        self.assertEqual(list(reader), self.items[500 : len(self.exts) * 1000])
+
+
+class ExcelTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "data.xlsx")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        items = ({"id": i, "text": f"文本{i}", "score": None} for i in range(1000))
+        ExcelTool.write(items, self.file_path, key_map={"text": "内容"}, width=20)
+
+        items = list(ExcelTool.read_iter(self.file_path))
+        self.assertEqual(len(items), 1000)
+        self.assertEqual(items[1], {"id": 1, "内容": "文本1", "score": ""})
+        # 与pandas读取结果一致
+        df = pd.read_excel(self.file_path).fillna("")
+        self.assertEqual(items, df.to_dict("records"))
+
+        items = ExcelTool.read_list(self.file_path, fillna=False, todict=False)
+        self.assertEqual(items[1][:2], [1, "文本1"])
+        self.assertTrue(math.isnan(items[1][2]))
+
+        worksheet = openpyxl.load_workbook(self.file_path)["Sheet1"]
+        self.assertAlmostEqual(worksheet.column_dimensions["A"].width, 20, delta=1)
+
+    def test_columns(self):
+        ExcelTool.write([], self.file_path)
+        self.assertFalse(os.path.exists(self.file_path))
+
+        ExcelTool.write(
+            [{"a": 1, "b": [1, 2]}], self.file_path, columns=["b", "a", "a"]
+        )
+        self.assertEqual(
+            ExcelTool.read_list(self.file_path), [{"b": "[1, 2]", "a": 1, "a.1": 1}]
+        )
+
+
+@unittest.skipUnless(pyarrow, "需要安装pyarrow")
+class ParquetTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "data.parquet")
+        self.items = [
+            {"id": i, "text": f"文本{i}", "score": None if i % 3 else i * 0.5}
+            for i in range(1000)
+        ]
+        ParquetTool.write(iter(self.items), self.file_path, row_group_size=300)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        metadata = pyarrow.parquet.ParquetFile(self.file_path).metadata
+        self.assertEqual(metadata.num_row_groups, 4)
+        self.assertEqual(ParquetTool.num_rows(self.file_path), 1000)
+        self.assertEqual(
+            ParquetTool.read_list(self.file_path, batch_size=64), self.items
+        )
+
+        items = ParquetTool.read_list(self.file_path, columns=["text"])
+        self.assertEqual(items[5], {"text": "文本5"})
+
+    def test_offset(self):
+        items = ParquetTool.read_list(
+            self.file_path, offset=290, head_num=320, batch_size=100
+        )
+        self.assertEqual(items, self.items[290:610])
+        self.assertEqual(ParquetTool.read_list(self.file_path, offset=2000), [])
+
+    def test_filters(self):
+        with mock.patch.object(
+            pyarrow.parquet.ParquetFile,
+            "iter_batches",
+            autospec=True,
+            side_effect=pyarrow.parquet.ParquetFile.iter_batches,
+        ) as iter_batches:
+            items = ParquetTool.read_list(
+                self.file_path, columns=["text"], filters=[("id", ">=", 650)]
+            )
+        self.assertEqual(items, [{"text": f"文本{i}"} for i in range(650, 1000)])
+        # 根据统计信息跳过前两个row group
+        row_groups = [call.kwargs["row_groups"] for call in iter_batches.call_args_list]
+        self.assertEqual(row_groups, [[2], [3]])
+
+        items = ParquetTool.read_list(
+            self.file_path, filters=[("id", "in", [1, 3, 600]), ("score", "!=", 1)]
+        )
+        self.assertEqual([item["id"] for item in items], [3, 600])
+        with self.assertRaises(ValueError):
+            ParquetTool.read_list(self.file_path, filters=[("id", "~", 1)])
+
+    def test_schema(self):
+        schema = pyarrow.schema([("id", pyarrow.int32()), ("tag", pyarrow.string())])
+        ParquetTool.write(
+            ({"id": i, "extra": i} for i in range(5)), self.file_path, schema=schema
+        )
+        items = ParquetTool.read_list(self.file_path)
+        self.assertEqual(items[1], {"id": 1, "tag": None})
+
+        ParquetTool.write([], self.file_path, schema=schema)
+        self.assertEqual(ParquetTool.num_rows(self.file_path), 0)
+
+
+class PushdownFlow(FlowBase):
+    file_path = None
+
+    @add_task()
+    def pushdown_task(self, item: dict, *args, **kwargs) -> dict:
+        return item
+
+    def get_data(self, offset: int = 0, head_num: int = None):
+        self.read_args = (offset, head_num)
+        yield from JsonlTool.read_iter(self.file_path, offset, head_num)
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class PushdownTest(unittest.TestCase):
+    def test_pushdown(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            PushdownFlow.file_path = os.path.join(tmp_dir, "data.jsonl")
+            JsonlTool.write(({"id": i} for i in range(100)), PushdownFlow.file_path)
+
+            flow = PushdownFlow(verbose=False, keep_order=True)
+            flow.main(offset=20, head_num=30)
+        self.assertEqual(flow.read_args, (20, 30))
+        self.assertEqual([item["id"] for item in flow.items], list(range(20, 50)))
+
+    def test_pushdown_resume(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            PushdownFlow.file_path = os.path.join(tmp_dir, "data.jsonl")
+            JsonlTool.write(({"id": i} for i in range(100)), PushdownFlow.file_path)
+            checkpoint_path = os.path.join(tmp_dir, "checkpoint.json")
+            state = {"offset": 20, "watermark": 10, "done": [12], "sinks": {}}
+            JsonTool.write(state, checkpoint_path)
+
+            flow = PushdownFlow(
+                verbose=False, keep_order=True, checkpoint_path=checkpoint_path
+            )
+            flow.main(offset=20, head_num=30, resume=True)
+        # 水位线之前的item不再读取
+        self.assertEqual(flow.read_args, (30, 20))
+        self.assertEqual(
+            [item["id"] for item in flow.items],
+            [i for i in range(30, 50) if i != 32],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import asyncio
+import unittest
+from fractions import Fraction
+
+from flowdata import FlowBase, add_task
+from flowdata.checkpoint import Checkpoint
+from flowdata.reorder import ReorderBuffer, derive, filtered
+
+
+def texts():
+    for i in range(30):
+        yield {"doc": i, "text": " ".join(f"w{i}" + "x" * k for k in range(i % 4))}
+
+
+def split(item: dict) -> list:
+    """文档按空格切分为多个片段，空文档没有输出"""
+    return [{"doc": item["doc"], "word": word} for word in item["text"].split()]
+
+
+class KindFlow(FlowBase):
+    @add_task(work_num=2, kind="filter")
+    def kind_filter(self, item: dict, *args, **kwargs) -> bool:
+        return item["doc"] % 3 != 0
+
+    @add_task(work_num=2, kind="flat_map")
+    def kind_split(self, item: dict, *args, **kwargs):
+        yield from split(item)
+
+    @add_task(work_num=2, dummy=True, chunk_size=4)
+    def kind_upper(self, item: dict, *args, **kwargs) -> dict:
+        item["word"] = item["word"].upper()
+        return item
+
+    @add_task(work_num=2, dummy=True, chunk_size=4, kind="filter")
+    def kind_short(self, item: dict, *args, **kwargs) -> bool:
+        return len(item["word"]) < 5
+
+    def get_data(self):
+        yield from texts()
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class SerialKindFlow(FlowBase):
+    @add_task(kind="filter")
+    def serial_filter(self, item: dict, *args, **kwargs) -> bool:
+        return item["doc"] % 3 != 0
+
+    @add_task(kind="flat_map")
+    def serial_split(self, item: dict, *args, **kwargs) -> list:
+        return split(item)
+
+    @add_task()
+    def serial_upper(self, item: dict, *args, **kwargs) -> dict:
+        item["word"] = item["word"].upper()
+        return item
+
+    @add_task(kind="filter")
+    def serial_short(self, item: dict, *args, **kwargs) -> bool:
+        return len(item["word"]) < 5
+
+    get_data = KindFlow.get_data
+    save_data = KindFlow.save_data
+
+
+class AsyncKindFlow(FlowBase):
+    @add_task(mode="async", kind="filter")
+    async def async_filter(self, item: dict, *args, **kwargs) -> bool:
+        return item["doc"] % 3 != 0
+
+    @add_task(mode="async", kind="flat_map")
+    async def async_split(self, item: dict, *args, **kwargs) -> list:
+        await asyncio.sleep(0.001 * (item["doc"] % 5))
+        return split(item)
+
+    @add_task(mode="async")
+    async def async_upper(self, item: dict, *args, **kwargs) -> dict:
+        item["word"] = item["word"].upper()
+        return item
+
+    @add_task(mode="async", kind="filter")
+    async def async_short(self, item: dict, *args, **kwargs) -> bool:
+        return len(item["word"]) < 5
+
+    get_data = KindFlow.get_data
+    save_data = KindFlow.save_data
+
+
+class KindTest(unittest.TestCase):
+    # 文档filter + 空文档flat_map + 短词filter
+    words = [(item["doc"], word) for item in texts() for word in item["text"].split()]
+    expected = [(doc, word.upper()) for doc, word in words if doc % 3 and len(word) < 5]
+    filter_num = (
+        10
+        + sum(1 for item in texts() if item["doc"] % 3 and not item["text"])
+        + sum(1 for doc, word in words if doc % 3 and len(word) >= 5)
+    )
+
+    def output(self, flow) -> list:
+        return [(item["doc"], item["word"]) for item in flow.items]
+
+    def check(self, flow_cls):
+        flow = flow_cls(verbose=False, keep_order=True)
+        flow.main()
+        self.assertEqual(self.output(flow), self.expected)
+        self.assertEqual(flow.counter["error_num"], 0)
+        self.assertEqual(flow.counter["filter_num"], self.filter_num)
+
+        # 不保序时丢弃的item不再输出，只计入filter_num
+        flow = flow_cls(verbose=False)
+        flow.main()
+        self.assertEqual(sorted(self.output(flow)), self.expected)
+        self.assertEqual(flow.counter["total_num"], len(self.expected))
+
+    def test_parallel(self):
+        self.check(KindFlow)
+
+    def test_serial(self):
+        self.check(SerialKindFlow)
+
+    def test_async(self):
+        self.check(AsyncKindFlow)
+
+    def test_fuse(self):
+        stages = [stage.name for stage in SerialKindFlow().get_stages()]
+        # flat_map为stage的最后一个task
+        self.assertEqual(
+            stages, ["serial_filter+serial_split", "serial_upper+serial_short"]
+        )
+
+        with self.assertRaises(ValueError):
+            add_task(kind="reduce")
+        with self.assertRaises(ValueError):
+            add_task(batch_size=4, kind="filter")
+
+    def test_reorder(self):
+        buffer = ReorderBuffer(window=2)
+        children = derive({"__origin_id": 0}, [{"k": k} for k in range(3)])
+        grandchildren = derive(children[1], [{"k": 10}, {"k": 11}])
+        self.assertEqual(grandchildren[1]["__origin_id"], (0, 1, 1))
+        self.assertEqual(grandchildren[1]["__weight"], Fraction(1, 6))
+
+        self.assertEqual(buffer.push({"__origin_id": 1, "k": 100}), [])
+        self.assertEqual(buffer.push(children[2]), [])
+        self.assertEqual(buffer.push(grandchildren[1]), [])
+        self.assertEqual(buffer.push(filtered(grandchildren[0])), [])
+        # 同一根item的子item全部到达后按 __origin_id 输出
+        ready = buffer.push(children[0])
+        self.assertEqual([item.get("k") for item in ready], [0, None, 11, 2, 100])
+
+    def test_reorder_window(self):
+        # 未完成的子item计入窗口，超出时写入磁盘
+        buffer = ReorderBuffer(window=4)
+        pending = [
+            derive({"__origin_id": i}, [{"k": k} for k in range(3)]) for i in (1, 2)
+        ]
+        for children in pending:
+            for child in children[:2]:
+                self.assertEqual(buffer.push(child), [])
+        self.assertEqual(buffer.size, 4)
+        self.assertEqual(len(buffer.spilled), 0)
+        self.assertEqual(buffer.push(pending[1][2]), [])
+        self.assertLessEqual(buffer.size, 4)
+        self.assertEqual(buffer.push(pending[0][2]), [])
+        self.assertLessEqual(buffer.size, 4)
+        ready = buffer.push({"__origin_id": 0, "k": 0})
+        self.assertEqual(
+            [item["__origin_id"] for item in ready],
+            [0] + [child["__origin_id"] for children in pending for child in children],
+        )
+        self.assertEqual(buffer.size, 0)
+        self.assertEqual(buffer.spilled, {})
+
+    def test_checkpoint(self):
+        checkpoint = Checkpoint("/dev/null")
+        children = derive({"__origin_id": 0}, [{}, {}, {}])
+        for child in children[:2]:
+            checkpoint.mark(child["__origin_id"], child["__weight"])
+        self.assertEqual(checkpoint.watermark, 0)
+        checkpoint.mark(children[2]["__origin_id"], children[2]["__weight"])
+        self.assertEqual(checkpoint.watermark, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
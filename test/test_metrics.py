@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from flowdata import FlowBase, add_task
+from flowdata.metrics import FLUSH_INTERVAL, StageMetrics
+
+
+class MetricsFlow(FlowBase):
+    @add_task()
+    def metrics_prepare(self, item: dict, *args, **kwargs) -> dict:
+        return item
+
+    @add_task(work_num=2, chunk_size=4)
+    def metrics_task(self, item: dict, *args, **kwargs) -> dict:
+        time.sleep(0.002)
+        if item["id"] % 10 == 0:
+            return None  # 模拟执行失败
+        return item
+
+    def get_data(self):
+        for i in range(100):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class MetricsTest(unittest.TestCase):
+    def test_metrics(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "flow")
+            flow = MetricsFlow(verbose=False, metrics_path=path, metrics_interval=0.1)
+            flow.main()
+            self.assertEqual(len(flow.items), 90)
+
+            with open(f"{path}.json", encoding="utf-8") as f:
+                snap = json.load(f)
+            with open(f"{path}.prom", encoding="utf-8") as f:
+                prom = f.read()
+
+        prepare = snap["stages"]["metrics_prepare"]
+        self.assertEqual(prepare["total"]["items_out"], 100)
+        self.assertEqual(prepare["total"]["errors"], 0)
+
+        # 多进程的指标经共享内存汇总
+        stage = snap["stages"]["metrics_task"]
+        self.assertEqual(stage["total"]["items_in"], 100)
+        self.assertEqual(stage["total"]["items_out"], 100)
+        self.assertEqual(stage["total"]["errors"], 10)
+        self.assertEqual(stage["latency"]["count"], 100)
+        self.assertGreater(stage["total"]["busy"], 0.2)
+        self.assertEqual(
+            sum(worker["items_in"] for worker in stage["workers"].values()), 100
+        )
+
+        self.assertIn('flowdata_errors_total{stage="metrics_task"', prom)
+        self.assertIn('flowdata_latency_seconds_count{stage="metrics_task"} 100', prom)
+
+    def test_snapshot(self):
+        flow = MetricsFlow(verbose=False)
+        flow.main()
+        snap = flow.metrics_snapshot()
+        self.assertEqual(snap["stages"]["metrics_task"]["total"]["errors"], 10)
+
+    def test_local(self):
+        metrics = StageMetrics(2)
+        local = metrics.local(1)
+        now = time.time()
+        local.observe(0.002)
+        local.record(now, 1, 1, 0, 0.002, 0.01, 0)
+        # 未到FLUSH_INTERVAL时只在本地累计
+        self.assertEqual(metrics.total("items_in"), 0)
+
+        local.record(now + FLUSH_INTERVAL, 2, 1, 1, 0.004, 0, 0.01)
+        self.assertEqual(metrics.total("items_in"), 3)
+        self.assertEqual(metrics.total("errors"), 1)
+        self.assertEqual(metrics.worker(0)["items_in"], 0)
+        self.assertEqual(metrics.worker(1)["items_out"], 2)
+
+        local.add("retries")
+        local.flush()
+        self.assertEqual(metrics.total("retries"), 1)
+        self.assertEqual(metrics.total("items_in"), 3)
+        self.assertAlmostEqual(metrics.total("latency_sum"), 0.002)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import random
+import time
+import unittest
+
+from flowdata import FlowBase, add_task
+from flowdata.decorator import err_catch
+from flowdata.reorder import ReorderBuffer
+
+
+class OrderFlow(FlowBase):
+    @add_task(work_num=4, chunk_size=4)
+    @err_catch()
+    def order_task(self, item: dict, *args, **kwargs) -> dict:
+        time.sleep(random.random() * 0.01)
+        if item["id"] % 7 == 3:
+            raise Exception("ha")
+        return item
+
+    def get_data(self):
+        for i in range(200):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class WindowFlow(FlowBase):
+    @add_task(work_num=2, dummy=True)
+    def window_task(self, item: dict, *args, **kwargs) -> dict:
+        time.sleep(random.random() * 0.01)
+        return item
+
+    def get_data(self):
+        self.produced = 0
+        for i in range(100):
+            self.produced += 1
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items, self.max_inflight = [], 0
+        for item in item_iter:
+            self.items.append(item)
+            self.max_inflight = max(self.max_inflight, self.produced - len(self.items))
+
+
+class OrderTest(unittest.TestCase):
+    def test_reorder_spill(self):
+        buffer = ReorderBuffer(window=3)
+        ids = list(range(20))
+        random.shuffle(ids)
+        output = []
+        for i in ids:
+            output.extend(buffer.push({"__origin_id": i}))
+        output.extend(buffer.pop_all())
+        self.assertEqual([item["__origin_id"] for item in output], list(range(20)))
+
+    def test_keep_order(self):
+        flow = OrderFlow(verbose=False, keep_order=True)
+        flow.main()
+        expect = [i for i in range(200) if i % 7 != 3]
+        self.assertEqual([item["id"] for item in flow.items], expect)
+        self.assertEqual(flow.counter["error_num"], 200 - len(expect))
+
+    def test_order_window(self):
+        flow = WindowFlow(verbose=False, keep_order=True, order_window=8)
+        flow.main()
+        self.assertEqual([item["id"] for item in flow.items], list(range(100)))
+        self.assertLessEqual(flow.max_inflight, 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import unittest
+
+from flowdata import DataParallel, FlowBase, add_task
+
+
+class PoolFlow(FlowBase):
+    @add_task(work_num=2)
+    def pool_pid(self, item: dict, *args, **kwargs) -> dict:
+        item["pid"] = os.getpid()
+        return item
+
+    @add_task(work_num=2, dummy=True)
+    def pool_add(self, item: dict, *args, **kwargs) -> dict:
+        item["r"] = item["id"] + 1
+        return item
+
+    def get_data(self):
+        for i in range(30):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class PoolTest(unittest.TestCase):
+    def process_fn(self, item, *args, **kwargs):
+        return item * 2
+
+    def test_pool_reuse(self):
+        with PoolFlow(verbose=False) as flow:
+            pids = set()
+            for _ in range(3):
+                flow.main()
+                self.assertEqual(
+                    sorted(item["r"] for item in flow.items), list(range(1, 31))
+                )
+                pids |= {item["pid"] for item in flow.items}
+            flow.main(head_num=5)
+            self.assertEqual(len(flow.items), 5)
+
+        self.assertLessEqual(len(pids), 2)  # 多次main()复用同一批进程
+        self.assertEqual(flow.pools, {})
+
+    def test_imap_early_exit(self):
+        pool = DataParallel(None, work_num=2, process_fn=self.process_fn).start()
+        try:
+            for i in pool.imap(range(100)):
+                break  # 提前退出后，下一轮依然可用
+            self.assertEqual(sorted(pool.imap(range(10))), list(range(0, 20, 2)))
+        finally:
+            pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
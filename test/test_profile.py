@@ -0,0 +1,66 @@
+import os
+import pstats
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from flowdata import FlowBase, add_task
+from flowdata.profiler import PROFILE_DIR_ENV, PROFILE_ENV, get_mode
+
+
+def slow_step(item: dict) -> dict:
+    time.sleep(0.005)
+    return item
+
+
+class ProfileFlow(FlowBase):
+    @add_task(work_num=2)
+    def profile_task(self, item: dict, *args, **kwargs) -> dict:
+        return slow_step(item)
+
+    def get_data(self):
+        for i in range(60):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class ProfileTest(unittest.TestCase):
+    def run_flow(self, profile, ext):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with mock.patch.dict(os.environ, {PROFILE_DIR_ENV: tmp_dir}):
+                flow = ProfileFlow(verbose=False)
+                flow.main(profile=profile)
+            self.assertEqual(len(flow.items), 60)
+            # 中间文件合并后删除，每个stage一个文件
+            self.assertEqual(
+                sorted(os.listdir(tmp_dir)), [f"main.{ext}", f"profile_task.{ext}"]
+            )
+            path = os.path.join(tmp_dir, f"profile_task.{ext}")
+            if ext == "prof":
+                stats = pstats.Stats(path)
+                return {func[2] for func in stats.stats}
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+
+    def test_sample(self):
+        self.assertIn("slow_step", self.run_flow(True, "folded"))
+
+    def test_cprofile(self):
+        funcs = self.run_flow("cprofile", "prof")
+        self.assertIn("slow_step", funcs)
+        self.assertIn("put_chunks", funcs)  # 输入进程
+
+    def test_mode(self):
+        with mock.patch.dict(os.environ, {PROFILE_ENV: "cprofile"}):
+            self.assertEqual(get_mode(), "cprofile")
+            self.assertEqual(get_mode(False), None)
+        with mock.patch.dict(os.environ, {PROFILE_ENV: ""}):
+            self.assertEqual(get_mode(), None)
+        self.assertRaises(ValueError, get_mode, "perf")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import time
+import unittest
+
+from flowdata import DataParallel, FlowBase, RetryPolicy, add_task
+from flowdata.decorator import err_catch
+from flowdata.retry import Deferred, DelayQueue
+
+FAST = RetryPolicy(max_retries=2, backoff=0.01, jitter=0)
+
+
+def fail_times(flow, item: dict, name: str) -> int:
+    """item在当前进程中第几次执行name"""
+    attempts = flow.__dict__.setdefault("attempts", {})
+    key = (name, item["id"])
+    attempts[key] = attempts.get(key, 0) + 1
+    return attempts[key]
+
+
+class RetryFlow(FlowBase):
+    @add_task(work_num=2, chunk_size=4)
+    def retry_prepare(self, item: dict, *args, **kwargs) -> dict:
+        item["prepare"] = fail_times(self, item, "prepare")
+        return item
+
+    @add_task(work_num=2, chunk_size=4, retry=FAST)
+    def retry_task(self, item: dict, *args, **kwargs) -> dict:
+        num = fail_times(self, item, "task")
+        if item["id"] % 10 == 0 or (item["id"] % 3 == 0 and num == 1):
+            raise ConnectionError("backend unavailable")
+        item["num"] = num
+        return item
+
+    def get_data(self):
+        for i in range(60):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class SerialRetryFlow(RetryFlow):
+    @add_task(retry=FAST)
+    def retry_task(self, item: dict, *args, **kwargs) -> dict:
+        return RetryFlow.retry_task(self, item)
+
+
+class AsyncRetryFlow(RetryFlow):
+    @add_task(mode="async", concurrency=8, retry=FAST)
+    async def retry_task(self, item: dict, *args, **kwargs) -> dict:
+        return RetryFlow.retry_task(self, item)
+
+
+class CaughtRetryFlow(FlowBase):
+    @err_catch()
+    @add_task(retry=FAST)
+    def caught_task(self, item: dict, *args, **kwargs) -> dict:
+        raise ConnectionError("backend unavailable")
+
+
+class SlowRetryFlow(FlowBase):
+    @add_task(retry=RetryPolicy(max_retries=1, backoff=0.3, jitter=0))
+    def slow_task(self, item: dict, *args, **kwargs) -> dict:
+        if item["id"] == 0 and fail_times(self, item, "slow") == 1:
+            raise TimeoutError("timeout")
+        return item
+
+    @add_task(work_num=2, dummy=True)
+    def slow_next(self, item: dict, *args, **kwargs) -> dict:
+        return item
+
+    def get_data(self):
+        for i in range(20):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class RetryTest(unittest.TestCase):
+    expected = [i for i in range(60) if i % 10]
+
+    def check(self, flow):
+        self.assertEqual([item["id"] for item in flow.items], self.expected)
+        self.assertTrue(
+            all(item["num"] == (2 if item["id"] % 3 == 0 else 1) for item in flow.items)
+        )
+        self.assertEqual(flow.counter["error_num"], 6)
+        # id%3==0的item重试1次，id%10==0的item重试2次后放弃
+        self.assertEqual(flow.counter["retry_num"], 18 + 12)
+
+    def test_parallel(self):
+        flow = RetryFlow(verbose=False, keep_order=True)
+        flow.main()
+        self.check(flow)
+        # 重试从失败的task继续，融合的上游task只执行一次
+        self.assertTrue(all(item["prepare"] == 1 for item in flow.items))
+
+    def test_serial(self):
+        flow = SerialRetryFlow(verbose=False, keep_order=True)
+        flow.main()
+        self.check(flow)
+
+    def test_async(self):
+        flow = AsyncRetryFlow(verbose=False, keep_order=True)
+        flow.main()
+        self.check(flow)
+
+    def test_non_blocking(self):
+        # 等待重试期间worker继续处理后续item
+        flow = SlowRetryFlow(verbose=False)
+        start = time.time()
+        flow.main()
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(len(flow.items), 20)
+        self.assertEqual(flow.items[-1]["id"], 0)
+        self.assertEqual(flow.counter["retry_num"], 1)
+        self.assertEqual(
+            flow.metrics_snapshot()["stages"]["slow_task"]["total"]["retries"], 1
+        )
+
+    def test_deferred(self):
+        def process_fn(data, *args, **kwargs):
+            if data == 0:
+                raise Deferred(0.3, lambda: "retried")
+            return data
+
+        with DataParallel(lambda: range(20), 1, process_fn, dummy=True) as item_iter:
+            self.assertEqual(list(item_iter), list(range(1, 20)) + ["retried"])
+
+    def test_policy(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5, jitter=0.5)
+        for attempt, base in enumerate([1, 2, 4, 5, 5]):
+            delay = policy.delay(attempt)
+            self.assertTrue(base * 0.5 <= delay <= base * 1.5, (attempt, delay))
+
+        queue = DelayQueue()
+        queue.push(0.2, "b")
+        queue.push(0, "a")
+        self.assertEqual(queue.pop_due(), ["a"])
+        self.assertEqual(len(queue), 1)
+        self.assertGreater(queue.timeout(), 0)
+
+        with self.assertRaises(ValueError):
+            add_task(batch_size=4, retry=3)
+        for retry in (True, False, 0, -1, 1.5, RetryPolicy):
+            with self.assertRaises(ValueError, msg=retry):
+                add_task(retry=retry)
+        with self.assertRaises(ValueError):
+            RetryPolicy(max_retries=0)
+
+    def test_err_catch(self):
+        # err_catch捕获异常后retry不会触发，两种装饰顺序都报错
+        with self.assertRaisesRegex(ValueError, "err_catch"):
+            add_task(retry=FAST)(err_catch()(lambda self, item: item))
+        with self.assertRaisesRegex(ValueError, "err_catch"):
+            CaughtRetryFlow(verbose=False).main()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import time
+import unittest
+
+from flowdata import FlowBase, JsonlTool, add_task
+
+
+class ShardFlow(FlowBase):
+    file_paths = []
+
+    @add_task(work_num=2, chunk_size=8)
+    def shard_task(self, item: dict, *args, **kwargs) -> dict:
+        item["r"] = item["id"] * 2
+        return item
+
+    def get_data(self, offset: int = 0, head_num: int = None):
+        return JsonlTool.read_shards(self.file_paths, 3, offset, head_num)
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class SkipShardFlow(ShardFlow):
+    def get_data(self, offset: int = 0, head_num: int = None):
+        return JsonlTool.read_shards(
+            self.file_paths, 3, offset, head_num, on_error="skip"
+        )
+
+
+class SerialShardFlow(ShardFlow):
+    @add_task()
+    def serial_shard_task(self, item: dict, *args, **kwargs) -> dict:
+        return item
+
+
+class ShardTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # 两个文件按顺序拼接，全局行号 0-1499
+        ShardFlow.file_paths = []
+        for start, end in [(0, 1000), (1000, 1500)]:
+            file_path = os.path.join(self.tmp_dir.name, f"data_{start}.jsonl")
+            JsonlTool.write(({"id": i} for i in range(start, end)), file_path)
+            ShardFlow.file_paths.append(file_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_shards(self):
+        reader = JsonlTool.read_shards(
+            ShardFlow.file_paths, 3, offset=900, head_num=450
+        )
+        self.assertEqual(len(reader), 4)  # 分片不跨文件
+        items = [
+            (num, item["id"])
+            for i in range(len(reader))
+            for num, item in reader.iter_shard(i)
+        ]
+        self.assertEqual(items, [(i - 900, i) for i in range(900, 1350)])
+        self.assertEqual([item["id"] for item in reader], list(range(900, 1350)))
+
+    def test_keep_order(self):
+        flow = ShardFlow(verbose=False, keep_order=True)
+        flow.main(offset=100, head_num=1200)
+        self.assertEqual([item["id"] for item in flow.items], list(range(100, 1300)))
+        self.assertEqual(flow.counter["total_num"], 1200)
+
+    def test_small_window(self):
+        # 后面的分片占满窗口时不阻塞第一个分片，不依赖窗口的等待超时推进
+        for flow_cls in (ShardFlow, SerialShardFlow):
+            start = time.time()
+            flow = flow_cls(verbose=False, keep_order=True, order_window=100)
+            flow.main(offset=100)
+            self.assertEqual(
+                [item["id"] for item in flow.items], list(range(100, 1500))
+            )
+            self.assertLess(time.time() - start, 10, flow_cls)
+
+    def test_unordered(self):
+        flow = ShardFlow(verbose=False)
+        flow.main()
+        self.assertEqual(sorted(item["id"] for item in flow.items), list(range(1500)))
+
+    def test_bad_line(self):
+        # 无法解析的行跳过后序号不变，保序时不等待缺失的序号
+        with open(ShardFlow.file_paths[0], "r+b") as f:
+            lines = f.readlines()
+            lines[10] = b"not json\n"
+            lines[600] = b"\n"
+            f.seek(0)
+            f.writelines(lines)
+            f.truncate()
+        reader = JsonlTool.read_shards(ShardFlow.file_paths, 3, on_error="skip")
+        items = [
+            (num, item and item["id"])
+            for i in range(len(reader))
+            for num, item in reader.iter_shard(i)
+        ]
+        expected = [(i, None if i in (10, 600) else i) for i in range(1500)]
+        self.assertEqual(items, expected)
+
+        flow = SkipShardFlow(verbose=False, keep_order=True)
+        start = time.time()
+        flow.main()
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(
+            [item["id"] for item in flow.items],
+            [i for i in range(1500) if i not in (10, 600)],
+        )
+
+    def test_serial_stage(self):
+        flow = SerialShardFlow(verbose=False, keep_order=True)
+        flow.main(head_num=500)
+        self.assertEqual([item["id"] for item in flow.items], list(range(500)))
+
+
+if __name__ == "__main__":
+    unittest.main()
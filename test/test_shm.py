@@ -0,0 +1,64 @@
+import os
+import unittest
+
+import numpy as np
+
+from flowdata import DataParallel
+from flowdata._shm import dumps, loads
+
+
+class ShmTest(unittest.TestCase):
+    def item_iter_fn(self):
+        for i in range(20):
+            yield {"id": i, "bytes": bytes([i]) * 100000, "array": np.full(50000, i)}
+
+    def process_fn(self, item, *args, **kwargs):
+        item["sum"] = int(item["array"].sum())
+        item["array"] = item["array"] * 2
+        return item
+
+    def test_shm_transport(self):
+        shm_files = set(os.listdir("/dev/shm"))
+        with DataParallel(
+            item_iter_fn=self.item_iter_fn,
+            work_num=2,
+            process_fn=self.process_fn,
+            chunk_size=2,
+            shm_threshold=1024,
+        ) as data_iter:
+            items = sorted(data_iter, key=lambda item: item["id"])
+
+        self.assertEqual([item["id"] for item in items], list(range(20)))
+        for i, item in enumerate(items):
+            self.assertEqual(item["bytes"], bytes([i]) * 100000)
+            self.assertEqual(item["sum"], i * 50000)
+            self.assertTrue((item["array"] == i * 2).all())
+        # 共享内存在消费端读取后释放
+        self.assertEqual(set(os.listdir("/dev/shm")), shm_files)
+
+    def test_break(self):
+        # 提前退出时，queue中未被消费的共享内存在stage结束时删除
+        shm_files = set(os.listdir("/dev/shm"))
+        with DataParallel(
+            item_iter_fn=self.item_iter_fn,
+            work_num=2,
+            process_fn=self.process_fn,
+            shm_threshold=1024,
+        ) as data_iter:
+            next(data_iter)
+        self.assertEqual(set(os.listdir("/dev/shm")), shm_files)
+
+    def test_zero_copy(self):
+        # 数组直接引用共享内存映射，名称读取时已删除
+        payload = dumps({"array": np.arange(100000)}, 1024, "fdtest_")
+        shm_name = payload.handles[0][0]
+        self.assertIn(shm_name, os.listdir("/dev/shm"))
+        item = loads(payload)
+        self.assertNotIn(shm_name, os.listdir("/dev/shm"))
+        self.assertTrue((item["array"] == np.arange(100000)).all())
+        self.assertNotIsInstance(item["array"].base, bytearray)
+        item["array"][0] = 5  # 可写
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import signal
+import threading
+import time
+import unittest
+
+from flowdata import FlowBase, RetryPolicy, add_task
+
+HANG = threading.Event()  # 线程模式下卡住的item等待该事件
+CHUNK_HANG = threading.Event()
+
+
+class TimeoutFlow(FlowBase):
+    num = 30
+
+    @add_task(work_num=2, item_timeout=0.5)
+    def timeout_task(self, item: dict, *args, **kwargs) -> dict:
+        if item["id"] % 10 == 3:
+            time.sleep(100)
+        item["pid"] = os.getpid()
+        return item
+
+    def get_data(self):
+        for i in range(self.num):
+            yield {"id": i}
+
+    def save_data(self, item_iter):
+        self.items = list(item_iter)
+
+
+class BlockedFlow(TimeoutFlow):
+    num = 10
+
+    @add_task(item_timeout=0.3)
+    def timeout_task(self, item: dict, *args, **kwargs) -> dict:
+        if item["id"] == 3:
+            # 屏蔽SIGALRM，模拟卡在无法中断的C扩展中
+            signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+            time.sleep(100)
+        return item
+
+
+class ThreadTimeoutFlow(TimeoutFlow):
+    num = 10
+
+    @add_task(work_num=2, dummy=True, item_timeout=0.3)
+    def timeout_task(self, item: dict, *args, **kwargs) -> dict:
+        if item["id"] == 3:
+            HANG.wait()
+        return item
+
+
+class ChunkBlockedFlow(TimeoutFlow):
+    num = 20
+
+    @add_task(work_num=2, chunk_size=4, item_timeout=0.3)
+    def timeout_task(self, item: dict, *args, **kwargs) -> dict:
+        if item["id"] == 5:
+            signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+            time.sleep(100)
+        return item
+
+
+class ThreadChunkFlow(TimeoutFlow):
+    num = 20
+
+    @add_task(work_num=2, dummy=True, chunk_size=4, item_timeout=0.3)
+    def timeout_task(self, item: dict, *args, **kwargs) -> dict:
+        if item["id"] == 5:
+            CHUNK_HANG.wait()
+        return item
+
+
+class AsyncTimeoutFlow(TimeoutFlow):
+    @add_task(mode="async", item_timeout=0.3)
+    async def timeout_task(self, item: dict, *args, **kwargs) -> dict:
+        if item["id"] % 10 == 3:
+            await asyncio.sleep(100)
+        return item
+
+
+class RetryTimeoutFlow(TimeoutFlow):
+    num = 10
+
+    @add_task(work_num=2, item_timeout=0.3, retry=RetryPolicy(backoff=0.01, jitter=0))
+    def timeout_task(self, item: dict, *args, **kwargs) -> dict:
+        if item["id"] == 3:
+            # 前两次执行超时，重试在同一worker内进行
+            self.calls = getattr(self, "calls", 0) + 1
+            if self.calls < 3:
+                time.sleep(100)
+        return item
+
+
+class TimeoutTest(unittest.TestCase):
+    def run_flow(self, flow_cls, **kwargs):
+        flow = flow_cls(verbose=False, keep_order=True, **kwargs)
+        start = time.time()
+        flow.main()
+        self.assertLess(time.time() - start, 10)
+        return flow
+
+    def test_interrupt(self):
+        flow = self.run_flow(TimeoutFlow)
+        self.assertEqual(
+            [item["id"] for item in flow.items], [i for i in range(30) if i % 10 != 3]
+        )
+        self.assertEqual(flow.counter["timeout_num"], 3)
+        self.assertEqual(flow.counter["error_num"], 3)
+        # SIGALRM中断后worker继续执行，不需要替换
+        self.assertEqual(len({item["pid"] for item in flow.items}), 2)
+
+    def test_kill(self):
+        flow = self.run_flow(BlockedFlow)
+        self.assertEqual(
+            [item["id"] for item in flow.items], [0, 1, 2, 4, 5, 6, 7, 8, 9]
+        )
+        self.assertEqual(flow.counter["timeout_num"], 1)
+        self.assertEqual(flow.counter["error_num"], 1)
+
+    def test_kill_pool(self):
+        # 常驻进程池中被杀死的worker替换后，下一轮仍可使用
+        with BlockedFlow(verbose=False, keep_order=True) as flow:
+            flow.main()
+            flow.num = 3
+            flow.main()
+        self.assertEqual([item["id"] for item in flow.items], [0, 1, 2])
+        self.assertEqual(flow.counter["timeout_num"], 1)
+
+    def test_thread(self):
+        try:
+            flow = self.run_flow(ThreadTimeoutFlow)
+        finally:
+            HANG.set()
+        self.assertEqual(
+            [item["id"] for item in flow.items], [0, 1, 2, 4, 5, 6, 7, 8, 9]
+        )
+        self.assertEqual(flow.counter["timeout_num"], 1)
+
+    def test_chunk(self):
+        # 同一chunk中未执行的item交给新的worker，只有超时的item输出失败占位
+        expected = [i for i in range(20) if i != 5]
+        flow = self.run_flow(ChunkBlockedFlow)
+        self.assertEqual([item["id"] for item in flow.items], expected)
+        self.assertEqual(flow.counter["error_num"], 1)
+        self.assertEqual(flow.counter["total_num"], 20)
+
+        try:
+            flow = self.run_flow(ThreadChunkFlow)
+        finally:
+            CHUNK_HANG.set()
+        self.assertEqual([item["id"] for item in flow.items], expected)
+        self.assertEqual(flow.counter["error_num"], 1)
+        self.assertEqual(flow.counter["total_num"], 20)
+
+    def test_async(self):
+        flow = self.run_flow(AsyncTimeoutFlow)
+        self.assertEqual(len(flow.items), 27)
+        self.assertEqual(flow.counter["timeout_num"], 3)
+
+    def test_retry(self):
+        flow = self.run_flow(RetryTimeoutFlow)
+        self.assertEqual([item["id"] for item in flow.items], list(range(10)))
+        self.assertGreaterEqual(flow.counter["timeout_num"], 1)
+        self.assertEqual(flow.counter["timeout_num"], flow.counter["retry_num"])
+        self.assertEqual(flow.counter["error_num"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()